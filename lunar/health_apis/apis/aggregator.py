@@ -0,0 +1,186 @@
+# aggregator.py
+
+from asgiref.sync import sync_to_async
+from collections import deque
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import PRIMARY_SATELLITE, AltitudeModel
+from . import snapshots
+
+# cache keys for the shared aggregator snapshot and its version counter
+SNAPSHOT_KEY = 'altitude-aggregator'
+VERSION_KEY = 'altitude-aggregator-version'
+
+
+class RollingWindow:
+    """Running minimum, maximum and average of the altitudes within a time window.
+
+        Samples are kept in a ring buffer ordered by date, and the minimum and maximum
+        are tracked with monotonic deques, so pushing, evicting and reading are all O(1) amortized.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.samples = deque()
+        self.minimums = deque()
+        self.maximums = deque()
+        self.total = 0.0
+        self.sequence = 0
+
+    def push(self, date, altitude):
+        self.sequence += 1
+        self.samples.append((self.sequence, date, altitude))
+        self.total += altitude
+
+        # drop every candidate that can no longer be the minimum/maximum of the window
+        while (self.minimums and self.minimums[-1][1] >= altitude):
+            self.minimums.pop()
+        self.minimums.append((self.sequence, altitude))
+        while (self.maximums and self.maximums[-1][1] <= altitude):
+            self.maximums.pop()
+        self.maximums.append((self.sequence, altitude))
+
+    def evict(self, now):
+        cutoff = now - self.window
+        while (self.samples and self.samples[0][1] < cutoff):
+            sequence, date, altitude = self.samples.popleft()
+            self.total -= altitude
+            if (self.minimums[0][0] == sequence):
+                self.minimums.popleft()
+            if (self.maximums[0][0] == sequence):
+                self.maximums.popleft()
+
+        # start from a clean sum so floating point error does not build up forever
+        if (not self.samples):
+            self.total = 0.0
+
+    @property
+    def average(self):
+        """Average altitude of the window, None while it is empty."""
+        if (not self.samples):
+            return None
+        return self.total / len(self.samples)
+
+    def stats(self):
+        if (not self.samples):
+            return {'minimum': None, 'maximum': None, 'average': None}
+        return {
+            'minimum': self.minimums[0][1],
+            'maximum': self.maximums[0][1],
+            'average': self.average
+        }
+
+
+class Aggregator:
+    """A RollingWindow for every window in settings.ROLLING_WINDOWS.
+
+        The version ties a snapshot to the version counter in the cache,
+        a snapshot is only used while both versions match.
+    """
+
+    def __init__(self, windows, version=0):
+        self.windows = {window: RollingWindow(window) for window in windows}
+        self.last_date = None
+        self.version = version
+
+    def push(self, date, altitude, now):
+        """Adds a sample to every window.
+
+            Returns:
+                pushed: boolean, False if the sample is older than the newest sample and could not be added
+        """
+        if (self.last_date is not None and date < self.last_date):
+            return False
+
+        self.last_date = date
+        for rolling in self.windows.values():
+            rolling.push(date, altitude)
+            rolling.evict(now)
+        return True
+
+    def stats(self, window, now):
+        """Returns the minimum, maximum and average altitude of a configured window as a dict."""
+        rolling = self.windows[window]
+        rolling.evict(now)
+        return rolling.stats()
+
+
+def _bump_version():
+    return snapshots.bump_version(VERSION_KEY)
+
+
+def rebuild(now, version=0):
+    """Builds an aggregator from the AltitudeModel rows of the primary satellite within the longest configured window."""
+    aggregator = Aggregator(settings.ROLLING_WINDOWS, version)
+    start = now - max(settings.ROLLING_WINDOWS)
+    rows = AltitudeModel.objects.filter(satellite_id=PRIMARY_SATELLITE, date__gte=start).order_by(
+        'date').values_list('date', 'altitude')
+    for date, altitude in rows.iterator():
+        aggregator.push(date, altitude, now)
+    return aggregator
+
+
+def _current(values):
+    """Returns the snapshot from the cached values if it matches the version counter, or None."""
+    aggregator = values.get(SNAPSHOT_KEY)
+    if (aggregator is not None and aggregator.version == values.get(VERSION_KEY, 0)):
+        return aggregator
+    return None
+
+
+def get_aggregator(now):
+    """Returns the shared aggregator, rebuilding it from the database on a cold start.
+
+        A rebuilt aggregator is only published once the surrounding transaction commits,
+        so a snapshot never contains data that was rolled back.
+    """
+    values = cache.get_many([SNAPSHOT_KEY, VERSION_KEY])
+    aggregator = _current(values)
+    if (aggregator is not None):
+        return aggregator
+
+    aggregator = rebuild(now, values.get(VERSION_KEY, 0))
+    transaction.on_commit(lambda: cache.set(SNAPSHOT_KEY, aggregator, None))
+    return aggregator
+
+
+async def aget_snapshot():
+    """Returns the shared aggregator if a current snapshot is published, or None, without touching the database."""
+    # the cache backends have no native async api yet, aget_many would make one thread hop per key
+    # and queue behind the sync ORM calls in the shared thread
+    values = await sync_to_async(cache.get_many, thread_sensitive=False)([SNAPSHOT_KEY, VERSION_KEY])
+    return _current(values)
+
+
+def record_sample(date, altitude):
+    """Feeds a newly inserted sample into the shared aggregator once it is committed.
+
+        Every insert bumps the version. The snapshot is only updated in place when no other
+        writer got in between, otherwise it is left stale and the next reader rebuilds it.
+    """
+    record_samples([(date, altitude)])
+
+
+def record_samples(samples):
+    """Feeds newly inserted (date, altitude) samples, sorted by date, into the shared aggregator once they are committed.
+
+        Like record_sample, with one version bump for all of them. A sample older than the
+        newest one in the snapshot leaves it stale, so the next reader rebuilds it.
+    """
+    def publish():
+        aggregator = cache.get(SNAPSHOT_KEY)
+        version = _bump_version()
+        if (aggregator is None or aggregator.version != version - 1):
+            return
+        # the newest sample is the aggregator's notion of now, readers evict up to their own now
+        if (all(aggregator.push(date, altitude, date) for date, altitude in samples)):
+            aggregator.version = version
+            cache.set(SNAPSHOT_KEY, aggregator, None)
+
+    transaction.on_commit(publish)
+
+
+def invalidate():
+    """Forces the next reader to rebuild the aggregator, used after bulk changes to AltitudeModel."""
+    transaction.on_commit(_bump_version)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 class ApisConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apis'
+
+    def ready(self):
+        # connect the signal receivers
+        from . import signals
@@ -0,0 +1,147 @@
+# async_views.py
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
+from .models import PRIMARY_SATELLITE
+from .store import get_store
+from . import aggregator, clock, pubsub, snapshots, views
+
+import asyncio
+import json
+
+# headers the DRF views add to every response
+ALLOW = 'GET, OPTIONS'
+VARY = ['Accept']
+
+
+def _no_content():
+    response = HttpResponse(status=204)
+    # DRF sends an empty 204 without a content type
+    del response['Content-Type']
+    return response
+
+
+def _finalize(response):
+    response['Allow'] = ALLOW
+    patch_vary_headers(response, VARY)
+    return response
+
+
+async def _get_stats():
+    """Async version of views._get_stats.
+
+    The shared aggregator snapshot is read straight from the cache, settings.ALTITUDE_STORE
+    is only read for a window that is not in settings.ROLLING_WINDOWS, the database on a cold start.
+
+    Returns:
+        stats: A dict containing minimum, maximum, and average altitudes over past 5 minutes as floats. Values will be None if no data exists.
+    """
+    now = clock.now()
+    if (views.STATS_WINDOW not in settings.ROLLING_WINDOWS):
+        summary = await get_store().awindow_stats(PRIMARY_SATELLITE, now - views.STATS_WINDOW)
+        return summary.as_stats()
+
+    snapshot = await aggregator.aget_snapshot()
+    if (snapshot is None):
+        # rebuilding reads every altitude in the window, it stays on the sync ORM
+        snapshot = await sync_to_async(aggregator.get_aggregator)(now)
+    return snapshot.stats(views.STATS_WINDOW, now)
+
+
+@csrf_exempt
+async def get_stats(request):
+    """Async GET endpoint for /stats/, responds the same as views.get_stats without leaving the event loop.
+
+    Other methods, and requests for ?windows= or ?percentiles=, are handed to the DRF view
+    so OPTIONS and 405 responses stay identical.
+    """
+    if (request.method != 'GET' or 'windows' in request.GET or 'percentiles' in request.GET):
+        return await sync_to_async(views.get_stats)(request)
+    return _finalize(views._stats_response(request, await _get_stats()))
+
+
+@csrf_exempt
+async def get_health(request):
+    """Async GET endpoint for /health/, responds the same as views.get_health without leaving the event loop.
+
+    Other methods are handed to the DRF view so OPTIONS and 405 responses stay identical.
+    """
+    if (request.method != 'GET'):
+        return await sync_to_async(views.get_health)(request)
+    snapshot = await snapshots.aget_health()
+    if (snapshot.message is None):
+        return _finalize(_no_content())
+    return _finalize(views._health_response(request, snapshot))
+
+
+def _sse(event):
+    """Formats a health event as a server-sent event, the ETag without quotes is its id."""
+    lines = []
+    if (event['etag'] is not None):
+        lines.append('id: ' + event['etag'].strip('"'))
+    lines.append('event: health')
+    lines.append('data: ' + json.dumps({'message': event['message'], 'updated': event['updated']}))
+    return '\n'.join(lines) + '\n\n'
+
+
+@require_GET
+async def health_stream(request):
+    """GET endpoint for /health/stream/ that streams the health message as server-sent events.
+
+    The current message is sent first, unless the Last-Event-ID of a reconnecting client says it
+    already has it, then one event per change of HealthModel. A comment is sent every
+    settings.HEALTH_STREAM_HEARTBEAT seconds so proxies keep the connection open.
+    """
+    last_event_id = request.headers.get('Last-Event-ID')
+
+    async def events():
+        # subscribe before reading the snapshot, so no change falls in between
+        async with pubsub.get_pubsub().subscribe(pubsub.HEALTH_CHANNEL) as queue:
+            event = (await snapshots.aget_health()).as_event()
+            if (event['message'] is not None and event['etag'].strip('"') != last_event_id):
+                yield _sse(event)
+            while (True):
+                try:
+                    event = await asyncio.wait_for(queue.get(), settings.HEALTH_STREAM_HEARTBEAT)
+                except TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                # the subscription was lost, the client reconnects with its Last-Event-ID
+                if (event is None):
+                    return
+                yield _sse(event)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx would otherwise buffer the events
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_GET
+async def health_poll(request):
+    """GET endpoint for /health/poll/, a long-poll fallback of /health/stream/ that responds like /health/.
+
+    A client without the current message, going by its If-None-Match, gets it right away.
+    Otherwise the request is held until HealthModel changes or settings.HEALTH_POLL_TIMEOUT
+    seconds pass, and answered with the message, a 304 or a 204 without a message.
+    """
+    async with pubsub.get_pubsub().subscribe(pubsub.HEALTH_CHANNEL) as queue:
+        snapshot = await snapshots.aget_health()
+        if (snapshot.message is not None):
+            response = views._health_response(request, snapshot)
+            if (response.status_code != 304):
+                return response
+        try:
+            await asyncio.wait_for(queue.get(), settings.HEALTH_POLL_TIMEOUT)
+        except TimeoutError:
+            pass
+
+    snapshot = await snapshots.aget_health()
+    if (snapshot.message is None):
+        return _no_content()
+    return views._health_response(request, snapshot)
@@ -0,0 +1,193 @@
+# benchmarks.py
+
+from datetime import datetime, timedelta, timezone
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from .models import AltitudeModel
+from . import ingest, rollups, tasks, views
+
+import django
+import itertools
+import math
+import platform
+import random
+import time
+
+# seconds between two synthetic samples, the cadence of the satellite api
+CADENCE = 10
+# the synthetic orbit oscillates around a slowly decaying altitude
+ORBIT_PERIOD = 90 * 60
+ORBIT_AMPLITUDE = 12
+DECAY_PER_DAY = 0.3
+
+PERCENTILES = {'p50': 0.50, 'p95': 0.95, 'p99': 0.99}
+# /stats/ queries of the suite, by benchmark name
+STATS_QUERIES = {
+    'stats': '',
+    'stats_windows': '?windows=1h,24h,7d',
+    'stats_percentiles': '?percentiles=50,95,99',
+}
+
+# the benchmarks run in a transaction that is rolled back, so the snapshots they publish stay in a cache of their own
+BENCH_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmarks',
+    }
+}
+# the suite reads and writes the database only, the metrics stay in the process
+BENCH_SETTINGS = {
+    'ALTITUDE_STORE': {'BACKEND': 'apis.store.DatabaseStore'},
+    'ALTITUDE_WRITE_MODE': 'direct',
+    'CACHES': BENCH_CACHES,
+    'METRICS': {'BACKEND': 'apis.metrics.MemoryMetrics', 'PUSH_INTERVAL': None},
+}
+
+
+def orbit(end, rows, seed=0):
+    """Yields rows synthetic (date, altitude) samples every CADENCE seconds up to end, oldest first.
+
+        The altitude follows a decaying orbit with a little noise, so it crosses the low altitude
+        limit now and then like a real one.
+    """
+    rng = random.Random(seed)
+    first = end - timedelta(seconds=CADENCE * (rows - 1))
+    for index in range(rows):
+        seconds = index * CADENCE
+        altitude = (175 - DECAY_PER_DAY * seconds / 86400 + ORBIT_AMPLITUDE * math.sin(2 * math.pi * seconds / ORBIT_PERIOD)
+                    + rng.gauss(0, 0.5))
+        yield first + timedelta(seconds=seconds), altitude
+
+
+def seed(end, rows, chunk=50000):
+    """Stores rows synthetic samples of the primary satellite up to end, with their rollups and sketches."""
+    samples = orbit(end, rows)
+    while (batch := list(itertools.islice(samples, chunk))):
+        AltitudeModel.objects.bulk_insert(batch)
+        rollups.rebuild(batch[0][0], batch[-1][0])
+
+
+def run_commit_callbacks(pending):
+    """Runs the callbacks registered since pending for the commit of a transaction that is rolled back later.
+
+        They publish the cached aggregator and evaluator, without them every operation would rebuild both
+        from the database, unlike operations that commit. The notifications, registered as robust
+        callbacks, are left out.
+    """
+    callbacks = connection.run_on_commit[pending:]
+    del connection.run_on_commit[pending:]
+    for _, callback, robust in callbacks:
+        if (not robust):
+            callback()
+
+
+def invalidate_caches():
+    """Drops the snapshots published by run_commit_callbacks, which hold rolled back data, from BENCH_CACHES."""
+    cache.clear()
+
+
+def summarize(timings):
+    """Returns the latency percentiles in ms and the throughput in operations per second of timings in seconds."""
+    ordered = sorted(timings)
+    result = {name: ordered[max(math.ceil(q * len(ordered)) - 1, 0)] * 1000 for name, q in PERCENTILES.items()}
+    result['mean'] = sum(ordered) / len(ordered) * 1000
+    result['throughput'] = len(ordered) / sum(ordered)
+    result['operations'] = len(ordered)
+    return result
+
+
+def _time(operation, repeat, warmup=3):
+    for _ in range(warmup):
+        operation()
+        run_commit_callbacks(0)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        operation()
+        run_commit_callbacks(0)
+        timings.append(time.perf_counter() - started)
+    return summarize(timings)
+
+
+def _benchmarks(end, repeat):
+    """Times the hot paths on the seeded rows, returns the summary of every benchmark by name."""
+    factory = RequestFactory()
+    results = {}
+
+    # new samples, just after the seeded ones, with a fetch every CADENCE seconds like get_altitude
+    new_samples = iter(orbit(end + timedelta(seconds=CADENCE * (repeat + 3)), repeat + 3, seed=1))
+
+    def store_new():
+        date, altitude = next(new_samples)
+        with transaction.atomic():
+            ingest.store_sample(date, altitude)
+
+    # samples that are already stored, which get_altitude skips when the api has not updated yet
+    duplicates = iter(orbit(end, repeat + 3))
+
+    def store_duplicate():
+        date, altitude = next(duplicates)
+        with transaction.atomic():
+            ingest.store_sample(date, altitude)
+
+    results['ingest'] = _time(store_new, repeat)
+    results['ingest_duplicate'] = _time(store_duplicate, repeat)
+    results['check_altitude'] = _time(tasks.check_altitude, repeat)
+    for name, query in STATS_QUERIES.items():
+        request = factory.get('/stats/' + query)
+        results[name] = _time(lambda: views.get_stats(request), repeat)
+    return results
+
+
+def run(sizes, repeat):
+    """Seeds each number of rows in turn and times the hot paths on them, in a transaction that is rolled back.
+
+        Returns:
+            report: dict that can be written as JSON, with the environment and the results of every size
+    """
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'repeat': repeat,
+        'results': [],
+    }
+    with override_settings(**BENCH_SETTINGS):
+        for rows in sizes:
+            # the samples end a few minutes ago, so the new ones are just behind the current time
+            end = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(seconds=CADENCE * (repeat + 10))
+            try:
+                with transaction.atomic():
+                    started = time.perf_counter()
+                    seed(end, rows)
+                    seeded = time.perf_counter() - started
+                    benchmarks = _benchmarks(end, repeat)
+                    transaction.set_rollback(True)
+            finally:
+                invalidate_caches()
+            report['results'].append({'rows': rows, 'seed_seconds': seeded, 'benchmarks': benchmarks})
+    return report
+
+
+def compare(base, new, tolerance):
+    """Compares the latency percentiles of two reports, benchmark by benchmark at the same number of rows.
+
+        Returns:
+            comparison: list of (rows, benchmark, percentile, base ms, new ms, regressed) tuples,
+                regressed when the new latency is over the base one by more than tolerance
+    """
+    base_results = {(result['rows'], name): benchmark for result in base['results']
+                    for name, benchmark in result['benchmarks'].items()}
+    comparison = []
+    for result in new['results']:
+        for name, benchmark in result['benchmarks'].items():
+            previous = base_results.get((result['rows'], name))
+            if (previous is None):
+                continue
+            for percentile in PERCENTILES:
+                comparison.append((result['rows'], name, percentile, previous[percentile], benchmark[percentile],
+                                   benchmark[percentile] > previous[percentile] * (1 + tolerance)))
+    return comparison
@@ -0,0 +1,256 @@
+# buffer.py
+
+from collections import deque
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import InterfaceError, OperationalError, close_old_connections, transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from .models import Satellite
+from .metrics import Gauge, Histogram
+from . import ingest
+
+import atexit
+import json
+import logging
+import redis
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# cache keys of the flush counters, shared by every process that flushes
+METRICS_KEY = 'ingest-buffer-metrics:{}'
+# the counters are integers for cache.incr, the flush time is counted in microseconds
+COUNTERS = ['flushes', 'samples', 'created', 'flush_microseconds']
+# errors of a database that cannot be reached, a batch that fails with one of them is kept for the next flush
+UNAVAILABLE = (InterfaceError, OperationalError)
+
+
+class IngestBuffer:
+    """Holds fetched (satellite_id, date, altitude) samples until a flush stores them in batches, configured with settings.INGEST_BUFFER.
+
+        In the buffered write mode the ingest tasks push their samples here instead of committing
+        each one in its own transaction. The buffer is flushed once FLUSH_SIZE samples wait, every
+        FLUSH_INTERVAL seconds from a background thread of the pushing process, and by check_altitude
+        before it reads. A buffer holding MAX_SIZE samples is flushed by the pushing thread before it
+        takes more, so a stalled flusher slows the ingest down instead of dropping samples.
+    """
+
+    def __init__(self, params):
+        self.params = params
+        self.max_size = params.get('MAX_SIZE', 10000)
+        self.flush_size = params.get('FLUSH_SIZE', 1000)
+        self.flush_interval = params.get('FLUSH_INTERVAL', 0.5)
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._flusher = None
+
+    def append(self, samples):
+        """Adds samples at the end of the buffer, returns the number of samples it holds."""
+        raise NotImplementedError
+
+    def take(self, limit):
+        """Removes and returns up to limit of the oldest samples."""
+        raise NotImplementedError
+
+    def depth(self):
+        """Returns the number of samples waiting to be flushed."""
+        raise NotImplementedError
+
+    def push(self, samples):
+        """Buffers (satellite_id, date, altitude) samples, flushing when the buffer is full or holds FLUSH_SIZE samples."""
+        self._start()
+        if (self.depth() >= self.max_size):
+            self.flush()
+        if (self.append(samples) >= self.flush_size):
+            self.flush()
+
+    def flush(self):
+        """Stores every buffered sample, FLUSH_SIZE at a time, each batch in one transaction.
+
+            A batch that fails because the database cannot be reached goes back into the buffer for the
+            next flush. A batch that fails otherwise is stored sample by sample, and the samples that fail
+            on their own are logged and dropped, so one invalid sample does not hold back every flush.
+
+            Returns:
+                created: number of altitudes stored
+        """
+        created = 0
+        with self._flush_lock:
+            while (samples := self.take(self.flush_size)):
+                started = time.perf_counter()
+                try:
+                    with transaction.atomic():
+                        batch_created = _store(samples)
+                except UNAVAILABLE:
+                    self.append(samples)
+                    raise
+                except Exception:
+                    batch_created = self._store_each(samples)
+                elapsed = time.perf_counter() - started
+                _count(flushes=1, samples=len(samples), created=batch_created, flush_microseconds=round(elapsed * 1e6))
+                FLUSH_SECONDS.observe(elapsed)
+                created += batch_created
+        return created
+
+    def _store_each(self, samples):
+        """Stores the samples of a failed batch one at a time, dropping the samples that fail.
+
+            Returns:
+                created: number of altitudes stored
+        """
+        created = 0
+        for index, sample in enumerate(samples):
+            try:
+                with transaction.atomic():
+                    created += _store([sample])
+            except UNAVAILABLE:
+                self.append(samples[index:])
+                raise
+            except Exception:
+                logger.exception('Dropped a sample the ingest buffer could not store: %r', sample)
+        return created
+
+    def _start(self):
+        """Starts the thread that flushes every FLUSH_INTERVAL seconds, unless it runs already or is disabled."""
+        if (self.flush_interval is None or self._flusher is not None):
+            return
+        with self._start_lock:
+            if (self._flusher is None):
+                self._flusher = threading.Thread(target=self._run, name='ingest-buffer-flusher', daemon=True)
+                self._flusher.start()
+                # the daemon thread does not outlive the process, the samples still buffered are flushed on exit
+                atexit.register(self.flush)
+
+    def _run(self):
+        while (True):
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Could not flush the ingest buffer')
+            finally:
+                close_old_connections()
+
+
+class MemoryBuffer(IngestBuffer):
+    """Buffers the samples in the memory of the process, for tests and a single worker process.
+
+        Samples pushed by another process are not flushed by check_altitude, and a process that is
+        killed loses the samples it holds.
+    """
+
+    def __init__(self, params):
+        super().__init__(params)
+        self._samples = deque()
+        self._lock = threading.Lock()
+
+    def append(self, samples):
+        with self._lock:
+            self._samples.extend(samples)
+            return len(self._samples)
+
+    def take(self, limit):
+        with self._lock:
+            return [self._samples.popleft() for _ in range(min(limit, len(self._samples)))]
+
+    def depth(self):
+        return len(self._samples)
+
+
+class RedisBuffer(IngestBuffer):
+    """Buffers the samples in a redis list shared by every process, LOCATION is the url of the redis server.
+
+        Any process can flush the samples of all of them, a batch is taken off the list atomically
+        so concurrent flushers never store the same samples twice.
+    """
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.key = params.get('KEY', 'ingest-buffer')
+        self._client = redis.Redis.from_url(params['LOCATION'])
+
+    def append(self, samples):
+        return self._client.rpush(self.key, *[json.dumps([satellite_id, date.isoformat(), altitude])
+                                              for satellite_id, date, altitude in samples])
+
+    def take(self, limit):
+        with self._client.pipeline() as pipe:
+            pipe.lrange(self.key, 0, limit - 1)
+            pipe.ltrim(self.key, limit, -1)
+            items, trimmed = pipe.execute()
+        return [(satellite_id, datetime.fromisoformat(date), altitude)
+                for satellite_id, date, altitude in map(json.loads, items)]
+
+    def depth(self):
+        return self._client.llen(self.key)
+
+
+def _store(samples):
+    """Stores buffered samples per satellite, skipping the satellites deleted since they were fetched.
+
+        Returns:
+            created: number of altitudes stored
+    """
+    by_satellite = {}
+    for satellite_id, date, altitude in samples:
+        by_satellite.setdefault(satellite_id, []).append((date, altitude))
+    satellites = set(Satellite.objects.filter(id__in=list(by_satellite)).values_list('id', flat=True))
+    return sum(len(ingest.store_samples(sorted(satellite_samples), satellite_id))
+               for satellite_id, satellite_samples in by_satellite.items() if (satellite_id in satellites))
+
+
+def _count(**values):
+    for name, value in values.items():
+        key = METRICS_KEY.format(name)
+        cache.add(key, 0, None)
+        cache.incr(key, value)
+
+
+def metrics():
+    """Returns the depth of the buffer and the flush counters of every process.
+
+        Returns:
+            metrics: dict with the number of samples waiting, the number of flushes and of samples they
+                took and stored, and the average flush latency in seconds, None before the first flush
+    """
+    counters = cache.get_many([METRICS_KEY.format(name) for name in COUNTERS])
+    flushes, samples, created, microseconds = (counters.get(METRICS_KEY.format(name), 0) for name in COUNTERS)
+    return {
+        'depth': get_buffer().depth(),
+        'max_size': get_buffer().max_size,
+        'flushes': flushes,
+        'samples': samples,
+        'created': created,
+        'average_flush_seconds': microseconds / flushes / 1e6 if flushes else None,
+    }
+
+
+def buffered():
+    """Returns whether the ingest tasks buffer their samples, see settings.ALTITUDE_WRITE_MODE."""
+    return settings.ALTITUDE_WRITE_MODE == 'buffered'
+
+
+FLUSH_SECONDS = Histogram('ingest_buffer_flush_duration_seconds', 'Duration of the flushes of the ingest buffer.')
+DEPTH = Gauge('ingest_buffer_depth', 'Samples waiting in the ingest buffer.',
+              lambda: get_buffer().depth() if (buffered()) else 0)
+
+_buffer = None
+
+
+def get_buffer():
+    """Returns the IngestBuffer of settings.INGEST_BUFFER, shared by the whole process."""
+    global _buffer
+    if (_buffer is None):
+        _buffer = import_string(settings.INGEST_BUFFER['BACKEND'])(settings.INGEST_BUFFER)
+    return _buffer
+
+
+@receiver(setting_changed)
+def _reset_buffer(setting, **kwargs):
+    global _buffer
+    if (setting == 'INGEST_BUFFER'):
+        _buffer = None
@@ -0,0 +1,176 @@
+# client.py
+
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from . import metrics
+
+import logging
+import os
+import requests
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Stops calling an upstream that keeps failing.
+
+        After failure_threshold failures in a row the circuit opens and calls are refused
+        for reset_timeout seconds. Then a single trial call is let through, which closes
+        the circuit if it succeeds and opens it again if it fails.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        """Returns whether a call may be made now."""
+        with self._lock:
+            if (self.opened_at is None):
+                return True
+            if (self.trial or self.clock() - self.opened_at < self.reset_timeout):
+                return False
+            self.trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if (self.trial or self.failures >= self.failure_threshold):
+                if (self.opened_at is None):
+                    logger.warning('Opening the circuit after %d failures', self.failures)
+                self.opened_at = self.clock()
+                self.trial = False
+
+
+class SatelliteClient:
+    """HTTP client for the satellite api, one per worker process.
+
+        Connections are pooled in a requests.Session. Connection errors, read timeouts and
+        502/503/504 responses are retried a bounded number of times with jittered exponential
+        backoff, and a CircuitBreaker stops the calls while the api keeps failing. The ETag and
+        Last-Modified of the last response are sent back, so unchanged data costs a 304.
+    """
+
+    def __init__(self, url, connect_timeout, read_timeout, retries, backoff, backoff_jitter,
+                 failure_threshold, reset_timeout, clock=time.monotonic):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, clock)
+        self.etag = None
+        self.last_modified = None
+
+        self.retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                           status_forcelist=[502, 503, 504], allowed_methods=['GET'],
+                           backoff_factor=backoff, backoff_jitter=backoff_jitter, raise_on_status=False)
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(max_retries=self.retry, pool_connections=1, pool_maxsize=1))
+        self.session.mount('https://', HTTPAdapter(max_retries=self.retry, pool_connections=1, pool_maxsize=1))
+
+    @property
+    def max_seconds(self):
+        """The longest a fetch can take, when every try times out after connecting, with the longest backoffs.
+
+            urllib3 retries the first failure right away and backs off exponentially from the second one.
+        """
+        tries = self.retry.total + 1
+        backoffs = sum(min(self.retry.backoff_factor * 2 ** (errors - 1) + self.retry.backoff_jitter,
+                           self.retry.backoff_max) for errors in range(2, tries))
+        return tries * sum(self.timeout) + backoffs
+
+    def fetch(self):
+        """Fetches the latest satellite data.
+
+            Returns:
+                data: dict parsed from the JSON response, or None if the data did not change,
+                the api could not be reached or the circuit is open
+        """
+        if (not self.breaker.allow()):
+            metrics.UPSTREAM_FAILURES.inc(reason='circuit_open')
+            return None
+
+        headers = {}
+        if (self.etag is not None):
+            headers['If-None-Match'] = self.etag
+        if (self.last_modified is not None):
+            headers['If-Modified-Since'] = self.last_modified
+
+        started = time.perf_counter()
+        try:
+            response = self.session.get(self.url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as error:
+            logger.warning('Could not reach %s: %s', self.url, error)
+            self.breaker.record_failure()
+            metrics.UPSTREAM_FAILURES.inc(reason='unreachable')
+            return None
+        finally:
+            metrics.UPSTREAM_SECONDS.observe(time.perf_counter() - started)
+
+        # only errors of the api count as failures, a 4xx would not be fixed by waiting
+        if (response.status_code >= 500):
+            self.breaker.record_failure()
+            metrics.UPSTREAM_FAILURES.inc(reason='server_error')
+        else:
+            self.breaker.record_success()
+
+        # unchanged since the last response, there is nothing to parse
+        if (response.status_code == 304):
+            return None
+        if (not response.ok):
+            if (response.status_code < 500):
+                metrics.UPSTREAM_FAILURES.inc(reason='client_error')
+            return None
+
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+        try:
+            return response.json()
+        except ValueError:
+            metrics.UPSTREAM_FAILURES.inc(reason='invalid_json')
+            raise
+
+
+_clients = {}
+
+
+def get_client(url=None):
+    """Returns the SatelliteClient of this process for url, settings.SATELLITE_URL by default.
+
+        Clients are created with settings.SATELLITE_CLIENT, one per satellite api so every
+        satellite keeps its own connection, validators and circuit breaker.
+    """
+    url = url or settings.SATELLITE_URL
+    client = _clients.get(url)
+    if (client is None):
+        options = settings.SATELLITE_CLIENT
+        client = _clients.setdefault(url, SatelliteClient(
+            url, options['CONNECT_TIMEOUT'], options['READ_TIMEOUT'], options['RETRIES'],
+            options['BACKOFF'], options['BACKOFF_JITTER'], options['FAILURE_THRESHOLD'], options['RESET_TIMEOUT']))
+    return client
+
+
+def reset_client():
+    """Drops the clients of this process, the next get_client creates new ones."""
+    _clients.clear()
+
+
+# pooled connections must not be shared with the worker processes celery forks
+os.register_at_fork(after_in_child=reset_client)
@@ -0,0 +1,51 @@
+# clock.py
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+class SystemClock:
+    """The wall clock, in UTC."""
+
+    def now(self):
+        return datetime.now(timezone.utc)
+
+
+class SimulatedClock:
+    """A clock that only moves when it is set or advanced, used by tests and by `manage.py replay`."""
+
+    def __init__(self, now):
+        self._now = now
+
+    def now(self):
+        return self._now
+
+    def set(self, now):
+        self._now = now
+
+    def advance(self, delta):
+        self._now += delta
+
+
+# the clock of this process, every task and view reads the time through now()
+_clock = SystemClock()
+
+
+def now():
+    """Returns the current UTC datetime of the clock of this process."""
+    return _clock.now()
+
+
+def get_clock():
+    return _clock
+
+
+@contextmanager
+def use(clock):
+    """Makes clock the clock of this process until the block exits."""
+    global _clock
+    previous, _clock = _clock, clock
+    try:
+        yield clock
+    finally:
+        _clock = previous
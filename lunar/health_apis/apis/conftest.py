@@ -2,6 +2,7 @@
 from rest_framework.test import APIClient
 import pytest
 from datetime import timezone
+from .clock import SimulatedClock
 import datetime
 
 @pytest.fixture
@@ -12,3 +13,7 @@ class NewDate(datetime.datetime):
     @classmethod
     def now(cls, tz):
         return cls(2024, 4, 6, 1, 20, tzinfo=timezone.utc)
+
+
+# tests patch apis.clock._clock with it, so the tasks and views read NewDate.now() as the time
+FROZEN_CLOCK = SimulatedClock(NewDate.now(timezone.utc))
@@ -0,0 +1,48 @@
+# downsample.py
+
+
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets downsampling of a series.
+
+        The first and last points are always kept. Every other kept point is the one
+        in its bucket forming the largest triangle with the previously kept point and
+        the average of the next bucket, which keeps the visual shape of the series.
+
+        Args:
+            points: list of (x, y) tuples ordered by x
+            threshold: number of points to keep, at least 3
+
+        Returns:
+            sampled: list of at most threshold (x, y) tuples
+    """
+    count = len(points)
+    if (threshold >= count or threshold < 3):
+        return list(points)
+
+    sampled = [points[0]]
+    every = (count - 2) / (threshold - 2)
+    previous = 0
+    for i in range(threshold - 2):
+        # average of the next bucket, the last point when this is the final bucket
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, count)
+        next_points = points[next_start:next_end]
+        average_x = sum(x for x, y in next_points) / len(next_points)
+        average_y = sum(y for x, y in next_points) / len(next_points)
+
+        previous_x, previous_y = points[previous]
+        largest_area = -1
+        selected = None
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            x, y = points[j]
+            # twice the triangle area, the factor does not matter for comparing
+            area = abs((previous_x - average_x) * (y - previous_y) - (previous_x - x) * (average_y - previous_y))
+            if (area > largest_area):
+                largest_area = area
+                selected = j
+
+        sampled.append(points[selected])
+        previous = selected
+
+    sampled.append(points[-1])
+    return sampled
@@ -0,0 +1,73 @@
+# export.py
+
+from rest_framework.renderers import BaseRenderer
+import json
+import zlib
+
+# rows serialized per chunk of the streamed response
+ROWS_PER_CHUNK = 1000
+
+
+class ExportRenderer(BaseRenderer):
+    """Renderer used for content negotiation of the export formats, the export streams its own content.
+
+        It only renders the error responses DRF creates itself, such as 406 Not Acceptable.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (isinstance(data, dict) and 'detail' in data):
+            data = data['detail']
+        return f'{data}\n'.encode()
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONRenderer(ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+def _csv_line(date, altitude):
+    return f'{altitude!r},{date.isoformat()}\n'
+
+
+def _ndjson_line(date, altitude):
+    return json.dumps({'altitude': altitude, 'last_updated': date.isoformat()}) + '\n'
+
+
+def serialize(rows, format):
+    """Generator that serializes (date, altitude) rows, in the same fields the satellite api uses.
+
+        Rows are joined into chunks of ROWS_PER_CHUNK lines so the response is not written one row at a time.
+
+        Yields:
+            chunk: bytes of the next lines
+    """
+    if (format == CSVRenderer.format):
+        line = _csv_line
+        yield b'altitude,last_updated\n'
+    else:
+        line = _ndjson_line
+
+    lines = []
+    for date, altitude in rows:
+        lines.append(line(date, altitude))
+        if (len(lines) == ROWS_PER_CHUNK):
+            yield ''.join(lines).encode()
+            lines = []
+    if (lines):
+        yield ''.join(lines).encode()
+
+
+def gzip(chunks):
+    """Generator that gzip compresses a stream of chunks as they are produced."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if (compressed):
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,154 @@
+# forecast.py
+
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import math
+
+# times are fitted in minutes since the origin of the fit, which keeps the powers of t small
+UNIT = timedelta(minutes=1)
+UNIT_SECONDS = UNIT.total_seconds()
+
+
+def _solve(matrix, vector):
+    """Solves matrix · x = vector by Gaussian elimination with partial pivoting.
+
+        Returns:
+            x: list of floats, None when the matrix is singular
+    """
+    size = len(vector)
+    rows = [list(row) + [value] for row, value in zip(matrix, vector)]
+    tolerance = 1e-10 * max(abs(value) for row in matrix for value in row)
+    for column in range(size):
+        pivot = max(range(column, size), key=lambda row: abs(rows[row][column]))
+        if (abs(rows[pivot][column]) <= tolerance):
+            return None
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        for row in range(column + 1, size):
+            factor = rows[row][column] / rows[column][column]
+            for index in range(column, size + 1):
+                rows[row][index] -= factor * rows[column][index]
+
+    solution = [0.0] * size
+    for row in reversed(range(size)):
+        known = sum(rows[row][index] * solution[index] for index in range(row + 1, size))
+        solution[row] = (rows[row][size] - known) / rows[row][row]
+    return solution
+
+
+@dataclass(frozen=True)
+class Trend:
+    """A polynomial fitted to the altitudes, coefficients are in km and minutes since origin, constant term first."""
+    coefficients: tuple
+    origin: datetime
+
+    def _minutes(self, date):
+        return (date - self.origin) / UNIT
+
+    def altitude(self, date):
+        minutes = self._minutes(date)
+        return sum(coefficient * minutes ** power for power, coefficient in enumerate(self.coefficients))
+
+    def slope(self, date):
+        """Returns the rate of change of the altitude at date in km per second."""
+        minutes = self._minutes(date)
+        per_minute = sum(power * coefficient * minutes ** (power - 1)
+                         for power, coefficient in enumerate(self.coefficients) if (power > 0))
+        return per_minute / UNIT.total_seconds()
+
+    def crossing(self, after, threshold):
+        """Returns the first date from after on at which the trend is under threshold, None if it never gets there."""
+        if (self.altitude(after) < threshold):
+            return after
+
+        start = self._minutes(after)
+        a, b, c = (tuple(self.coefficients) + (0.0, 0.0))[:3]
+        a -= threshold
+        if (abs(c) < 1e-12):
+            roots = [-a / b] if (b != 0) else []
+        else:
+            discriminant = b * b - 4 * a * c
+            if (discriminant < 0):
+                return None
+            # the stable form of the quadratic formula, without subtracting close values
+            q = -0.5 * (b + math.copysign(math.sqrt(discriminant), b))
+            roots = [q / c] + ([a / q] if (q != 0) else [])
+
+        roots = [root for root in roots if (root > start)]
+        if (not roots):
+            return None
+        try:
+            return self.origin + min(roots) * UNIT
+        except OverflowError:
+            return None
+
+
+class TrendFit:
+    """Least squares linear and quadratic fits of the altitudes within a lookback, updated in O(1) per sample.
+
+        The normal equations of both fits only need the power sums Σtᵏ for k up to 4 and Σtᵏ·y for k
+        up to 2, so a sample is added or evicted by updating those sums instead of refitting all samples.
+        t is measured from an origin that is moved to the newest sample once that is a lookback away,
+        when the sums are computed again, so t stays small and rounding errors of evictions do not build up.
+        Samples are kept as (timestamp, altitude) floats, which a cached evaluator pickles many times faster
+        than datetimes.
+    """
+
+    def __init__(self, lookback):
+        self.lookback = lookback
+        self.samples = deque()
+        self.origin = None
+        self.origin_timestamp = None
+        self.powers = [0.0] * 5
+        self.moments = [0.0] * 3
+
+    def _add(self, timestamp, altitude, sign):
+        # unrolled, this runs for every sample pushed and evicted
+        t = (timestamp - self.origin_timestamp) / UNIT_SECONDS
+        t2 = t * t
+        powers, moments = self.powers, self.moments
+        powers[0] += sign
+        powers[1] += sign * t
+        powers[2] += sign * t2
+        powers[3] += sign * t2 * t
+        powers[4] += sign * t2 * t2
+        moments[0] += sign * altitude
+        moments[1] += sign * t * altitude
+        moments[2] += sign * t2 * altitude
+
+    def _rebase(self, origin):
+        self.origin = origin
+        self.origin_timestamp = origin.timestamp()
+        self.powers = [0.0] * 5
+        self.moments = [0.0] * 3
+        for timestamp, altitude in self.samples:
+            self._add(timestamp, altitude, 1)
+
+    def push(self, date, altitude):
+        """Adds a sample, which must not be older than the newest one."""
+        if (self.origin is None or date - self.origin > self.lookback):
+            self._rebase(date)
+        timestamp = date.timestamp()
+        self.samples.append((timestamp, altitude))
+        self._add(timestamp, altitude, 1)
+
+    def evict(self, now):
+        cutoff = (now - self.lookback).timestamp()
+        while (self.samples and self.samples[0][0] < cutoff):
+            timestamp, altitude = self.samples.popleft()
+            self._add(timestamp, altitude, -1)
+        if (not self.samples):
+            self.origin = self.origin_timestamp = None
+            self.powers = [0.0] * 5
+            self.moments = [0.0] * 3
+
+    def fit(self, degree):
+        """Returns the Trend of the given degree, None with fewer samples than coefficients or all at the same time."""
+        if (len(self.samples) <= degree):
+            return None
+        matrix = [[self.powers[row + column] for column in range(degree + 1)] for row in range(degree + 1)]
+        coefficients = _solve(matrix, self.moments[:degree + 1])
+        if (coefficients is None):
+            return None
+        return Trend(tuple(coefficients), self.origin)
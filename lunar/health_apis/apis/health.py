@@ -0,0 +1,201 @@
+# health.py
+
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .aggregator import RollingWindow
+from .forecast import TrendFit
+from .models import PRIMARY_SATELLITE, AltitudeModel, HealthMessage, HealthModel
+from . import snapshots
+
+# under 160 km we consider the altitude to be low
+LOW_ALTITUDE = 160
+# the health is decided by the average altitude within this window
+WINDOW = timedelta(minutes=1)
+
+# cache keys for the shared evaluator of a satellite and its version counter
+EVALUATOR_KEY = 'health-evaluator:{}'
+VERSION_KEY = 'health-evaluator-version:{}'
+
+
+def transition(low_altitude, message, average, resumed=True):
+    """The WARNING/SUSTAINED/OKAY state machine.
+
+        Args:
+            low_altitude: boolean, whether the altitude was low at the previous evaluation
+            message: the current health message
+            average: average altitude of the window being evaluated
+            resumed: boolean, whether the current message has been shown for a whole window,
+                the sustained message only makes way for the okay message after that
+
+        Returns:
+            health: tuple of the new low_altitude and message
+    """
+    if (average < LOW_ALTITUDE):
+        # if it was low before, no need to update
+        if (low_altitude):
+            return low_altitude, message
+        return True, HealthMessage.WARNING.value
+
+    # previous evaluation had low altitude, we have a special message that is sent
+    if (low_altitude):
+        return False, HealthMessage.SUSTAINED.value
+
+    if (message == HealthMessage.SUSTAINED.value and resumed):
+        return False, HealthMessage.OKAY.value
+    return low_altitude, message
+
+
+class HealthEvaluator:
+    """Evaluates the health after every sample, from a running average of the samples within WINDOW.
+
+        since is the date of the sample that set the current message, None if it is not known. Messages are
+        timed by sample dates, so a batch of samples moves through them like the samples would one by one.
+        The samples within settings.HEALTH_FORECAST['LOOKBACK'] are fitted along the way for forecast().
+        The version ties a snapshot to the version counter in the cache, like the aggregator's.
+    """
+
+    def __init__(self, low_altitude=False, message=HealthMessage.OKAY.value, since=None, version=0):
+        self.rolling = RollingWindow(WINDOW)
+        self.trend = TrendFit(settings.HEALTH_FORECAST['LOOKBACK'])
+        self.low_altitude = low_altitude
+        self.message = message
+        self.since = since
+        self.version = version
+
+    def push(self, date, altitude):
+        """Adds a sample and evaluates the window ending at it.
+
+            Samples older than the newest sample are not evaluated, check_altitude catches up with them.
+
+            Returns:
+                changed: boolean, whether the health changed
+        """
+        if (self.rolling.samples and date < self.rolling.samples[-1][1]):
+            return False
+        self.rolling.push(date, altitude)
+        self.rolling.evict(date)
+        self.trend.push(date, altitude)
+        self.trend.evict(date)
+
+        resumed = self.since is None or date - self.since >= WINDOW
+        health = transition(self.low_altitude, self.message, self.rolling.average, resumed)
+        if (health == (self.low_altitude, self.message)):
+            return False
+        self.low_altitude, self.message = health
+        self.since = date
+        return True
+
+
+def rebuild(satellite_id, before, version=0):
+    """Builds the evaluator of a satellite from its stored health and its AltitudeModel rows before a date."""
+    health = HealthModel.objects.filter(satellite_id=satellite_id).first()
+    if (health is None):
+        evaluator = HealthEvaluator(version=version)
+    else:
+        # a message check_altitude set is timed from when it was saved
+        evaluator = HealthEvaluator(health.low_altitude, health.message, health.since or health.updated, version)
+
+    start = before - max(WINDOW, evaluator.trend.lookback)
+    rows = AltitudeModel.objects.filter(satellite_id=satellite_id, date__gte=start, date__lt=before).order_by(
+        'date').values_list('date', 'altitude')
+    # the stored health already accounts for these samples, they only fill the window and the trend
+    for date, altitude in rows:
+        if (date >= before - WINDOW):
+            evaluator.rolling.push(date, altitude)
+        evaluator.trend.push(date, altitude)
+    evaluator.trend.evict(before)
+    return evaluator
+
+
+def record_sample(date, altitude, satellite_id=PRIMARY_SATELLITE):
+    """Evaluates the health of a satellite with its newly inserted sample, must run in the transaction of the insert.
+
+        A change is saved to HealthModel in the same transaction. The evaluator is published
+        once it commits, unless another writer got in between, then the next sample rebuilds it.
+    """
+    record_samples([(date, altitude)], satellite_id)
+
+
+def record_samples(samples, satellite_id=PRIMARY_SATELLITE):
+    """Evaluates the health of a satellite after each of its newly inserted (date, altitude) samples, sorted by date.
+
+        Like record_sample, the health is saved at most once, with the state after the last sample.
+    """
+    evaluator_key, version_key = EVALUATOR_KEY.format(satellite_id), VERSION_KEY.format(satellite_id)
+    values = cache.get_many([evaluator_key, version_key])
+    evaluator = values.get(evaluator_key)
+    if (evaluator is None or evaluator.version != values.get(version_key, 0)):
+        evaluator = rebuild(satellite_id, samples[0][0], values.get(version_key, 0))
+
+    changed = False
+    for date, altitude in samples:
+        changed = evaluator.push(date, altitude) or changed
+    if (changed):
+        health = HealthModel.objects.filter(satellite_id=satellite_id).first() or HealthModel(satellite_id=satellite_id)
+        health.low_altitude = evaluator.low_altitude
+        health.message = evaluator.message
+        health.since = evaluator.since
+        # the save invalidates the evaluator like any other HealthModel change, so the next
+        # sample rebuilds it, which only happens when the health changes
+        health.save()
+
+    def publish():
+        version = snapshots.bump_version(version_key)
+        if (evaluator.version == version - 1):
+            evaluator.version = version
+            cache.set(evaluator_key, evaluator, None)
+
+    transaction.on_commit(publish)
+
+
+def invalidate(satellite_id=PRIMARY_SATELLITE):
+    """Forces the next sample of a satellite to rebuild its evaluator, used when its HealthModel changes."""
+    transaction.on_commit(lambda: snapshots.bump_version(VERSION_KEY.format(satellite_id)))
+
+
+def _trend(trend, now):
+    if (trend is None):
+        return None
+    crossing = trend.crossing(now, LOW_ALTITUDE)
+    return {
+        'altitude': trend.altitude(now),
+        'slope': trend.slope(now),
+        'crosses_at': crossing.isoformat() if crossing else None,
+        'time_to_threshold': (crossing - now).total_seconds() if crossing else None,
+    }
+
+
+def forecast(now, satellite_id=PRIMARY_SATELLITE):
+    """Fits the recent altitudes of a satellite and predicts when they drop under LOW_ALTITUDE.
+
+        The fits of the shared evaluator are used while it is current, otherwise it is rebuilt
+        from the database. An early warning is raised while the altitude is not low yet but the
+        fit of settings.HEALTH_FORECAST['MODEL'] drops under LOW_ALTITUDE within HORIZON.
+
+        Returns:
+            forecast: dict with the linear and quadratic fits at now, None without MIN_SAMPLES
+                samples within the lookback, and the level: okay, early_warning or low
+    """
+    options = settings.HEALTH_FORECAST
+    evaluator_key, version_key = EVALUATOR_KEY.format(satellite_id), VERSION_KEY.format(satellite_id)
+    values = cache.get_many([evaluator_key, version_key])
+    evaluator = values.get(evaluator_key)
+    if (evaluator is None or evaluator.version != values.get(version_key, 0)):
+        evaluator = rebuild(satellite_id, now)
+    evaluator.trend.evict(now)
+
+    enough = len(evaluator.trend.samples) >= options['MIN_SAMPLES']
+    trends = {
+        'linear': _trend(evaluator.trend.fit(1) if enough else None, now),
+        'quadratic': _trend(evaluator.trend.fit(2) if enough else None, now),
+    }
+    model = trends[options['MODEL']]
+    level = 'okay'
+    if (evaluator.low_altitude):
+        level = 'low'
+    elif (model is not None and model['time_to_threshold'] is not None
+          and model['time_to_threshold'] <= options['HORIZON'].total_seconds()):
+        level = 'early_warning'
+    return dict(trends, samples=len(evaluator.trend.samples), threshold=LOW_ALTITUDE, level=level)
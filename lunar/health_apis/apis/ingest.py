@@ -0,0 +1,83 @@
+# ingest.py
+
+from .models import PRIMARY_SATELLITE, AltitudeModel
+from .store import get_store
+from . import aggregator, clock, health, metrics, rollups
+
+
+def record_sample(date, altitude):
+    """Updates the data derived from a new sample of the primary satellite, must run in the transaction of the insert."""
+    rollups.record_sample(date, altitude)
+    aggregator.record_sample(date, altitude)
+
+
+def _record_ingested(dates, received):
+    """Counts the created and duplicate samples of live ingest, and how long after their date they were stored."""
+    now = clock.now()
+    metrics.INGEST_LAG_SECONDS.observe_many([(now - date).total_seconds() for date in dates])
+    metrics.INGEST_SAMPLES.inc(len(dates), result='created')
+    if (received > len(dates)):
+        metrics.INGEST_SAMPLES.inc(received - len(dates), result='duplicate')
+
+
+def store_sample(date, altitude, satellite_id=PRIMARY_SATELLITE):
+    """Stores a sample unless the satellite has one with the same date, must run in a transaction.
+
+        The health is evaluated with every new sample, so a change shows within one sample.
+        Samples stored another way are left to the check_altitude reconciliation.
+
+        Returns:
+            created: boolean
+    """
+    if (not AltitudeModel.objects.insert(date, altitude, satellite_id)):
+        metrics.INGEST_SAMPLES.inc(result='duplicate')
+        return False
+    _record_ingested([date], 1)
+    get_store().record_sample(satellite_id, date, altitude)
+    if (satellite_id == PRIMARY_SATELLITE):
+        record_sample(date, altitude)
+    health.record_sample(date, altitude, satellite_id)
+    return True
+
+
+def insert_samples(samples, satellite_id=PRIMARY_SATELLITE):
+    """Inserts a batch of (date, altitude) samples of a satellite, skipping dates that already exist, must run in a transaction.
+
+        Existing dates are looked up first so the rollups only count the new samples, the insert
+        itself also ignores them in case another writer stored them meanwhile. The first sample
+        wins when a batch repeats a date. The rolling aggregator and the health are left to the caller.
+
+        Returns:
+            created: list of the inserted (date, altitude) samples, sorted by date
+    """
+    unique = {}
+    for date, altitude in samples:
+        unique.setdefault(date, altitude)
+    if (not unique):
+        return []
+
+    existing = set(AltitudeModel.objects.filter(
+        satellite_id=satellite_id, date__gte=min(unique), date__lte=max(unique)).values_list('date', flat=True))
+    created = sorted((date, altitude) for date, altitude in unique.items() if (date not in existing))
+    AltitudeModel.objects.bulk_insert(created, satellite_id)
+    # bulk inserts send no post_save, so the rollups and the store are updated here
+    if (satellite_id == PRIMARY_SATELLITE):
+        rollups.record_samples(created)
+    get_store().record_samples(satellite_id, created)
+    return created
+
+
+def store_samples(samples, satellite_id=PRIMARY_SATELLITE):
+    """Stores a batch of live (date, altitude) samples like store_sample does for one, must run in a transaction.
+
+        Returns:
+            created: list of the inserted (date, altitude) samples, sorted by date
+    """
+    created = insert_samples(samples, satellite_id)
+    _record_ingested([date for date, altitude in created], len(samples))
+    if (not created):
+        return created
+    if (satellite_id == PRIMARY_SATELLITE):
+        aggregator.record_samples(created)
+    health.record_samples(created, satellite_id)
+    return created
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Min
+from apis.models import PRIMARY_SATELLITE, AltitudeModel
+from apis import rollups
+
+
+def _parse_date(value):
+    date = datetime.fromisoformat(value)
+    if (date.tzinfo is None):
+        raise CommandError(f'{value} has no timezone')
+    return date
+
+
+class Command(BaseCommand):
+    help = 'Builds the per minute rollups for the existing AltitudeModel rows of the primary satellite.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', type=_parse_date,
+                            help='ISO 8601 date to start from, defaults to the oldest altitude')
+        parser.add_argument('--to', dest='end', type=_parse_date,
+                            help='ISO 8601 date to stop at, defaults to the newest altitude')
+        parser.add_argument('--chunk-hours', type=int, default=24,
+                            help='hours of altitudes rolled up per transaction')
+
+    def handle(self, *args, **options):
+        bounds = AltitudeModel.objects.filter(satellite_id=PRIMARY_SATELLITE).aggregate(oldest=Min('date'), newest=Max('date'))
+        start = options['start'] or bounds['oldest']
+        end = options['end'] or bounds['newest']
+        if (start is None or end is None):
+            self.stdout.write('No altitudes to roll up.')
+            return
+
+        chunk = timedelta(hours=options['chunk_hours'])
+        total = 0
+        chunk_start = rollups.minute_bucket(start)
+        while (chunk_start <= end):
+            # rebuild includes the minute of its end date, so stop one minute short of the next chunk
+            chunk_end = min(chunk_start + chunk - rollups.MINUTE, end)
+            with transaction.atomic():
+                total += rollups.rebuild(chunk_start, chunk_end)
+            chunk_start += chunk
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {total} rollups.'))
@@ -0,0 +1,36 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+from apis.models import AltitudeModel
+from apis.store import get_store
+
+
+class Command(BaseCommand):
+    help = 'Copies the existing AltitudeModel rows of every satellite into settings.ALTITUDE_STORE.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--satellite', type=int, action='append', dest='satellites',
+                            help='id of a satellite to copy, can be given more than once, defaults to every satellite')
+        parser.add_argument('--chunk-days', type=int, default=1,
+                            help='days of altitudes copied per transaction')
+
+    def handle(self, *args, **options):
+        bounds = AltitudeModel.objects.values('satellite_id').annotate(oldest=Min('date'), newest=Max('date'))
+        if (options['satellites']):
+            bounds = bounds.filter(satellite_id__in=options['satellites'])
+
+        store = get_store()
+        chunk = timedelta(days=options['chunk_days'])
+        satellites = 0
+        for row in bounds.order_by('satellite_id'):
+            chunk_start = row['oldest']
+            while (chunk_start <= row['newest']):
+                # rebuild includes the day of its end date, so stop one day short of the next chunk
+                chunk_end = min(chunk_start + chunk - timedelta(days=1), row['newest'])
+                with transaction.atomic():
+                    store.rebuild(row['satellite_id'], chunk_start, chunk_end)
+                chunk_start += chunk
+            satellites += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Copied the altitudes of {satellites} satellites.'))
@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import requests
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while (time.monotonic() < deadline):
+        if (process.poll() is not None):
+            raise CommandError(f'The server for {url} exited with {process.returncode}')
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise CommandError(f'The server for {url} did not start within {timeout}s')
+
+
+def _run(url, total, concurrency):
+    """Sends total GET requests to url from concurrency threads with keep-alive sessions.
+
+        Returns:
+            result: dict of the throughput in requests/s, p50 and p99 latencies in ms and error count
+    """
+    local = threading.local()
+
+    def request(_):
+        if (not hasattr(local, 'session')):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            ok = local.session.get(url, timeout=10).status_code < 500
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(request, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, ok in results)
+    return {
+        'throughput': total / elapsed,
+        'p50': statistics.median(latencies) * 1000,
+        'p99': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        'errors': sum(1 for latency, ok in results if not ok),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Compares the concurrent request throughput of /stats/ and /health/ served by the WSGI views '
+            'under runserver and by the async views under uvicorn.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='requests sent per endpoint and server')
+        parser.add_argument('--concurrency', type=int, default=32, help='requests in flight at once')
+        parser.add_argument('--path', dest='paths', action='append',
+                            help='endpoint to benchmark, can be repeated, defaults to /stats/ and /health/')
+        parser.add_argument('--wsgi-url', help='base url of a running WSGI server instead of starting runserver')
+        parser.add_argument('--asgi-url', help='base url of a running ASGI server instead of starting uvicorn')
+        parser.add_argument('--asgi-settings', default='health_apis.settings_asgi',
+                            help='settings module uvicorn is started with')
+        parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or ['/stats/', '/health/']
+        processes = []
+        try:
+            servers = [
+                ('wsgi', options['wsgi_url'] or self._start(processes, settings.SETTINGS_MODULE, lambda port: [
+                    sys.executable, 'manage.py', 'runserver', '--noreload', '--skip-checks', f'127.0.0.1:{port}'])),
+                ('asgi', options['asgi_url'] or self._start(processes, options['asgi_settings'], lambda port: [
+                    sys.executable, '-m', 'uvicorn', 'health_apis.asgi:application', '--port', str(port),
+                    '--workers', str(options['workers']), '--log-level', 'warning', '--no-access-log'])),
+            ]
+            self._report(servers, paths, options['requests'], options['concurrency'])
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+    def _start(self, processes, settings_module, command):
+        port = _free_port()
+        environment = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+        process = subprocess.Popen(command(port), cwd=settings.BASE_DIR, env=environment,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        processes.append(process)
+        base = f'http://127.0.0.1:{port}'
+        _wait_until_up(base + '/stats/', process)
+        return base
+
+    def _report(self, servers, paths, total, concurrency):
+        self.stdout.write(f'{total} requests per endpoint, {concurrency} concurrent')
+        self.stdout.write(f'{"server":<6} {"path":<12} {"req/s":>9} {"p50 ms":>8} {"p99 ms":>8} {"errors":>7}')
+        for path in paths:
+            throughputs = {}
+            for name, base in servers:
+                # warm up connections, caches and the aggregator snapshot
+                _run(base + path, concurrency * 2, concurrency)
+                result = _run(base + path, total, concurrency)
+                throughputs[name] = result['throughput']
+                self.stdout.write(f'{name:<6} {path:<12} {result["throughput"]:>9.0f} {result["p50"]:>8.1f} '
+                                  f'{result["p99"]:>8.1f} {result["errors"]:>7}')
+            self.stdout.write(f'{"":<6} {path:<12} asgi/wsgi {throughputs["asgi"] / throughputs["wsgi"]:.2f}x')
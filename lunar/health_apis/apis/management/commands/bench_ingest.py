@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta, timezone
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from apis.benchmarks import BENCH_CACHES, invalidate_caches, run_commit_callbacks
+from apis.parsers import msgpack
+from apis.views import post_altitudes
+import json
+import math
+import statistics
+import time
+
+
+def _batches(total, size):
+    """Yields batches of samples ten times a second, in the format pushed to POST /altitudes/.
+
+        The altitudes stay above health.LOW_ALTITUDE, so the benchmark sends no health notifications.
+    """
+    first = datetime.now(timezone.utc) - timedelta(seconds=total / 10)
+    for offset in range(0, total, size):
+        yield [{'altitude': 200 + 20 * math.sin(i / 600), 'last_updated': (first + timedelta(seconds=i / 10)).isoformat()}
+               for i in range(offset, min(offset + size, total))]
+
+
+class Command(BaseCommand):
+    help = ('Measures the throughput of POST /altitudes/ in this process, from parsing the body to the database '
+            'write, for JSON and MessagePack bodies. The database is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=200000, help='samples posted per format and batch size')
+        parser.add_argument('--batch-size', type=int, action='append', dest='batch_sizes',
+                            help='samples per request, can be repeated, defaults to 1000 and 10000')
+
+    def handle(self, *args, **options):
+        formats = [('json', 'application/json', lambda batch: json.dumps(batch).encode())]
+        if (msgpack is not None):
+            formats.append(('msgpack', 'application/msgpack', msgpack.packb))
+        else:
+            self.stderr.write('msgpack is not installed, only JSON is measured')
+
+        factory = RequestFactory()
+        self.stdout.write(f'{"format":<8} {"batch":>6} {"samples/s":>10} {"p50 ms":>8} {"max ms":>8}')
+        for name, content_type, encode in formats:
+            for size in options['batch_sizes'] or [1000, 10000]:
+                bodies = [encode(batch) for batch in _batches(options['samples'], size)]
+                timings = []
+                pending = len(connection.run_on_commit)
+                # the snapshots of the rolled back samples are published to a cache of their own
+                with override_settings(CACHES=BENCH_CACHES):
+                    try:
+                        with transaction.atomic():
+                            for body in bodies:
+                                started = time.perf_counter()
+                                response = post_altitudes(
+                                    factory.post('/altitudes/', body, content_type=content_type))
+                                run_commit_callbacks(pending)
+                                timings.append(time.perf_counter() - started)
+                                if (response.status_code != 201):
+                                    raise CommandError(
+                                        f'POST /altitudes/ answered {response.status_code}: {response.data}')
+                            transaction.set_rollback(True)
+                    finally:
+                        invalidate_caches()
+                self.stdout.write(f'{name:<8} {size:>6} {options["samples"] / sum(timings):>10.0f} '
+                                  f'{statistics.median(timings) * 1000:>8.1f} {max(timings) * 1000:>8.1f}')
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from apis.models import AltitudeModel, Satellite
+from apis.store import ColumnarStore, DatabaseStore
+import math
+import statistics
+import tempfile
+import time
+
+WINDOWS = [('1 min', timedelta(minutes=1)), ('5 min', timedelta(minutes=5)), ('1 day', timedelta(days=1))]
+
+
+def _samples(end, total, chunk):
+    """Yields chunks of one sample a second that end at end, with an altitude that oscillates around 160."""
+    first = end - timedelta(seconds=total - 1)
+    for offset in range(0, total, chunk):
+        yield [(first + timedelta(seconds=second), 160 + 20 * math.sin(second / 600))
+               for second in range(offset, min(offset + chunk, total))]
+
+
+def _median_ms(read, repeat):
+    read()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        read()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+class Command(BaseCommand):
+    help = ('Compares the write throughput and window read latency of the DatabaseStore and the ColumnarStore '
+            'on a temporary satellite, the database is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, action='append',
+                            help='samples to write, can be repeated, defaults to 1000000 (try 10000000 and 100000000)')
+        parser.add_argument('--chunk', type=int, default=100000, help='samples written per batch')
+        parser.add_argument('--repeat', type=int, default=5, help='reads timed per window')
+
+    def handle(self, *args, **options):
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            raise CommandError('The ColumnarStore requires numpy')
+
+        self.stdout.write(f'{"samples":>10} {"store":<9} {"writes/s":>10} '
+                          + ' '.join(f'{name + " ms":>10}' for name, window in WINDOWS) + f' {"full ms":>10}')
+        for total in options['samples'] or [1000000]:
+            self._bench(total, options['chunk'], options['repeat'])
+
+    def _bench(self, total, chunk, repeat):
+        end = datetime.now(timezone.utc).replace(microsecond=0)
+        with tempfile.TemporaryDirectory() as location, transaction.atomic():
+            satellite = Satellite.objects.create(name=f'bench-store-{time.time_ns()}', url='http://bench.invalid/')
+            columnar = ColumnarStore({'LOCATION': location})
+            writes = {'database': 0.0, 'columnar': 0.0}
+            for samples in _samples(end, total, chunk):
+                started = time.perf_counter()
+                AltitudeModel.objects.bulk_insert(samples, satellite.pk)
+                writes['database'] += time.perf_counter() - started
+                # the copy a commit would make, without waiting for one
+                started = time.perf_counter()
+                columnar._append(satellite.pk, samples)
+                writes['columnar'] += time.perf_counter() - started
+
+            starts = [end - window for name, window in WINDOWS] + [end - timedelta(seconds=total)]
+            for name, store in (('database', DatabaseStore({})), ('columnar', columnar)):
+                reads = [_median_ms(lambda: store.window_stats(satellite.pk, start), repeat) for start in starts]
+                self.stdout.write(f'{total:>10} {name:<9} {total / writes[name]:>10.0f} '
+                                  + ' '.join(f'{read:>10.2f}' for read in reads))
+            transaction.set_rollback(True)
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from apis import benchmarks
+import json
+
+
+def _load(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError) as error:
+        raise CommandError(f'Could not read {path}: {error}')
+
+
+class Command(BaseCommand):
+    help = ('Seeds the primary satellite with synthetic orbits of each size and times ingest, check_altitude and '
+            '/stats/ on them, with p50/p95/p99 latencies as JSON. The database is rolled back after each size. '
+            'With --compare, flags the latencies of a new result file that regressed from a base one.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, action='append',
+                            help='rows to seed, can be repeated, defaults to 100000 and 1000000')
+        parser.add_argument('--repeat', type=int, default=200, help='operations timed per benchmark')
+        parser.add_argument('--output', help='file to write the results to, they are printed otherwise')
+        parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'),
+                            help='compare two result files instead of running the suite')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='relative latency increase that counts as a regression with --compare')
+
+    def handle(self, *args, **options):
+        if (options['compare']):
+            self._compare(*options['compare'], options['tolerance'])
+            return
+        if (options['repeat'] < 1):
+            raise CommandError('--repeat has to be at least 1')
+
+        report = benchmarks.run(options['rows'] or [100000, 1000000], options['repeat'])
+        output = json.dumps(report, indent=2)
+        if (options['output']):
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Wrote the results to {options["output"]}.'))
+        else:
+            self.stdout.write(output)
+
+    def _compare(self, base, new, tolerance):
+        comparison = benchmarks.compare(_load(base), _load(new), tolerance)
+        if (not comparison):
+            raise CommandError('The result files have no benchmark at the same number of rows')
+
+        self.stdout.write(f'{"rows":>9} {"benchmark":<18} {"":<4} {"base ms":>9} {"new ms":>9} {"change":>8}')
+        for rows, name, percentile, previous, latency, regressed in comparison:
+            line = (f'{rows:>9} {name:<18} {percentile:<4} {previous:>9.3f} {latency:>9.3f} '
+                    f'{(latency / previous - 1) * 100 if previous else 0:>+7.1f}%')
+            self.stdout.write(self.style.ERROR(line + ' regressed') if regressed else line)
+
+        regressions = sum(1 for *_, regressed in comparison if regressed)
+        if (regressions):
+            raise CommandError(f'{regressions} latencies regressed by more than {tolerance:.0%}')
+        self.stdout.write(self.style.SUCCESS('No regressions.'))
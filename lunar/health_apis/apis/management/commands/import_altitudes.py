@@ -0,0 +1,102 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from apis.samples import parse_sample
+from apis import aggregator, ingest, rollups
+import csv
+import gzip
+import io
+import itertools
+import json
+import sys
+import time
+
+
+def _open(path):
+    if (path == '-'):
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    if (path.endswith('.gz')):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def _format(path, format):
+    if (format):
+        return format
+    name = path[:-3] if path.endswith('.gz') else path
+    if (name.endswith('.csv')):
+        return 'csv'
+    if (name.endswith('.ndjson') or name.endswith('.jsonl')):
+        return 'ndjson'
+    raise CommandError(f'Cannot tell the format of {path}, use --format')
+
+
+def _records(file, format):
+    """Generator over the raw records of a file, one dict per row or line."""
+    if (format == 'csv'):
+        yield from csv.DictReader(file)
+        return
+    for line in file:
+        if (line.strip()):
+            yield json.loads(line)
+
+
+class Command(BaseCommand):
+    help = ('Imports altitudes of the primary satellite from CSV or newline delimited JSON files with the '
+            'altitude and last_updated fields of the satellite api, as written by /altitudes/export/.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='files to import, optionally gzipped, - reads stdin')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='format of the files, defaults to their extension')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='altitudes written per transaction')
+        parser.add_argument('--strict', action='store_true',
+                            help='stop at the first invalid row instead of skipping it')
+
+    def handle(self, *args, **options):
+        self.created = self.duplicates = self.invalid = 0
+        self.oldest = None
+        started = time.perf_counter()
+
+        for path in options['paths']:
+            format = _format(path, options['format'])
+            with _open(path) as file:
+                samples = self._samples(_records(file, format), path, options['strict'])
+                while (batch := list(itertools.islice(samples, options['batch_size']))):
+                    self._write(batch)
+
+        # hours and days compacted before these altitudes arrived have to be compacted again
+        if (self.oldest is not None):
+            with transaction.atomic():
+                for tier in rollups.TIERS[1:]:
+                    covered_until = tier.covered_until()
+                    if (covered_until is not None and self.oldest < covered_until):
+                        rollups.compact(tier, self.oldest, covered_until)
+                aggregator.invalidate()
+
+        elapsed = time.perf_counter() - started
+        rows = self.created + self.duplicates + self.invalid
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {self.created} altitudes, skipped {self.duplicates} duplicates and {self.invalid} invalid rows '
+            f'in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s).'))
+
+    def _samples(self, records, path, strict):
+        """Generator of valid (altitude, date) samples, normalized to UTC like get_altitude does."""
+        for number, record in enumerate(records, 1):
+            try:
+                yield parse_sample(record)
+            except (KeyError, TypeError, ValueError) as error:
+                if (strict):
+                    raise CommandError(f'{path}, row {number}: invalid altitude ({error!r})')
+                self.invalid += 1
+
+    def _write(self, batch):
+        """Writes a batch of samples in one transaction, skipping dates that already exist."""
+        with transaction.atomic():
+            altitudes = ingest.insert_samples((date, altitude) for altitude, date in batch)
+
+        self.created += len(altitudes)
+        self.duplicates += len(batch) - len(altitudes)
+        start = min(date for altitude, date in batch)
+        if (self.oldest is None or start < self.oldest):
+            self.oldest = start
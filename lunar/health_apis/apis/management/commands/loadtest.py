@@ -0,0 +1,252 @@
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apis.benchmarks import summarize
+from apis.models import HealthMessage
+from apis.stub import OrbitProfile, StubServer
+from .bench_http import _free_port, _wait_until_up
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import requests
+
+# seconds the pipeline has to store its first sample in, get_altitudes is first sent 10 seconds after beat starts
+INGEST_TIMEOUT = 60
+
+
+def _drive(base, paths, clients, duration):
+    """Sends GET requests to the paths in turn from clients threads with keep-alive sessions for duration seconds.
+
+        Returns:
+            results: dict by path of the request count, throughput in requests/s, latency percentiles in ms and errors
+    """
+    latencies = [{path: [] for path in paths} for _ in range(clients)]
+    errors = [{path: 0 for path in paths} for _ in range(clients)]
+    deadline = time.monotonic() + duration
+
+    def client(index):
+        session = requests.Session()
+        sent = 0
+        while (time.monotonic() < deadline):
+            path = paths[(index + sent) % len(paths)]
+            sent += 1
+            started = time.perf_counter()
+            try:
+                ok = session.get(base + path, timeout=10).status_code < 500
+            except requests.RequestException:
+                ok = False
+            latencies[index][path].append(time.perf_counter() - started)
+            errors[index][path] += not ok
+
+    threads = [threading.Thread(target=client, args=(index,), daemon=True) for index in range(clients)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    results = {}
+    for path in paths:
+        timings = [latency for client_latencies in latencies for latency in client_latencies[path]]
+        if (not timings):
+            continue
+        result = summarize(timings)
+        result['throughput'] = len(timings) / elapsed
+        result['errors'] = sum(client_errors[path] for client_errors in errors)
+        results[path] = result
+    return results
+
+
+def _wait_for_ingest(base, processes, directory, timeout=INGEST_TIMEOUT):
+    """Waits until /stats/ serves a sample the pipeline stored, so the run does not start on a broken ingest."""
+    session = requests.Session()
+    deadline = time.monotonic() + timeout
+    while (time.monotonic() < deadline):
+        for process in processes:
+            if (process.poll() is not None):
+                raise CommandError(f'{process.args[0:4]} exited with {process.returncode}{_logs(directory)}')
+        try:
+            if (session.get(base + '/stats/?windows=1m', timeout=5).json()['1m']['count']):
+                return
+        except (requests.RequestException, ValueError, KeyError):
+            pass
+        time.sleep(0.5)
+    raise CommandError(f'No sample of the stub was stored within {timeout}s{_logs(directory)}')
+
+
+def _logs(directory, lines=20):
+    """Returns the last lines of the logs of the ingest processes, to tell why they did not store anything."""
+    tails = []
+    for name in ('celery', 'poller'):
+        path = os.path.join(directory, f'{name}.log')
+        if (os.path.exists(path)):
+            with open(path) as log:
+                tails.append(f'\n--- {name}.log\n' + ''.join(log.readlines()[-lines:]))
+    return ''.join(tails)
+
+
+def _watch_health(url, published_at, deadline):
+    """Polls /health/ until it reports the low altitude warning.
+
+        Returns:
+            delay: seconds from published_at until the warning was served, None when it was not by deadline
+    """
+    session = requests.Session()
+    while (time.time() < deadline):
+        try:
+            response = session.get(url, timeout=5)
+            if (response.status_code == 200 and HealthMessage.WARNING.value in response.text):
+                return time.time() - published_at
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    return None
+
+
+class Command(BaseCommand):
+    help = ('Runs the whole pipeline on this machine against a stub of the satellite api: the stub, celery (or the '
+            'poller), a temporary database and runserver, with concurrent clients on /stats/ and /health/. A low '
+            'altitude event is started midway. Reports the throughput and latencies of the endpoints and how long '
+            '/health/ took to warn about the event. Needs a redis server, it uses two databases of its own.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=120, help='seconds the clients send requests for')
+        parser.add_argument('--clients', type=int, default=16, help='concurrent clients')
+        parser.add_argument('--path', dest='paths', action='append',
+                            help='endpoint the clients request, can be repeated, defaults to /stats/ and /health/')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='seconds between two updates of the stub satellite api')
+        parser.add_argument('--ingest', choices=['celery', 'poller'], default='celery',
+                            help='fetch the stub with the get_altitudes beat task or with the poll_altitude command')
+        parser.add_argument('--write-mode', choices=['direct', 'buffered'], default='direct',
+                            help='ALTITUDE_WRITE_MODE of the celery worker')
+        parser.add_argument('--event-after', type=float,
+                            help='seconds into the run the low altitude event starts, a quarter of --duration by default')
+        parser.add_argument('--event-altitude', type=float, default=140.0, help='altitude in km during the event')
+        parser.add_argument('--redis', default='redis://localhost:6379',
+                            help='redis server, databases 14 (cache) and 15 (celery broker) are used')
+        parser.add_argument('--output', help='file to write the report to as JSON')
+
+    def handle(self, *args, **options):
+        if (options['clients'] < 1 or options['duration'] <= 0):
+            raise CommandError('--clients and --duration have to be positive')
+        event_after = options['event_after'] if (options['event_after'] is not None) else options['duration'] / 4
+        if (not 0 <= event_after < options['duration']):
+            raise CommandError('--event-after has to be within --duration')
+
+        profile = OrbitProfile(interval=options['interval'])
+        stub = StubServer(profile).start()
+        directory = tempfile.TemporaryDirectory(prefix='loadtest-')
+        environment = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE,
+            DATABASE_PATH=os.path.join(directory.name, 'db.sqlite3'),
+            SATELLITE_URL=stub.url,
+            REDIS_URL=options['redis'].rstrip('/') + '/14',
+            CELERY_BROKER_URL=options['redis'].rstrip('/') + '/15',
+            ALTITUDE_INGEST_MODE='poller' if (options['ingest'] == 'poller') else 'beat',
+            ALTITUDE_WRITE_MODE=options['write_mode'],
+        )
+        processes = []
+        try:
+            migrate = subprocess.run([sys.executable, 'manage.py', 'migrate', '--verbosity', '0'],
+                                     cwd=settings.BASE_DIR, env=environment, capture_output=True, text=True)
+            if (migrate.returncode):
+                raise CommandError(f'Could not migrate the temporary database:\n{migrate.stderr}')
+            base = self._start_pipeline(processes, directory.name, environment, options['ingest'])
+            report = self._run(base, profile, options, event_after)
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait()
+            stub.shutdown()
+            stub.server_close()
+            directory.cleanup()
+
+        self._report(report)
+        if (options['output']):
+            with open(options['output'], 'w') as file:
+                file.write(json.dumps(report, indent=2) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Wrote the report to {options["output"]}.'))
+
+    def _start_pipeline(self, processes, directory, environment, ingest):
+        """Starts the celery worker with an embedded beat, the poller if asked for, and runserver.
+
+            Returns once the first sample of the stub was stored, the clients measure a running pipeline.
+
+            Returns:
+                base: url of the web server
+        """
+        def start(name, command):
+            log = open(os.path.join(directory, f'{name}.log'), 'w')
+            process = subprocess.Popen(command, cwd=settings.BASE_DIR, env=environment, stdout=log,
+                                       stderr=subprocess.STDOUT)
+            log.close()
+            processes.append(process)
+            return process
+
+        # check_altitude and compact_altitudes run from beat in both modes
+        start('celery', [sys.executable, '-m', 'celery', '-A', 'health_apis', 'worker', '-B', '-l', 'warning',
+                         '--schedule', os.path.join(directory, 'beat-schedule')])
+        if (ingest == 'poller'):
+            start('poller', [sys.executable, 'manage.py', 'poll_altitude'])
+        port = _free_port()
+        web = start('web', [sys.executable, 'manage.py', 'runserver', '--noreload', '--skip-checks', f'127.0.0.1:{port}'])
+        base = f'http://127.0.0.1:{port}'
+        _wait_until_up(base + '/stats/', web)
+        _wait_for_ingest(base, processes, directory)
+        return base
+
+    def _run(self, base, profile, options, event_after):
+        """Drives the clients while a low altitude event starts event_after seconds in.
+
+            Returns:
+                report: dict of the endpoint results, the detection delay and the stored samples
+        """
+        paths = options['paths'] or ['/stats/', '/health/']
+        started = time.time()
+        deadline = started + options['duration']
+        detection = {}
+
+        def event():
+            time.sleep(event_after)
+            published_at = profile.drop(options['event_altitude'])
+            detection['published_at'] = published_at
+            detection['delay'] = _watch_health(base + '/health/', published_at, deadline)
+
+        watcher = threading.Thread(target=event, daemon=True)
+        watcher.start()
+        endpoints = _drive(base, paths, options['clients'], options['duration'])
+        watcher.join()
+
+        window = f'{int(time.time() - started) + 1}s'
+        stored = requests.get(f'{base}/stats/?windows={window}', timeout=10).json()[window]['count']
+        return {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'options': {name: options[name] for name in ('duration', 'clients', 'interval', 'ingest', 'write_mode',
+                                                         'event_altitude')},
+            'endpoints': endpoints,
+            'updates_published': int((time.time() - profile.started) // profile.interval) + 1,
+            'samples_stored': stored,
+            'detection_delay': detection['delay'],
+        }
+
+    def _report(self, report):
+        options = report['options']
+        self.stdout.write(f'{options["clients"]} clients for {options["duration"]:.0f}s, ingest {options["ingest"]} '
+                          f'({options["write_mode"]}), the stub updates every {options["interval"]}s')
+        self.stdout.write(f'{"path":<24} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7}')
+        for path, result in report['endpoints'].items():
+            self.stdout.write(f'{path:<24} {result["throughput"]:>9.0f} {result["p50"]:>8.1f} {result["p95"]:>8.1f} '
+                              f'{result["p99"]:>8.1f} {result["errors"]:>7}')
+        self.stdout.write(f'{report["samples_stored"]} of {report["updates_published"]} updates stored')
+        if (report['detection_delay'] is None):
+            self.stdout.write(self.style.ERROR('/health/ did not warn about the low altitude event before the end'))
+        else:
+            self.stdout.write(f'/health/ warned {report["detection_delay"]:.2f}s after the low altitude was published')
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apis.poller import Poller
+from apis import metrics
+import signal
+
+
+class Command(BaseCommand):
+    help = ('Fetches altitudes of the primary satellite just after its api is expected to update them, '
+            'instead of get_altitudes when ALTITUDE_INGEST_MODE is poller. '
+            'Several pollers can run, only the elected leader fetches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int,
+                            help='stop after this many polls instead of running until interrupted')
+
+    def handle(self, *args, **options):
+        if (settings.ALTITUDE_INGEST_MODE != 'poller'):
+            raise CommandError('Set ALTITUDE_INGEST_MODE=poller, or get_altitudes fetches the primary satellite as well')
+
+        # the poller runs alongside the worker, its fetches are reported at /metrics as well
+        metrics.start()
+        poller = Poller(settings.ALTITUDE_POLLER)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: poller.stop())
+
+        self.stdout.write('Polling the satellite api, stop with Ctrl+C.')
+        poller.run(options['iterations'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {poller.stored} altitudes in {poller.fetches} fetches, '
+            f'learned update interval {poller.estimator.interval}s.'))
@@ -0,0 +1,63 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from apis.models import HealthMessage
+from apis.replay import CHECK_INTERVAL, Replay
+from apis.samples import parse_sample
+from .import_altitudes import _format, _open, _records
+import json
+
+
+class Command(BaseCommand):
+    help = ('Replays recorded altitudes, in the CSV or newline delimited JSON of /altitudes/export/, through ingest '
+            'and the health evaluation of a temporary satellite on a simulated clock, as fast as they are processed. '
+            'Prints the timeline of the health messages and the throughput. The database is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='files to replay in order, optionally gzipped, - reads stdin')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='format of the files, defaults to their extension')
+        parser.add_argument('--check-interval', type=float, default=CHECK_INTERVAL.total_seconds(),
+                            help='simulated seconds between two check_altitude passes')
+        parser.add_argument('--output', help='file to write the timeline and throughput to as JSON')
+
+    def handle(self, *args, **options):
+        if (options['check_interval'] <= 0):
+            raise CommandError('--check-interval has to be positive')
+        self.invalid = 0
+        replay = Replay(timedelta(seconds=options['check_interval']))
+        result = replay.run(self._samples(options['paths'], options['format']))
+        result['invalid'] = self.invalid
+        if (not result['samples']):
+            raise CommandError('There were no valid altitudes to replay')
+
+        self._report(result)
+        if (options['output']):
+            with open(options['output'], 'w') as file:
+                file.write(json.dumps(result, indent=2) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Wrote the result to {options["output"]}.'))
+
+    def _samples(self, paths, format):
+        """Generator of the valid (date, altitude) samples of the files, invalid rows are counted and skipped."""
+        for path in paths:
+            with _open(path) as file:
+                for record in _records(file, _format(path, format)):
+                    try:
+                        altitude, date = parse_sample(record)
+                    except (KeyError, TypeError, ValueError):
+                        self.invalid += 1
+                        continue
+                    yield date, altitude
+
+    def _report(self, result):
+        self.stdout.write(f'{"since":<26} {"duration":>12}  message')
+        for change in result['timeline']:
+            self.stdout.write(f'{change["date"]:<26} {timedelta(seconds=round(change["seconds"]))!s:>12}  '
+                              f'{change["message"]}')
+        for message in HealthMessage:
+            seconds = result['seconds'].get(message.name.lower(), 0)
+            self.stdout.write(f'{timedelta(seconds=round(seconds))!s:>39}  in total {message.value}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Replayed {result["samples"]} altitudes ({result["created"]} new, {result["invalid"]} invalid rows '
+            f'skipped) covering {timedelta(seconds=round(result["simulated_seconds"]))} in '
+            f'{result["elapsed_seconds"]:.1f}s: {result["throughput"]:.0f} altitudes/s, '
+            f'{result["speedup"]:.0f}x real time.'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from apis.stub import DROP_PATH, OrbitProfile, StubServer
+
+
+class Command(BaseCommand):
+    help = ('Serves synthetic altitudes of a decaying orbit like the satellite api, for load tests without the real one. '
+            f'POST {DROP_PATH}?altitude=140 starts a low altitude event.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--interval', type=float, default=10.0, help='seconds between two updates of the altitude')
+        parser.add_argument('--altitude', type=float, default=175.0, help='starting altitude in km')
+        parser.add_argument('--decay', type=float, default=0.0, help='km the orbit sinks per hour')
+        parser.add_argument('--amplitude', type=float, default=5.0, help='km the altitude oscillates by')
+        parser.add_argument('--period', type=float, default=5400.0, help='seconds of one oscillation')
+
+    def handle(self, *args, **options):
+        profile = OrbitProfile(options['interval'], options['altitude'], options['decay'], options['amplitude'],
+                               options['period'])
+        server = StubServer(profile, options['host'], options['port'])
+        self.stdout.write(f'Serving {server.url}, point SATELLITE_URL at it. Stop with Ctrl+C.')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
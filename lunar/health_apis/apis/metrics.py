@@ -0,0 +1,388 @@
+# metrics.py
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from bisect import bisect_left
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+import atexit
+import json
+import logging
+import math
+import os
+import redis
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# seconds between two warnings about pushes that failed, the pusher thread retries every PUSH_INTERVAL
+WARNING_INTERVAL = 60
+
+# latency buckets in seconds, from a cached read to a fetch that retried
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# what the database time is attributed to, the route of the request or the name of the task
+source = ContextVar('metrics_source', default='other')
+# queries of the current request, a list so the threads of sync_to_async count into the same one
+_queries = ContextVar('metrics_queries', default=None)
+
+
+class Metric:
+    """A metric of the registry, recorded by any process and rendered in the Prometheus text format by /metrics.
+
+        The samples of a process are added up in memory, the MetricsStore of settings.METRICS
+        receives them as deltas, so the metrics of every web and worker process add up.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        REGISTRY[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def samples(self, values):
+        """Returns the (name, labels, value) samples of the metric from the values read from the store."""
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, value=1, **labels):
+        _record([((self.name, self._key(labels), 'total'), value)])
+
+    def samples(self, values):
+        return [(f'{self.name}_total', dict(zip(self.labels, key)), value)
+                for (key, field), value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        # the count of the bucket the value falls in, they are added up when rendered
+        bucket = bisect_left(self.buckets, value)
+        _record([((self.name, key, str(bucket)), 1), ((self.name, key, 'sum'), value), ((self.name, key, 'count'), 1)])
+
+    def observe_many(self, values, **labels):
+        """Observes a list of values with the same labels, recorded at once instead of one by one."""
+        key = self._key(labels)
+        counts = {}
+        for value in values:
+            bucket = bisect_left(self.buckets, value)
+            counts[bucket] = counts.get(bucket, 0) + 1
+        _record([((self.name, key, str(bucket)), count) for bucket, count in counts.items()]
+                + [((self.name, key, 'sum'), sum(values)), ((self.name, key, 'count'), len(values))])
+
+    def samples(self, values):
+        series = {}
+        for (key, field), value in values.items():
+            series.setdefault(key, {})[field] = value
+        samples = []
+        for key, fields in sorted(series.items()):
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for index, bound in enumerate(self.buckets + (math.inf,)):
+                cumulative += fields.get(str(index), 0)
+                samples.append((f'{self.name}_bucket', dict(labels, le=_format(bound)), cumulative))
+            samples.append((f'{self.name}_sum', labels, fields.get('sum', 0)))
+            samples.append((f'{self.name}_count', labels, fields.get('count', 0)))
+        return samples
+
+
+class Gauge(Metric):
+    """A value read when /metrics is scraped, function returns it."""
+    type = 'gauge'
+
+    def __init__(self, name, documentation, function):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def samples(self, values):
+        return [(self.name, {}, self.function())]
+
+
+REGISTRY = {}
+
+HTTP_REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Duration of the requests, from the first middleware on.',
+                                 ['method', 'route', 'status'])
+HTTP_REQUEST_QUERIES = Histogram('http_request_queries', 'Database queries made by a request.', ['route'],
+                                 buckets=(0, 1, 2, 5, 10, 20, 50, 100))
+DB_QUERY_SECONDS = Histogram('db_query_duration_seconds', 'Duration of the database queries, by the route or task making them.',
+                             ['source'])
+TASK_SECONDS = Histogram('celery_task_duration_seconds', 'Duration of the celery tasks.', ['task', 'state'])
+TASK_FAILURES = Counter('celery_task_failures', 'Celery tasks that raised.', ['task'])
+UPSTREAM_SECONDS = Histogram('upstream_request_duration_seconds', 'Duration of the requests to the satellite apis, with retries.')
+UPSTREAM_FAILURES = Counter('upstream_failures', 'Failed requests to the satellite apis.', ['reason'])
+INGEST_SAMPLES = Counter('ingest_samples', 'Fetched or pushed samples, created, skipped as duplicates or failed to store.', ['result'])
+INGEST_LAG_SECONDS = Histogram('ingest_lag_seconds', 'Time from the last_updated date of a sample until it was stored.',
+                               buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600))
+
+
+def _format(value):
+    if (value == math.inf):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class MetricsStore:
+    """Adds up the metric deltas of every process, configured with settings.METRICS.
+
+        Deltas are keyed by (metric name, label values, field), where the field is total for a counter,
+        and the index of a bucket, sum or count for a histogram.
+    """
+
+    def __init__(self, params):
+        self.params = params
+
+    def push(self, deltas):
+        raise NotImplementedError
+
+    def read(self):
+        """Returns the totals of every key pushed so far."""
+        raise NotImplementedError
+
+
+class MemoryMetrics(MetricsStore):
+    """Keeps the metrics in the memory of the process, for tests and a single process deployment."""
+
+    def __init__(self, params):
+        super().__init__(params)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def push(self, deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self._values[key] = self._values.get(key, 0) + delta
+
+    def read(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class RedisMetrics(MetricsStore):
+    """Keeps the metrics in a redis hash shared by every process, LOCATION is the url of the redis server."""
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.key = params.get('KEY', 'metrics')
+        self._client = redis.Redis.from_url(params['LOCATION'])
+
+    def push(self, deltas):
+        with self._client.pipeline(transaction=False) as pipe:
+            for key, delta in deltas.items():
+                pipe.hincrbyfloat(self.key, json.dumps(key), delta)
+            pipe.execute()
+
+    def read(self):
+        values = {}
+        for field, value in self._client.hgetall(self.key).items():
+            name, labels, field = json.loads(field)
+            values[name, tuple(labels), field] = float(value)
+        return values
+
+
+class Recorder:
+    """Adds up the samples of this process and pushes them to the store every PUSH_INTERVAL seconds.
+
+        Recording only updates a dict, the store is called when /metrics is scraped and, once the
+        recorder is started, from a background thread and when the process exits. A PUSH_INTERVAL
+        of None leaves it to the last two.
+    """
+
+    def __init__(self, store, push_interval):
+        self.store = store
+        self.push_interval = push_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._warned_at = None
+
+    def record(self, deltas):
+        with self._lock:
+            for key, delta in deltas:
+                self._pending[key] = self._pending.get(key, 0) + delta
+
+    def start(self):
+        """Pushes from a background thread every push_interval seconds, and when the process exits."""
+        with self._lock:
+            if (self._started):
+                return
+            self._started = True
+        if (self.push_interval is not None):
+            threading.Thread(target=self._run, name='metrics-pusher', daemon=True).start()
+        atexit.register(self.push)
+
+    def push(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if (not pending):
+            return
+        try:
+            self.store.push(pending)
+        except Exception as error:
+            # a store that is down must not lose the samples, nor fail the request or task recording them
+            now = time.monotonic()
+            if (self._warned_at is None or now - self._warned_at >= WARNING_INTERVAL):
+                self._warned_at = now
+                logger.warning('Could not push the metrics: %s', error)
+            self.record(pending.items())
+
+    def _run(self):
+        while (True):
+            time.sleep(self.push_interval)
+            self.push()
+
+
+_recorder = None
+# whether the recorders of this process push on their own, see start()
+_started = False
+
+
+def get_recorder():
+    """Returns the Recorder of this process, pushing to the MetricsStore of settings.METRICS."""
+    global _recorder
+    if (_recorder is None):
+        store = import_string(settings.METRICS['BACKEND'])(settings.METRICS)
+        _recorder = Recorder(store, settings.METRICS.get('PUSH_INTERVAL', 1))
+        if (_started):
+            _recorder.start()
+    return _recorder
+
+
+def start():
+    """Starts pushing the metrics of this process, called by the web servers and the celery worker.
+
+        The other processes, such as management commands, never push, so they run without the store.
+        The recorder of a process forked from a started one is started as well.
+    """
+    global _started
+    _started = True
+    if (_recorder is not None):
+        _recorder.start()
+
+
+def _record(deltas):
+    get_recorder().record(deltas)
+
+
+def _reset_recorder():
+    global _recorder
+    _recorder = None
+
+
+@receiver(setting_changed)
+def _reset_metrics(setting, **kwargs):
+    if (setting == 'METRICS'):
+        _reset_recorder()
+
+
+# the samples of the parent and its pusher thread stay behind in the processes celery forks
+os.register_at_fork(after_in_child=_reset_recorder)
+
+
+def render():
+    """Returns the metrics of every process in the Prometheus text format."""
+    recorder = get_recorder()
+    recorder.push()
+    values = {}
+    for (name, key, field), value in recorder.store.read().items():
+        values.setdefault(name, {})[key, field] = value
+
+    lines = []
+    for name, metric in REGISTRY.items():
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.type}')
+        for sample, labels, value in metric.samples(values.get(name, {})):
+            if (labels):
+                sample += '{' + ','.join(f'{label}="{_escape(value)}"' for label, value in labels.items()) + '}'
+            lines.append(f'{sample} {_format(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def time_queries(execute, sql, params, many, context):
+    """Database execute wrapper that times every query, installed on every connection by signals.py."""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        DB_QUERY_SECONDS.observe(time.perf_counter() - started, source=source.get())
+        queries = _queries.get()
+        if (queries is not None):
+            queries[0] += 1
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    return '/' + match.route if (match) else 'unmatched'
+
+
+class MetricsMiddleware:
+    """Records the duration and the database queries of every request, by route.
+
+        Runs first, so its duration includes the other middleware. The route is the pattern
+        the request resolved to, so the labels stay few whatever the ids in the urls.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if (iscoroutinefunction(get_response)):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if (iscoroutinefunction(self)):
+            return self.__acall__(request)
+        started, tokens = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            self._reset(tokens)
+        self._finish(request, response, started, tokens)
+        return response
+
+    async def __acall__(self, request):
+        started, tokens = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._reset(tokens)
+        self._finish(request, response, started, tokens)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # the database time of the view is attributed to its route, _reset restores the source
+        source.set(_route(request))
+
+    def _start(self):
+        queries = [0]
+        return time.perf_counter(), (source.set('request'), _queries.set(queries), queries)
+
+    def _reset(self, tokens):
+        source.reset(tokens[0])
+        _queries.reset(tokens[1])
+
+    def _finish(self, request, response, started, tokens):
+        route = _route(request)
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route,
+                                     status=response.status_code)
+        HTTP_REQUEST_QUERIES.observe(tokens[2][0], route=route)
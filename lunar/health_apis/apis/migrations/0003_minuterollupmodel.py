@@ -0,0 +1,29 @@
+# Generated by Django 5.0.4 on 2026-10-18 09:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apis', '0002_healthmodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MinuteRollupModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(unique=True)),
+                ('count', models.IntegerField()),
+                ('total', models.FloatField()),
+                ('minimum', models.FloatField()),
+                ('maximum', models.FloatField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='altitudemodel',
+            name='date',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.4 on 2026-10-18 11:42
+
+from datetime import timedelta
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def dedupe_altitudes(apps, schema_editor):
+    """Keeps the first altitude stored for every date and recomputes the minute rollups it changes.
+
+        Raw altitudes are only compacted into hours and days once they are deleted,
+        so the coarser tiers never counted the duplicates removed here.
+    """
+    AltitudeModel = apps.get_model('apis', 'AltitudeModel')
+    MinuteRollupModel = apps.get_model('apis', 'MinuteRollupModel')
+
+    duplicates = AltitudeModel.objects.values('date').annotate(
+        count_sum=Count('id'), first=Min('id')).filter(count_sum__gt=1)
+    minutes = set()
+    for duplicate in duplicates.iterator():
+        AltitudeModel.objects.filter(date=duplicate['date']).exclude(id=duplicate['first']).delete()
+        minutes.add(duplicate['date'].replace(second=0, microsecond=0))
+
+    for minute in minutes:
+        rollup = AltitudeModel.objects.filter(date__gte=minute, date__lt=minute + timedelta(minutes=1)).aggregate(
+            count_sum=Count('id'), total=Sum('altitude'), minimum=Min('altitude'), maximum=Max('altitude'))
+        MinuteRollupModel.objects.update_or_create(bucket=minute, defaults={
+            'count': rollup['count_sum'], 'total': rollup['total'],
+            'minimum': rollup['minimum'], 'maximum': rollup['maximum']})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apis', '0004_rollup_tiers'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_altitudes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='altitudemodel',
+            name='date',
+            field=models.DateTimeField(unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-18 09:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apis', '0005_unique_altitude_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthmodel',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
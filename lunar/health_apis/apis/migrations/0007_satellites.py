@@ -0,0 +1,64 @@
+# Generated by Django 5.0.4 on 2026-10-18 09:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import migrations, models
+
+
+def create_primary_satellite(apps, schema_editor):
+    """Creates the satellite the existing altitudes and health belong to.
+
+        The health is a single row so far, only the first one is kept,
+        as it is the one every reader used.
+    """
+    Satellite = apps.get_model('apis', 'Satellite')
+    HealthModel = apps.get_model('apis', 'HealthModel')
+
+    Satellite.objects.create(id=1, name='primary', url=settings.SATELLITE_URL)
+    # the id was given explicitly, databases with sequences have to skip it
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Satellite]):
+            cursor.execute(sql)
+    first = HealthModel.objects.order_by('id').first()
+    if (first is not None):
+        HealthModel.objects.exclude(id=first.id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apis', '0006_healthmodel_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Satellite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('url', models.URLField()),
+            ],
+        ),
+        migrations.RunPython(create_primary_satellite, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='altitudemodel',
+            name='date',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AddField(
+            model_name='altitudemodel',
+            name='satellite',
+            field=models.ForeignKey(default=1, on_delete=django.db.models.deletion.CASCADE, related_name='altitudes', to='apis.satellite'),
+        ),
+        migrations.AddField(
+            model_name='healthmodel',
+            name='satellite',
+            field=models.OneToOneField(default=1, on_delete=django.db.models.deletion.CASCADE, related_name='health', to='apis.satellite'),
+        ),
+        migrations.AddConstraint(
+            model_name='altitudemodel',
+            constraint=models.UniqueConstraint(fields=('satellite', 'date'), name='unique_satellite_date'),
+        ),
+    ]
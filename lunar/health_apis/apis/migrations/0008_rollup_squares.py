@@ -0,0 +1,51 @@
+# Generated by Django 5.0.4 on 2026-10-18 10:00
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMinute
+
+
+def fill_squares(apps, schema_editor):
+    """Computes the sum of squares of the existing rollups.
+
+        Minutes whose altitudes are still stored get their exact sum, the altitudes of older
+        rollups were deleted by the retention task, their spread is taken to be zero.
+    """
+    for name in ('MinuteRollupModel', 'HourlyRollupModel', 'DailyRollupModel'):
+        apps.get_model('apis', name).objects.update(squares=F('total') * F('total') / F('count'))
+
+    AltitudeModel = apps.get_model('apis', 'AltitudeModel')
+    MinuteRollupModel = apps.get_model('apis', 'MinuteRollupModel')
+    rows = AltitudeModel.objects.filter(satellite_id=1).annotate(bucket=TruncMinute('date')).values(
+        'bucket').annotate(sum_squares=Sum(F('altitude') * F('altitude'))).values_list('bucket', 'sum_squares')
+    squares = dict(rows)
+    rollups = [rollup for rollup in MinuteRollupModel.objects.iterator() if (rollup.bucket in squares)]
+    for rollup in rollups:
+        rollup.squares = squares[rollup.bucket]
+    MinuteRollupModel.objects.bulk_update(rollups, ['squares'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apis', '0007_satellites'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyrollupmodel',
+            name='squares',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='hourlyrollupmodel',
+            name='squares',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='minuterollupmodel',
+            name='squares',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.RunPython(fill_squares, migrations.RunPython.noop),
+    ]
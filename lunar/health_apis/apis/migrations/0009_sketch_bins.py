@@ -0,0 +1,49 @@
+# Generated by Django 5.0.4 on 2026-10-18 10:04
+
+from collections import Counter
+from django.conf import settings
+from django.db import migrations, models
+
+import math
+
+
+def fill_sketches(apps, schema_editor):
+    """Sketches the altitudes of the primary satellite that are still stored, per hour.
+
+        The bins are computed like apis.sketch.DDSketch does, older hours have no sketch.
+    """
+    AltitudeModel = apps.get_model('apis', 'AltitudeModel')
+    SketchBinModel = apps.get_model('apis', 'SketchBinModel')
+    accuracy = settings.ALTITUDE_SKETCH_ACCURACY
+    log_gamma = math.log((1 + accuracy) / (1 - accuracy))
+
+    bins = Counter()
+    for date, altitude in AltitudeModel.objects.filter(satellite_id=1).values_list('date', 'altitude').iterator():
+        key = math.ceil(math.log(altitude) / log_gamma) if (altitude > 0) else -2 ** 31
+        bins[(date.replace(minute=0, second=0, microsecond=0), key)] += 1
+    SketchBinModel.objects.bulk_create(
+        [SketchBinModel(bucket=bucket, bin=key, count=count) for (bucket, key), count in bins.items()], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apis', '0008_rollup_squares'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SketchBinModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('bin', models.IntegerField()),
+                ('count', models.IntegerField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='sketchbinmodel',
+            constraint=models.UniqueConstraint(fields=('bucket', 'bin'), name='unique_sketch_bin'),
+        ),
+        migrations.RunPython(fill_sketches, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-18 10:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apis', '0009_sketch_bins'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='healthmodel',
+            name='updated',
+            field=models.DateTimeField(),
+        ),
+    ]
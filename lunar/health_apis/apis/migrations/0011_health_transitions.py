@@ -0,0 +1,39 @@
+# Generated by Django 5.0.4 on 2026-10-18 10:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def log_current_health(apps, schema_editor):
+    """Starts the log of every satellite with its current health, dated when it was last changed."""
+    HealthModel = apps.get_model('apis', 'HealthModel')
+    HealthTransitionModel = apps.get_model('apis', 'HealthTransitionModel')
+    HealthTransitionModel.objects.bulk_create([
+        HealthTransitionModel(satellite_id=health.satellite_id, date=health.updated, low_altitude=health.low_altitude,
+                              message=health.message)
+        for health in HealthModel.objects.all()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apis', '0010_healthmodel_updated_clock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HealthTransitionModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField()),
+                ('low_altitude', models.BooleanField()),
+                ('message', models.TextField()),
+                ('satellite', models.ForeignKey(default=1, on_delete=django.db.models.deletion.CASCADE, related_name='health_transitions', to='apis.satellite')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['satellite', 'date', 'id'], name='health_transition_keyset')],
+            },
+        ),
+        migrations.RunPython(log_current_health, migrations.RunPython.noop),
+    ]
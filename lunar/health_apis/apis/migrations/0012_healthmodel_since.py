@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apis', '0011_health_transitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthmodel',
+            name='since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
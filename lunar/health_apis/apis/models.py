@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import connection, models
+from django.db.models import F, FloatField, Func, Q, Sum, Value, Window
+from django.db.models.functions import Coalesce, Greatest, Lead, Least, Round
 from enum import Enum
+from . import clock
 
 
 class HealthMessage(Enum):
@@ -8,11 +11,200 @@ class HealthMessage(Enum):
     OKAY = "Altitude is A-OK"
 
 
+# the satellite the project tracked before it tracked a fleet, created by the 0007 migration
+# with the url in settings.SATELLITE_URL. The rollup tiers, the rolling aggregator and the
+# history, export and stream endpoints cover this satellite only.
+PRIMARY_SATELLITE = 1
+
+
+class Satellite(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    url = models.URLField()
+
+
 class HealthModel(models.Model):
+    satellite = models.OneToOneField(Satellite, on_delete=models.CASCADE, default=PRIMARY_SATELLITE,
+                                     related_name='health')
     low_altitude = models.BooleanField(default=False)
     message = models.TextField(default=HealthMessage.OKAY.value)
+    updated = models.DateTimeField()
+    # date of the sample that set the message, None when check_altitude set it from the window it averaged
+    since = models.DateTimeField(null=True, blank=True)
+
+    def save(self, *args, **kwargs):
+        # like auto_now, but from the clock of the process, so a replay dates the health in simulated time
+        self.updated = clock.now()
+        super().save(*args, **kwargs)
+
+
+class Epoch(Func):
+    """Seconds since the epoch of a datetime expression, from the native functions of the database.
+
+        Subtracting datetimes in the ORM calls a Python function per row on SQLite.
+    """
+    function = 'UNIX_TIMESTAMP'
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='((julianday(%(expressions)s) - 2440587.5) * 86400.0)',
+                           **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='EXTRACT(EPOCH FROM %(expressions)s)', **extra_context)
+
+
+class HealthTransitionManager(models.Manager):
+    def after(self, satellite_id, cursor=None):
+        """Returns the transitions of a satellite in (date, id) order, after the (date, id) cursor when one is given.
+
+            The rows are found with the (satellite, date, id) index, so a page costs the same however deep it is.
+        """
+        transitions = self.filter(satellite_id=satellite_id).order_by('date', 'id')
+        if (cursor is not None):
+            date, pk = cursor
+            # date >= lets the index seek to the cursor, the OR alone would make it scan from the first transition
+            transitions = transitions.filter(Q(date__gt=date) | Q(id__gt=pk), date__gte=date)
+        return transitions
+
+    def durations(self, satellite_id, start, end):
+        """Adds up how long a satellite had each health message between start and end, in the database.
+
+            Every transition lasts until the next one, LEAD pairs them up and the sums are clamped to the range.
+
+            Returns:
+                durations: dict of the seconds spent in each message, keyed by the HealthMessage name in lower case
+        """
+        # the transition in effect at start, the ones before it ended before the range
+        first = self.filter(satellite_id=satellite_id, date__lte=start).order_by('-date', '-id').values_list(
+            'date', flat=True).first()
+        transitions = self.filter(satellite_id=satellite_id, date__gte=first or start, date__lt=end).annotate(
+            until=Window(Lead('date'), order_by=[F('date'), F('id')]),
+            # to the millisecond, so the float error of the epochs does not add up over many rows
+            duration=Round(Epoch(Least(Coalesce('until', Value(end)), Value(end))) - Epoch(Greatest('date', Value(start))),
+                           precision=3),
+        )
+        sums = transitions.aggregate(**{message.name.lower(): Sum('duration', filter=Q(message=message.value))
+                                        for message in HealthMessage})
+        return {name: round(seconds or 0, 3) for name, seconds in sums.items()}
+
+
+class HealthTransitionModel(models.Model):
+    """Append-only log of the health of a satellite, a row is added whenever the message of its HealthModel changes."""
+    satellite = models.ForeignKey(Satellite, on_delete=models.CASCADE, default=PRIMARY_SATELLITE,
+                                  related_name='health_transitions')
+    date = models.DateTimeField()
+    low_altitude = models.BooleanField()
+    message = models.TextField()
+
+    objects = HealthTransitionManager()
+
+    class Meta:
+        indexes = [models.Index(fields=['satellite', 'date', 'id'], name='health_transition_keyset')]
+
+
+class AltitudeManager(models.Manager):
+    def _insert_sql(self):
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        return (f'INSERT INTO {table} (satellite_id, altitude, date) VALUES (%s, %s, %s) '
+                'ON CONFLICT (satellite_id, date) DO NOTHING')
+
+    def insert(self, date, altitude, satellite_id=PRIMARY_SATELLITE):
+        """Inserts a sample in a single statement unless the satellite has a sample with the same date.
+
+            No post_save signal is sent.
+
+            Returns:
+                created: boolean
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(self._insert_sql(), [satellite_id, altitude, connection.ops.adapt_datetimefield_value(date)])
+            return cursor.rowcount == 1
+
+    def bulk_insert(self, samples, satellite_id=PRIMARY_SATELLITE):
+        """Inserts (date, altitude) samples of a satellite with a single executemany, without building model instances.
+
+            Dates that already exist are skipped. Like bulk_create, no post_save signals are sent.
+        """
+        adapt = connection.ops.adapt_datetimefield_value
+        with connection.cursor() as cursor:
+            cursor.executemany(self._insert_sql(), [(satellite_id, altitude, adapt(date)) for date, altitude in samples])
 
 
 class AltitudeModel(models.Model):
+    satellite = models.ForeignKey(Satellite, on_delete=models.CASCADE, default=PRIMARY_SATELLITE,
+                                  related_name='altitudes')
     altitude = models.FloatField()
-    date = models.DateTimeField()
+    date = models.DateTimeField(db_index=True)
+
+    objects = AltitudeManager()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['satellite', 'date'], name='unique_satellite_date')]
+
+
+class RollupManager(models.Manager):
+    def bulk_upsert(self, rollups):
+        """Writes (bucket, count, total, minimum, maximum, squares) rollups with a single executemany,
+            replacing the rollups that already exist for those buckets.
+        """
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        adapt = connection.ops.adapt_datetimefield_value
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {table} (bucket, count, total, minimum, maximum, squares) VALUES (%s, %s, %s, %s, %s, %s) '
+                'ON CONFLICT (bucket) DO UPDATE SET count = excluded.count, total = excluded.total, '
+                'minimum = excluded.minimum, maximum = excluded.maximum, squares = excluded.squares',
+                [(adapt(bucket), count, total, minimum, maximum, squares)
+                 for bucket, count, total, minimum, maximum, squares in rollups])
+
+
+class RollupModel(models.Model):
+    """Count, sum, minimum, maximum and sum of squares of the altitudes within one time bucket."""
+    bucket = models.DateTimeField(unique=True)
+    count = models.IntegerField()
+    total = models.FloatField()
+    minimum = models.FloatField()
+    maximum = models.FloatField()
+    # for the standard deviation
+    squares = models.FloatField(default=0.0)
+
+    objects = RollupManager()
+
+    class Meta:
+        abstract = True
+
+
+class MinuteRollupModel(RollupModel):
+    """Rollup of the AltitudeModel rows within one minute, updated on every insert."""
+
+
+class HourlyRollupModel(RollupModel):
+    """Rollup of one hour, compacted from MinuteRollupModel by the retention task."""
+
+
+class DailyRollupModel(RollupModel):
+    """Rollup of one day, compacted from HourlyRollupModel by the retention task."""
+
+
+class SketchBinManager(models.Manager):
+    def bulk_add(self, bins):
+        """Adds (bucket, bin, count) counts to the stored bins with a single executemany, creating the bins that do not exist."""
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        adapt = connection.ops.adapt_datetimefield_value
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {table} (bucket, bin, count) VALUES (%s, %s, %s) '
+                f'ON CONFLICT (bucket, bin) DO UPDATE SET count = {table}.count + excluded.count',
+                [(adapt(bucket), bin, count) for bucket, bin, count in bins])
+
+
+class SketchBinModel(models.Model):
+    """Number of the altitudes of the primary satellite within one hour that fall in one bin of its percentile sketch (apis/sketch.py)."""
+    bucket = models.DateTimeField()
+    bin = models.IntegerField()
+    count = models.IntegerField()
+
+    objects = SketchBinManager()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['bucket', 'bin'], name='unique_sketch_bin')]
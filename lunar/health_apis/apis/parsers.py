@@ -0,0 +1,27 @@
+# parsers.py
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class MessagePackParser(BaseParser):
+    """Parses MessagePack request bodies, requires msgpack.
+
+        Timestamps (the msgpack timestamp extension) are unpacked as aware datetimes.
+    """
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), timestamp=3)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as error:
+            raise ParseError(f'MessagePack parse error - {error}')
+
+
+# parsers of POST /altitudes/, MessagePack only when msgpack is installed
+INGEST_PARSERS = [JSONParser] + ([MessagePackParser] if (msgpack is not None) else [])
@@ -0,0 +1,203 @@
+# poller.py
+
+from collections import deque
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, transaction
+from .samples import parse_sample
+from . import client, ingest, metrics
+
+import logging
+import statistics
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# cache key of the poller leader lease
+LEADER_KEY = 'altitude-poller-leader'
+
+
+class CadenceEstimator:
+    """Learns how often the satellite api updates last_updated, and when the next update can be fetched.
+
+        The interval is the median of the recent last_updated deltas, so a missed update, which shows
+        up as one doubled delta, does not move it.
+
+        The publish delay, from last_updated until the update can be fetched, also covers the clock
+        difference with the api. Fetches that got an update bound it from above, fetches that were
+        too early bound it from below, and the next fetch is aimed between both bounds until they
+        are less than margin apart.
+    """
+
+    def __init__(self, history, margin):
+        self.margin = margin
+        self.deltas = deque(maxlen=history)
+        self.late = deque(maxlen=history)
+        self.early = deque(maxlen=history)
+        self.last_updated = None
+
+    @property
+    def interval(self):
+        """Seconds between two updates, or None until two updates were seen."""
+        if (not self.deltas):
+            return None
+        return statistics.median(self.deltas)
+
+    @property
+    def expected(self):
+        """Timestamp of the last_updated of the next update, or None while the cadence is unknown."""
+        if (self.interval is None):
+            return None
+        return self.last_updated + self.interval
+
+    @property
+    def publish_delay(self):
+        """Seconds after its last_updated that an update can surely be fetched, or None before the first one."""
+        if (not self.late):
+            return None
+        return min(self.late)
+
+    def observe(self, last_updated, fetched_at):
+        """Records the last_updated date of a new sample fetched at the fetched_at timestamp."""
+        updated_at = last_updated.timestamp()
+        if (self.last_updated is not None and updated_at > self.last_updated):
+            self.deltas.append(updated_at - self.last_updated)
+        if (self.last_updated is None or updated_at > self.last_updated):
+            self.last_updated = updated_at
+        self.late.append(fetched_at - updated_at)
+
+    def observe_miss(self, fetched_at):
+        """Records a fetch that did not get the expected update yet."""
+        if (self.expected is not None and fetched_at - self.expected < self.publish_delay):
+            self.early.append(fetched_at - self.expected)
+
+    def next_update(self):
+        """Timestamp to fetch the next update at, or None while the cadence is unknown."""
+        if (self.expected is None):
+            return None
+        upper = self.publish_delay
+        lower = max((delay for delay in self.early if delay < upper), default=upper - 2 * self.margin)
+        if (upper - lower <= self.margin):
+            return self.expected + upper
+        return self.expected + (lower + upper) / 2
+
+
+class Leader:
+    """Leader election through a lease in the shared cache, so only one poller fetches at a time.
+
+        The lease expires on its own if the leader dies, another poller then takes over.
+    """
+
+    def __init__(self, lease):
+        self.lease = lease
+        self.token = uuid.uuid4().hex
+
+    def acquire(self):
+        """Takes or renews the lease, returns whether this poller is the leader."""
+        if (cache.add(LEADER_KEY, self.token, self.lease)):
+            return True
+        # renewing is a read then a touch, the lease is long enough that it cannot expire in between
+        return cache.get(LEADER_KEY) == self.token and cache.touch(LEADER_KEY, self.lease)
+
+    def release(self):
+        if (cache.get(LEADER_KEY) == self.token):
+            cache.delete(LEADER_KEY)
+
+
+class Poller:
+    """Fetches altitudes just after the satellite api is expected to update them.
+
+        While the api keeps returning the sample it already returned, or nothing at all,
+        the poller backs off exponentially from min_interval up to max_interval. A poll that got garbage
+        from the api or could not store its sample counts as one that got nothing, so the poller keeps going.
+
+        clock is time.time unless a test replaces it, and sleep waits until stop is called by default.
+    """
+
+    def __init__(self, options, clock=time.time, sleep=None):
+        if (options['LEASE'] <= options['MAX_INTERVAL']):
+            raise ImproperlyConfigured('The poller LEASE has to be longer than its MAX_INTERVAL')
+        self.min_interval = options['MIN_INTERVAL']
+        self.max_interval = options['MAX_INTERVAL']
+        self.estimator = CadenceEstimator(options['HISTORY'], options['MARGIN'])
+        self.leader = Leader(options['LEASE'])
+        self.clock = clock
+        self._stopped = threading.Event()
+        self.sleep = sleep or self._stopped.wait
+        self.misses = 0
+        self.fetches = 0
+        self.stored = 0
+        self.errors = 0
+
+    def poll(self):
+        """Fetches and stores the latest sample.
+
+            Returns:
+                created: boolean, whether a new altitude was stored
+        """
+        self.fetches += 1
+        fetched_at = self.clock()
+        satellite_client = client.get_client()
+        try:
+            data = satellite_client.fetch()
+        except ValueError:
+            logger.warning('Invalid JSON from %s', satellite_client.url)
+            data = None
+        created = False
+        if (data):
+            try:
+                altitude, date = parse_sample(data)
+                with transaction.atomic():
+                    created = ingest.store_sample(date, altitude)
+            except (KeyError, TypeError, ValueError):
+                logger.warning('Invalid sample from the satellite api: %r', data)
+            except DatabaseError:
+                # a locked or unreachable database is retried with the next poll
+                self.errors += 1
+                metrics.INGEST_SAMPLES.inc(result='failed')
+                logger.exception('Could not store the sample from the satellite api')
+
+        if (created):
+            self.stored += 1
+            self.estimator.observe(date, fetched_at)
+        else:
+            self.estimator.observe_miss(fetched_at)
+        return created
+
+    def delay(self, created):
+        """Seconds to wait before the next poll, after a poll that did or did not store a new sample."""
+        now = self.clock()
+        if (created):
+            self.misses = 0
+            next_update = self.estimator.next_update()
+            if (next_update is None):
+                return self.min_interval
+            return min(max(next_update - now, 0), self.max_interval)
+
+        # a fetch aimed too early is retried when the update can surely be fetched
+        self.misses += 1
+        if (self.misses == 1 and self.estimator.expected is not None):
+            retry = self.estimator.expected + self.estimator.publish_delay - now
+            if (retry > 0):
+                return min(retry, self.max_interval)
+        return min(self.min_interval * 2 ** (self.misses - 1), self.max_interval)
+
+    def run(self, iterations=None):
+        """Polls until stop is called, or for a number of iterations."""
+        try:
+            while (not self._stopped.is_set() and iterations != 0):
+                if (iterations is not None):
+                    iterations -= 1
+                if (not self.leader.acquire()):
+                    # another poller is the leader, check again before its lease runs out
+                    self.sleep(self.leader.lease / 2)
+                    continue
+                self.sleep(self.delay(self.poll()))
+        finally:
+            self.leader.release()
+
+    def stop(self):
+        """Stops run after the current poll, from another thread or a signal handler."""
+        self._stopped.set()
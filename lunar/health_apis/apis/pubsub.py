@@ -0,0 +1,158 @@
+# pubsub.py
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+import asyncio
+import json
+import logging
+import redis
+import redis.asyncio
+import threading
+
+logger = logging.getLogger(__name__)
+
+# channel of the HealthModel changes of the primary satellite, see snapshots.publish_health
+HEALTH_CHANNEL = 'health'
+
+
+class PubSub:
+    """Publish/subscribe between the celery worker and the web processes, configured with settings.PUBSUB.
+
+        A backend only has to bring each message into the process once, the subscribers of a
+        process each get their own asyncio.Queue filled from it. Hundreds of streaming clients
+        therefore share a single connection to the broker.
+
+        Messages are dicts that can be serialized to JSON.
+    """
+
+    def __init__(self, params):
+        self.params = params
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._listeners = {}
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    async def _listen(self, channel, ready):
+        """Brings the messages of channel into the process until cancelled, sets ready once subscribed."""
+        ready.set()
+
+    def _deliver(self, channel, message):
+        """Hands a message to every subscriber of channel in this process, from any thread."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+
+    async def _run(self, channel, ready):
+        try:
+            await self._listen(channel, ready)
+        except Exception:
+            logger.exception('Lost the subscription to %s', channel)
+            # the next subscriber starts a new listener
+            with self._lock:
+                if (self._listeners.get(channel, (None,))[0] is asyncio.current_task()):
+                    del self._listeners[channel]
+            # None tells the subscribers to stop, so their clients reconnect
+            ready.set()
+            self._deliver(channel, None)
+
+    def subscribe(self, channel):
+        """Returns an async context manager that yields an asyncio.Queue receiving the messages published to channel.
+
+            The subscription is in place when the queue is yielded. A None message means the
+            subscription was lost and no more messages will arrive.
+        """
+        return Subscription(self, channel)
+
+
+class Subscription:
+    """Async context manager of PubSub.subscribe.
+
+        Not an asynccontextmanager generator, which the event loop could finalize on its own before
+        the streaming response generator that uses it, and then fail to close the subscription.
+    """
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.subscriber = None
+        self.listener = None
+
+    async def __aenter__(self):
+        broker = self.broker
+        self.subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with broker._lock:
+            broker._subscribers.setdefault(self.channel, set()).add(self.subscriber)
+            if (self.channel not in broker._listeners):
+                ready = asyncio.Event()
+                broker._listeners[self.channel] = (asyncio.create_task(broker._run(self.channel, ready)), ready)
+            self.listener, ready = broker._listeners[self.channel]
+
+        try:
+            await ready.wait()
+        except BaseException:
+            self._unsubscribe()
+            raise
+        return self.subscriber[1]
+
+    async def __aexit__(self, *exc_info):
+        self._unsubscribe()
+
+    def _unsubscribe(self):
+        broker = self.broker
+        with broker._lock:
+            broker._subscribers[self.channel].discard(self.subscriber)
+            if (not broker._subscribers[self.channel]):
+                del broker._subscribers[self.channel]
+                if (broker._listeners.get(self.channel, (None,))[0] is self.listener):
+                    del broker._listeners[self.channel]
+                self.listener.cancel()
+
+
+class MemoryPubSub(PubSub):
+    """Delivers messages within the process, for tests and a single process deployment."""
+
+    def publish(self, channel, message):
+        self._deliver(channel, json.loads(json.dumps(message)))
+
+
+class RedisPubSub(PubSub):
+    """Redis pub/sub, LOCATION is the url of the redis server."""
+
+    def __init__(self, params):
+        super().__init__(params)
+        self._client = None
+
+    def publish(self, channel, message):
+        if (self._client is None):
+            self._client = redis.Redis.from_url(self.params['LOCATION'])
+        self._client.publish(channel, json.dumps(message))
+
+    async def _listen(self, channel, ready):
+        client = redis.asyncio.Redis.from_url(self.params['LOCATION'])
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(channel)
+            # wait for the confirmation, messages published after it are not missed
+            await pubsub.get_message(timeout=None)
+            ready.set()
+            async for item in pubsub.listen():
+                if (item['type'] == 'message'):
+                    self._deliver(channel, json.loads(item['data']))
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+
+_pubsub = None
+
+
+def get_pubsub():
+    """Returns the PubSub backend of settings.PUBSUB, shared by the whole process."""
+    global _pubsub
+    if (_pubsub is None):
+        _pubsub = import_string(settings.PUBSUB['BACKEND'])(settings.PUBSUB)
+    return _pubsub
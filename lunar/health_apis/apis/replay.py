@@ -0,0 +1,101 @@
+# replay.py
+
+from datetime import timedelta
+from django.db import transaction
+from django.test.utils import override_settings
+from .benchmarks import BENCH_SETTINGS, invalidate_caches, run_commit_callbacks
+from .clock import SimulatedClock
+from .models import HealthTransitionModel, Satellite
+from . import clock, ingest, tasks
+
+import time
+
+# how often celery beat runs check_altitude, see health_apis/celery.py
+CHECK_INTERVAL = timedelta(minutes=1)
+
+# like the benchmarks, the replay is rolled back and publishes its snapshots to a cache of its own
+REPLAY_SETTINGS = BENCH_SETTINGS
+
+
+class Replay:
+    """Feeds recorded (date, altitude) samples through ingest and the health evaluation of a temporary satellite.
+
+        Every sample is stored like get_altitudes stores a fetched one, with the simulated clock at its
+        date, and check_altitude runs every check_interval of simulated time like celery beat runs it.
+        The timeline is read from the HealthTransitionModel log of the satellite before the rollback.
+    """
+
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.clock = None
+        self.satellite_id = None
+        self.first = self.next_check = None
+        self.timeline = []
+        self.durations = {}
+        self.samples = self.created = 0
+
+    def _check(self, until):
+        """Runs the check_altitude passes celery beat would have run up to until."""
+        while (self.next_check <= until):
+            self.clock.set(self.next_check)
+            tasks.check_altitude()
+            run_commit_callbacks(0)
+            self.next_check += self.check_interval
+
+    def _push(self, date, altitude):
+        if (self.first is None):
+            self.first = date
+            self.clock.set(date)
+            self.next_check = date + self.check_interval
+        self._check(date)
+        # out of order samples do not move the clock back
+        self.clock.set(max(date, self.clock.now()))
+        with transaction.atomic():
+            self.created += ingest.store_sample(date, altitude, self.satellite_id)
+        run_commit_callbacks(0)
+        self.samples += 1
+
+    def run(self, samples):
+        """Replays the samples, as fast as they are processed, and rolls the database back afterwards.
+
+            Returns:
+                result: dict of the timeline with the duration of every transition, the seconds spent in each
+                message, the replayed and created samples, the simulated and elapsed seconds and the throughput
+        """
+        started = time.perf_counter()
+        with override_settings(**REPLAY_SETTINGS):
+            try:
+                with transaction.atomic(), clock.use(SimulatedClock(None)) as self.clock:
+                    self.satellite_id = Satellite.objects.create(
+                        name=f'replay-{time.time_ns()}', url='http://replay.invalid/').pk
+                    for date, altitude in samples:
+                        self._push(date, altitude)
+                    transitions = HealthTransitionModel.objects.after(self.satellite_id)
+                    self.timeline = list(transitions.values('date', 'low_altitude', 'message'))
+                    if (self.first is not None):
+                        self.durations = HealthTransitionModel.objects.durations(
+                            self.satellite_id, self.first, self.clock.now())
+                    transaction.set_rollback(True)
+            finally:
+                # the id of the rolled back satellite can be handed out again
+                invalidate_caches()
+        return self._result(time.perf_counter() - started)
+
+    def _result(self, elapsed):
+        end = self.clock.now() if (self.first) else None
+        timeline = []
+        for index, change in enumerate(self.timeline):
+            until = self.timeline[index + 1]['date'] if (index + 1 < len(self.timeline)) else end
+            timeline.append(dict(change, date=change['date'].isoformat(),
+                                 seconds=(until - change['date']).total_seconds()))
+        simulated = (end - self.first).total_seconds() if (self.first) else 0
+        return {
+            'samples': self.samples,
+            'created': self.created,
+            'simulated_seconds': simulated,
+            'elapsed_seconds': elapsed,
+            'throughput': self.samples / elapsed if (elapsed) else 0,
+            'speedup': simulated / elapsed if (elapsed) else 0,
+            'timeline': timeline,
+            'seconds': self.durations,
+        }
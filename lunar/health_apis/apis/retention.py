@@ -0,0 +1,88 @@
+# retention.py
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Q
+from .models import PRIMARY_SATELLITE, AltitudeModel, Satellite, SketchBinModel
+from .store import get_store
+from . import rollups
+
+
+def _delete_before(model, field, cutoff, *conditions, **filters):
+    """Deletes the rows of model older than cutoff, and matching conditions and filters, in batches of settings.ALTITUDE_RETENTION_BATCH_SIZE.
+
+        Every batch commits on its own so no write lock is held for long.
+
+        Returns:
+            deleted: number of deleted rows
+    """
+    deleted = 0
+    while (True):
+        with transaction.atomic():
+            ids = list(model.objects.filter(*conditions, **filters, **{f'{field}__lt': cutoff}).order_by(
+                field).values_list('id', flat=True)[:settings.ALTITUDE_RETENTION_BATCH_SIZE])
+            if (not ids):
+                return deleted
+            model.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+
+
+def compact(now):
+    """Compacts old altitudes into the hourly and daily tiers and deletes what is past retention.
+
+        Raw altitudes older than settings.ALTITUDE_RETENTION['raw'] are rolled up into whole hours and days
+        before they are deleted. The per minute rollups they were already counted in are kept until
+        their own retention period runs out. Only the primary satellite has rollups, the raw altitudes
+        of the other satellites are their only history and are deleted once older than
+        settings.ALTITUDE_RETENTION['fleet'].
+
+        Returns:
+            deleted: dict with the number of deleted rows per tier
+    """
+    retention = settings.ALTITUDE_RETENTION
+    if (retention['raw'] is None):
+        raise ImproperlyConfigured("ALTITUDE_RETENTION['raw'] must be set")
+    if (retention['fleet'] is None):
+        raise ImproperlyConfigured("ALTITUDE_RETENTION['fleet'] must be set")
+
+    # every tier is compacted from the finer one, which has to be kept at least as long
+    periods = [retention['raw']] + [retention[tier.name] for tier in rollups.TIERS]
+    for finer, coarser in zip(periods, periods[1:]):
+        if (coarser is not None and (finer is None or coarser < finer)):
+            raise ImproperlyConfigured('ALTITUDE_RETENTION periods must not get shorter for coarser tiers')
+    raw_cutoff = now - retention['raw']
+
+    # start again from the newest bucket of each tier so altitudes that arrived late are included
+    for tier in rollups.TIERS[1:]:
+        with transaction.atomic():
+            newest = tier.covered_until()
+            source = rollups.TIERS[rollups.TIERS.index(tier) - 1]
+            start = newest - tier.period if newest else source.model.objects.order_by(
+                'bucket').values_list('bucket', flat=True).first()
+            if (start is not None):
+                rollups.compact(tier, start, raw_cutoff)
+
+    # raw altitudes of the primary satellite are always counted in the per minute rollups
+    deleted = {'raw': _delete_before(AltitudeModel, 'date', raw_cutoff, satellite_id=PRIMARY_SATELLITE)}
+    get_store().delete_before(raw_cutoff, PRIMARY_SATELLITE)
+    # the other satellites have no rollups, their raw altitudes are kept for a period of their own
+    fleet_cutoff = now - retention['fleet']
+    deleted['fleet'] = _delete_before(AltitudeModel, 'date', fleet_cutoff, ~Q(satellite_id=PRIMARY_SATELLITE))
+    for satellite_id in Satellite.objects.exclude(id=PRIMARY_SATELLITE).values_list('id', flat=True).iterator():
+        get_store().delete_before(fleet_cutoff, satellite_id)
+    for tier, coarser in zip(rollups.TIERS, rollups.TIERS[1:] + [None]):
+        if (retention[tier.name] is None):
+            continue
+        # never delete rollups the coarser tier does not cover yet
+        cutoff = now - retention[tier.name]
+        if (coarser is not None):
+            covered_until = coarser.covered_until()
+            if (covered_until is None):
+                continue
+            cutoff = min(cutoff, covered_until)
+        deleted[tier.name] = _delete_before(tier.model, 'bucket', cutoff)
+        # the hourly sketches are kept as long as the hourly rollups
+        if (tier is rollups.HOUR_TIER):
+            deleted['sketch'] = _delete_before(SketchBinModel, 'bucket', cutoff)
+    return deleted
@@ -0,0 +1,452 @@
+# rollups.py
+
+from dataclasses import dataclass
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Greatest, Least, TruncDay, TruncHour, TruncMinute
+from .models import PRIMARY_SATELLITE, AltitudeModel, DailyRollupModel, HourlyRollupModel, MinuteRollupModel
+from . import sketch
+
+import math
+
+MINUTE = timedelta(minutes=1)
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+
+@dataclass
+class Summary:
+    """Count, sum, minimum, maximum and sum of squares of a set of altitudes."""
+    count: int = 0
+    total: float = 0.0
+    minimum: float = None
+    maximum: float = None
+    squares: float = 0.0
+
+    @property
+    def average(self):
+        if (self.count == 0):
+            return None
+        return self.total / self.count
+
+    @property
+    def stddev(self):
+        """The population standard deviation of the altitudes."""
+        if (self.count == 0):
+            return None
+        # rounding can take the variance of equal altitudes just under zero
+        return math.sqrt(max(self.squares / self.count - self.average ** 2, 0.0))
+
+    def merge(self, other):
+        """Returns the summary of the altitudes of both summaries."""
+        if (other.count == 0):
+            return self
+        if (self.count == 0):
+            return other
+        return Summary(
+            self.count + other.count,
+            self.total + other.total,
+            min(self.minimum, other.minimum),
+            max(self.maximum, other.maximum),
+            self.squares + other.squares
+        )
+
+    def as_stats(self):
+        """Returns the summary in the format of the /stats/ endpoint."""
+        return {'minimum': self.minimum, 'maximum': self.maximum, 'average': self.average}
+
+
+def _altitudes(**filters):
+    """Returns the AltitudeModel rows of the primary satellite, the only one the rollups cover."""
+    return AltitudeModel.objects.filter(satellite_id=PRIMARY_SATELLITE, **filters)
+
+
+def _summary(aggregate):
+    # Sum() gives None instead of 0 when no rows match
+    if (not aggregate['count']):
+        return Summary()
+    return Summary(aggregate['count'], aggregate['total'], aggregate['minimum'], aggregate['maximum'], aggregate['squares'])
+
+
+def _rollup_aggregates(filter=None):
+    return {'count': Sum('count', filter=filter), 'total': Sum('total', filter=filter),
+            'minimum': Min('minimum', filter=filter), 'maximum': Max('maximum', filter=filter),
+            'squares': Sum('squares', filter=filter)}
+
+
+def _altitude_aggregates(filter=None):
+    return {'count': Count('id', filter=filter), 'total': Sum('altitude', filter=filter),
+            'minimum': Min('altitude', filter=filter), 'maximum': Max('altitude', filter=filter),
+            'squares': Sum(F('altitude') * F('altitude'), filter=filter)}
+
+
+def _aggregate_rollups(queryset):
+    return _summary(queryset.aggregate(**_rollup_aggregates()))
+
+
+def _aggregate_altitudes(queryset):
+    return _summary(queryset.aggregate(**_altitude_aggregates()))
+
+
+async def _aaggregate_rollups(queryset):
+    return _summary(await queryset.aaggregate(**_rollup_aggregates()))
+
+
+async def _aaggregate_altitudes(queryset):
+    return _summary(await queryset.aaggregate(**_altitude_aggregates()))
+
+
+@dataclass(frozen=True)
+class Tier:
+    """A resolution of altitude rollups, from the per minute rollups to the daily ones."""
+    name: str
+    model: type
+    period: timedelta
+    trunc: type
+
+    def floor(self, date):
+        """Returns the start of the bucket containing date."""
+        date = date.replace(second=0, microsecond=0)
+        if (self.period >= HOUR):
+            date = date.replace(minute=0)
+        if (self.period >= DAY):
+            date = date.replace(hour=0)
+        return date
+
+    def ceil(self, date):
+        """Returns the first bucket boundary at or after date."""
+        bucket = self.floor(date)
+        if (bucket < date):
+            bucket += self.period
+        return bucket
+
+    def covered_until(self):
+        """Returns the end of the newest bucket, None when the tier has no rollups."""
+        newest = self.model.objects.aggregate(newest=Max('bucket'))['newest']
+        if (newest is None):
+            return None
+        return newest + self.period
+
+
+MINUTE_TIER = Tier('minute', MinuteRollupModel, MINUTE, TruncMinute)
+HOUR_TIER = Tier('hour', HourlyRollupModel, HOUR, TruncHour)
+DAY_TIER = Tier('day', DailyRollupModel, DAY, TruncDay)
+
+# from the finest to the coarsest tier, every tier is compacted from the one before it
+TIERS = [MINUTE_TIER, HOUR_TIER, DAY_TIER]
+
+
+def minute_bucket(date):
+    """Returns the start of the minute containing date."""
+    return date.replace(second=0, microsecond=0)
+
+
+def next_minute_bucket(date):
+    """Returns the first minute boundary at or after date."""
+    bucket = minute_bucket(date)
+    if (bucket < date):
+        bucket += MINUTE
+    return bucket
+
+
+def record_sample(date, altitude):
+    """Adds a sample to the rollup of its minute and the sketch of its hour, must run in the transaction of the insert."""
+    sketch.record_samples([(HOUR_TIER.floor(date), altitude)])
+    bucket = minute_bucket(date)
+    updated = MinuteRollupModel.objects.filter(bucket=bucket).update(
+        count=F('count') + 1,
+        total=F('total') + altitude,
+        minimum=Least('minimum', Value(altitude)),
+        maximum=Greatest('maximum', Value(altitude)),
+        squares=F('squares') + altitude * altitude)
+    if (updated):
+        return
+
+    try:
+        with transaction.atomic():
+            MinuteRollupModel.objects.create(
+                bucket=bucket, count=1, total=altitude, minimum=altitude, maximum=altitude,
+                squares=altitude * altitude)
+    except IntegrityError:
+        # another worker created the bucket after our update, add to it instead
+        record_sample(date, altitude)
+
+
+def _bucketed(samples, floor, period):
+    """Yields the (bucket, altitude) of (date, altitude) samples, flooring a date only when it leaves the bucket before it.
+
+        Samples are mostly sorted by date, so most of them are in the bucket of the one before.
+    """
+    bucket = end = None
+    for date, altitude in samples:
+        if (bucket is None or not (bucket <= date < end)):
+            bucket = floor(date)
+            end = bucket + period
+        yield bucket, altitude
+
+
+def record_samples(samples):
+    """Adds many (date, altitude) samples to the rollups of their minutes, must run in the transaction of the insert.
+
+        The samples are rolled up in Python and merged into the existing rollups with one read and one bulk upsert,
+        and sketched per hour with one more.
+    """
+    samples = list(samples)
+    sketch.record_samples(_bucketed(samples, HOUR_TIER.floor, HOUR))
+    # bucket: [count, total, minimum, maximum, squares]
+    buckets = {}
+    for bucket, altitude in _bucketed(samples, minute_bucket, MINUTE):
+        rollup = buckets.get(bucket)
+        if (rollup is None):
+            buckets[bucket] = [1, altitude, altitude, altitude, altitude * altitude]
+            continue
+        rollup[0] += 1
+        rollup[1] += altitude
+        if (altitude < rollup[2]):
+            rollup[2] = altitude
+        if (altitude > rollup[3]):
+            rollup[3] = altitude
+        rollup[4] += altitude * altitude
+    if (not buckets):
+        return
+
+    existing = MinuteRollupModel.objects.filter(bucket__gte=min(buckets), bucket__lte=max(buckets)).values_list(
+        'bucket', 'count', 'total', 'minimum', 'maximum', 'squares')
+    for bucket, count, total, minimum, maximum, squares in existing.iterator():
+        rollup = buckets.get(bucket)
+        if (rollup is not None):
+            rollup[0] += count
+            rollup[1] += total
+            rollup[2] = min(rollup[2], minimum)
+            rollup[3] = max(rollup[3], maximum)
+            rollup[4] += squares
+
+    MinuteRollupModel.objects.bulk_upsert((bucket, *rollup) for bucket, rollup in buckets.items())
+
+
+def rebuild(start, end):
+    """Recomputes the rollups of every minute from start to end (inclusive) that has AltitudeModel rows.
+
+        The sketches of the hours of those minutes are recomputed as well.
+
+        Returns:
+            buckets: number of rollups written
+    """
+    first, last = HOUR_TIER.floor(start), HOUR_TIER.floor(end) + HOUR
+    sketch.replace(first, last, ((HOUR_TIER.floor(date), altitude) for date, altitude in _altitudes(
+        date__gte=first, date__lt=last).values_list('date', 'altitude').iterator()))
+    rows = _altitudes(date__gte=minute_bucket(start), date__lt=minute_bucket(end) + MINUTE).annotate(
+        bucket=TruncMinute('date')).values('bucket').annotate(**_altitude_aggregates()).order_by('bucket')
+
+    rollups = [MinuteRollupModel(**row) for row in rows]
+    MinuteRollupModel.objects.bulk_create(
+        rollups, batch_size=500, update_conflicts=True, unique_fields=['bucket'],
+        update_fields=['count', 'total', 'minimum', 'maximum', 'squares'])
+    return len(rollups)
+
+
+def window_stats(start):
+    """Summarizes every altitude since start.
+
+        Whole minutes are read from MinuteRollupModel and only the partial first minute
+        is aggregated from AltitudeModel, so a window reads one rollup row per minute.
+
+        Returns:
+            summary: Summary of the altitudes since start
+    """
+    boundary = next_minute_bucket(start)
+
+    summary = _aggregate_rollups(MinuteRollupModel.objects.filter(bucket__gte=boundary))
+
+    if (boundary > start):
+        summary = summary.merge(_aggregate_altitudes(
+            _altitudes(date__gte=start, date__lt=boundary)))
+    return summary
+
+
+def satellite_window_stats(satellite_id, start):
+    """Summarizes every altitude of a satellite since start.
+
+        Only the primary satellite has rollups, so the altitudes are aggregated from AltitudeModel,
+        the unique index on satellite and date limits the read to the rows within the window.
+
+        Returns:
+            summary: Summary of the altitudes since start
+    """
+    return _aggregate_altitudes(AltitudeModel.objects.filter(satellite_id=satellite_id, date__gte=start))
+
+
+def _conditional_summaries(queryset, aggregates, filters):
+    """Aggregates queryset once per filter in a single query.
+
+        Returns:
+            summaries: list of the Summary of the rows matching each filter
+    """
+    row = queryset.aggregate(**{f'{name}_{index}': aggregate for index, filter in enumerate(filters)
+                                for name, aggregate in aggregates(filter).items()})
+    return [_summary({name: row[f'{name}_{index}'] for name in aggregates()}) for index in range(len(filters))]
+
+
+def windows_stats(starts):
+    """Summarizes every altitude since each of starts, with the same queries however many starts there are.
+
+        Like window_stats, whole minutes are read from MinuteRollupModel, with a conditional
+        aggregate per start, and only the partial first minutes from AltitudeModel.
+
+        Returns:
+            summaries: list of the Summary of the altitudes since each start
+    """
+    boundaries = [next_minute_bucket(start) for start in starts]
+    summaries = _conditional_summaries(
+        MinuteRollupModel.objects.filter(bucket__gte=min(boundaries)), _rollup_aggregates,
+        [Q(bucket__gte=boundary) for boundary in boundaries])
+
+    partial = [index for index, (start, boundary) in enumerate(zip(starts, boundaries)) if (boundary > start)]
+    if (partial):
+        partials = _conditional_summaries(
+            _altitudes(date__gte=min(starts), date__lt=max(boundaries)), _altitude_aggregates,
+            [Q(date__gte=starts[index], date__lt=boundaries[index]) for index in partial])
+        for index, summary in zip(partial, partials):
+            summaries[index] = summaries[index].merge(summary)
+    return summaries
+
+
+def satellite_windows_stats(satellite_id, starts):
+    """Summarizes every altitude of a satellite since each of starts, from AltitudeModel in one query.
+
+        Returns:
+            summaries: list of the Summary of the altitudes since each start
+    """
+    return _conditional_summaries(
+        AltitudeModel.objects.filter(satellite_id=satellite_id, date__gte=min(starts)), _altitude_aggregates,
+        [Q(date__gte=start) for start in starts])
+
+
+def windows_sketches(starts):
+    """Sketches every altitude since each of starts.
+
+        Whole hours are merged from the stored sketches in one query, only the altitudes of the
+        partial first hours are read from AltitudeModel, so the work does not grow with the
+        number of altitudes in the windows.
+
+        Returns:
+            sketches: list of the DDSketch of the altitudes since each start
+    """
+    boundaries = [HOUR_TIER.ceil(start) for start in starts]
+    sketches = sketch.window_sketches(boundaries)
+    if (any(boundary > start for start, boundary in zip(starts, boundaries))):
+        rows = _altitudes(date__gte=min(starts), date__lt=max(boundaries)).values_list('date', 'altitude')
+        for date, altitude in rows:
+            for start, boundary, window in zip(starts, boundaries, sketches):
+                if (start <= date < boundary):
+                    window.add(altitude)
+    return sketches
+
+
+async def awindow_stats(start):
+    """Async version of window_stats for the async views."""
+    boundary = next_minute_bucket(start)
+
+    summary = await _aaggregate_rollups(MinuteRollupModel.objects.filter(bucket__gte=boundary))
+
+    if (boundary > start):
+        summary = summary.merge(await _aaggregate_altitudes(
+            _altitudes(date__gte=start, date__lt=boundary)))
+    return summary
+
+
+def compact(tier, start, end):
+    """Recomputes the rollups of tier from start to end out of the next finer tier.
+
+        Only whole buckets are written, start and end are rounded to the tier's buckets.
+
+        Returns:
+            buckets: number of rollups written
+    """
+    source = TIERS[TIERS.index(tier) - 1]
+    rows = source.model.objects.filter(bucket__gte=tier.floor(start), bucket__lt=tier.floor(end)).annotate(
+        period=tier.trunc('bucket')).values('period').annotate(
+        count_sum=Sum('count'), total_sum=Sum('total'), minimum_min=Min('minimum'),
+        maximum_max=Max('maximum'), squares_sum=Sum('squares')).order_by('period')
+
+    rollups = [tier.model(bucket=row['period'], count=row['count_sum'], total=row['total_sum'],
+                          minimum=row['minimum_min'], maximum=row['maximum_max'], squares=row['squares_sum'])
+               for row in rows]
+    tier.model.objects.bulk_create(
+        rollups, batch_size=500, update_conflicts=True, unique_fields=['bucket'],
+        update_fields=['count', 'total', 'minimum', 'maximum', 'squares'])
+    return len(rollups)
+
+
+def range_stats(start, end):
+    """Summarizes every altitude from start up to end.
+
+        The range is split so every part is read from the coarsest tier that covers it,
+        whole days from the daily rollups, the remaining whole hours from the hourly rollups
+        and so on, down to raw AltitudeModel rows for partial minutes at the edges.
+
+        Returns:
+            summary: Summary of the altitudes in the range
+    """
+    return _range_stats(start, end, list(reversed(TIERS)))
+
+
+def _range_stats(start, end, tiers):
+    if (start >= end):
+        return Summary()
+    if (not tiers):
+        return _aggregate_altitudes(_altitudes(date__gte=start, date__lt=end))
+
+    tier, finer = tiers[0], tiers[1:]
+    first = tier.ceil(start)
+    last = tier.floor(end)
+    # the minute tier is kept up to date on insert, coarser tiers only up to the last compaction
+    if (tier is not MINUTE_TIER):
+        covered_until = tier.covered_until()
+        if (covered_until is None):
+            return _range_stats(start, end, finer)
+        last = min(last, covered_until)
+    if (first >= last):
+        return _range_stats(start, end, finer)
+
+    summary = _aggregate_rollups(tier.model.objects.filter(bucket__gte=first, bucket__lt=last))
+    return summary.merge(_range_stats(start, first, finer)).merge(_range_stats(last, end, finer))
+
+
+def series(start, end, bucket):
+    """Summarizes the altitudes from start up to end per bucket of the given tier.
+
+        Every tier at least as fine as the bucket reads the part of the range it covers,
+        oldest data from the coarsest tier, and the buckets are aggregated in the database.
+        Start and end are rounded out to whole buckets.
+
+        Returns:
+            series: list of (bucket, Summary) tuples ordered by bucket, without empty buckets
+    """
+    start = bucket.floor(start)
+    end = bucket.ceil(end)
+    buckets = {}
+    segment_start = start
+    for tier in reversed(TIERS[:TIERS.index(bucket) + 1]):
+        segment_end = end
+        if (tier is not MINUTE_TIER):
+            covered_until = tier.covered_until()
+            if (covered_until is None):
+                continue
+            segment_end = min(end, covered_until)
+        if (segment_end <= segment_start):
+            continue
+
+        rows = tier.model.objects.filter(bucket__gte=segment_start, bucket__lt=segment_end).annotate(
+            period=bucket.trunc('bucket')).values('period').annotate(
+            count_sum=Sum('count'), total_sum=Sum('total'), minimum_min=Min('minimum'),
+            maximum_max=Max('maximum'), squares_sum=Sum('squares')).order_by('period')
+        for row in rows:
+            summary = Summary(row['count_sum'], row['total_sum'], row['minimum_min'], row['maximum_max'],
+                              row['squares_sum'])
+            # a bucket can be split between two tiers at the end of the coarser one
+            buckets[row['period']] = buckets.get(row['period'], Summary()).merge(summary)
+        segment_start = segment_end
+
+    return sorted(buckets.items())
@@ -0,0 +1,24 @@
+# samples.py
+
+from datetime import datetime, timezone
+
+import math
+
+
+def parse_sample(data):
+    """Parses an altitude sample in the format of the satellite api.
+
+        Args:
+            data: dict with the altitude and the ISO 8601 last_updated date
+
+        Returns:
+            sample: tuple of the altitude as a float and the date in UTC
+
+        Raises:
+            KeyError, TypeError or ValueError when the sample is invalid, such as a NaN or infinite altitude
+    """
+    altitude = float(data['altitude'])
+    if (not math.isfinite(altitude)):
+        raise ValueError('altitude must be a finite number')
+    date = datetime.fromisoformat(data['last_updated'])
+    return altitude, date.astimezone(timezone.utc)
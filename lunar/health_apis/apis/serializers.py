@@ -0,0 +1,66 @@
+# serializers.py
+
+from datetime import datetime, timezone
+from django.conf import settings
+from rest_framework import serializers
+from .samples import parse_sample
+
+import math
+
+
+class AltitudeSampleListSerializer(serializers.ListSerializer):
+    """Validates a batch of samples in one pass.
+
+        Every sample is parsed with parse_sample, like the samples fetched from the satellite api,
+        instead of running the fields of the child serializer, which is only used to describe the
+        errors of the invalid samples. The validated data is a list of (date, altitude) tuples.
+    """
+
+    def to_internal_value(self, data):
+        if (not isinstance(data, list)):
+            raise serializers.ValidationError({'non_field_errors': ['Expected a list of samples.']})
+        if (not data):
+            raise serializers.ValidationError({'non_field_errors': ['The batch is empty.']})
+        if (len(data) > settings.INGEST_MAX_BATCH_SIZE):
+            raise serializers.ValidationError(
+                {'non_field_errors': [f'At most {settings.INGEST_MAX_BATCH_SIZE} samples can be sent at once.']})
+
+        samples = []
+        errors = {}
+        for index, item in enumerate(data):
+            try:
+                samples.append(self.child.parse(item))
+            except (AttributeError, KeyError, TypeError, ValueError) as error:
+                errors[index] = self.child.describe(item, error)
+        if (errors):
+            raise serializers.ValidationError([errors.get(index, {}) for index in range(len(data))])
+        return samples
+
+
+class AltitudeSampleSerializer(serializers.Serializer):
+    """A sample in the format of the satellite api, as pushed to POST /altitudes/."""
+    altitude = serializers.FloatField()
+    last_updated = serializers.DateTimeField()
+
+    class Meta:
+        list_serializer_class = AltitudeSampleListSerializer
+
+    def parse(self, item):
+        """Returns the (date, altitude) of a valid sample, msgpack timestamps are taken as dates."""
+        if (not isinstance(item.get('last_updated'), datetime)):
+            altitude, date = parse_sample(item)
+            return date, altitude
+        altitude, date = float(item['altitude']), item['last_updated'].astimezone(timezone.utc)
+        if (not math.isfinite(altitude)):
+            raise ValueError('altitude must be a finite number')
+        return date, altitude
+
+    def describe(self, item, error):
+        """Returns the field errors of an invalid sample."""
+        if (not isinstance(item, dict)):
+            return {'non_field_errors': ['Expected an object with altitude and last_updated.']}
+        try:
+            self.run_validation(item)
+        except serializers.ValidationError as validation:
+            return validation.detail
+        return {'non_field_errors': [str(error)]}
@@ -0,0 +1,93 @@
+# signals.py
+
+from celery.signals import task_failure, task_postrun, task_prerun
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .models import PRIMARY_SATELLITE, AltitudeModel, HealthModel, HealthTransitionModel, Satellite
+from .store import get_store
+from . import aggregator, health, ingest, metrics, rollups, snapshots
+
+import time
+
+# start time and metrics source token of the running tasks, by task id
+_running_tasks = {}
+
+
+@receiver(post_save, sender=AltitudeModel)
+def altitude_saved(sender, instance, created, **kwargs):
+    """Keeps the derived altitude data in sync with AltitudeModel rows saved through the ORM."""
+    if (created):
+        get_store().record_sample(instance.satellite_id, instance.date, instance.altitude)
+    else:
+        get_store().rebuild(instance.satellite_id, instance.date, instance.date)
+
+    # only the primary satellite has rollups and a rolling aggregator
+    if (instance.satellite_id != PRIMARY_SATELLITE):
+        return
+    # an edited sample can change any window, so the aggregator has to be rebuilt
+    if (not created):
+        rollups.rebuild(instance.date, instance.date)
+        aggregator.invalidate()
+        return
+    ingest.record_sample(instance.date, instance.altitude)
+
+
+@receiver(post_delete, sender=Satellite)
+def satellite_deleted(sender, instance, **kwargs):
+    get_store().delete_satellite(instance.pk)
+
+
+@receiver(pre_save, sender=HealthModel)
+def health_saving(sender, instance, **kwargs):
+    """Remembers the stored health message, so health_saved can tell whether the save changed it."""
+    instance._stored_message = HealthModel.objects.filter(pk=instance.pk).values_list(
+        'message', flat=True).first() if instance.pk else None
+
+
+@receiver(post_save, sender=HealthModel)
+def health_saved(sender, instance, **kwargs):
+    """Publishes the new health message, so /health/ never serves the one it replaced.
+
+    Subscribers of the health stream are only notified when the message changed,
+    and only then is the change added to the HealthTransitionModel log.
+    """
+    changed = instance.message != instance._stored_message
+    if (changed):
+        HealthTransitionModel.objects.create(satellite_id=instance.satellite_id, date=instance.updated,
+                                             low_altitude=instance.low_altitude, message=instance.message)
+    snapshots.publish_health(instance, changed)
+    health.invalidate(instance.satellite_id)
+
+
+@receiver(post_delete, sender=HealthModel)
+def health_deleted(sender, instance, **kwargs):
+    snapshots.invalidate_health(instance.satellite_id)
+    health.invalidate(instance.satellite_id)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    """Times the queries of every database connection, a connection that reconnects keeps its wrapper."""
+    if (metrics.time_queries not in connection.execute_wrappers):
+        connection.execute_wrappers.append(metrics.time_queries)
+
+
+@task_prerun.connect
+def task_started(task_id, task, **kwargs):
+    # the queries of the task are attributed to it
+    _running_tasks[task_id] = (time.perf_counter(), metrics.source.set(task.name))
+
+
+@task_postrun.connect
+def task_finished(task_id, task, state, **kwargs):
+    started, token = _running_tasks.pop(task_id, (None, None))
+    if (started is None):
+        return
+    metrics.source.reset(token)
+    metrics.TASK_SECONDS.observe(time.perf_counter() - started, task=task.name, state=state)
+
+
+@task_failure.connect
+def task_failed(sender, **kwargs):
+    metrics.TASK_FAILURES.inc(task=sender.name)
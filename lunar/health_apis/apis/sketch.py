@@ -0,0 +1,92 @@
+# sketch.py
+
+from collections import Counter
+from django.conf import settings
+from django.db.models import Q, Sum
+from .models import SketchBinModel
+
+import math
+
+# bin of the altitudes that are not positive, which have no logarithm
+ZERO_BIN = -2 ** 31
+
+
+class DDSketch:
+    """A mergeable quantile sketch with a relative error bound (DDSketch).
+
+        Altitudes are counted in logarithmic bins, bin i holds the values in (γ^(i-1), γ^i] with
+        γ = (1 + α) / (1 - α), so the value a bin is answered with is within α of every value in it,
+        and a quantile is within α of the altitude of that rank. The number of bins only grows with
+        the logarithm of the range of the altitudes, and sketches of the same accuracy are merged
+        by adding up their bins.
+    """
+
+    def __init__(self, relative_accuracy=None, bins=None):
+        self.relative_accuracy = relative_accuracy or settings.ALTITUDE_SKETCH_ACCURACY
+        self.gamma = (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = Counter(bins or {})
+
+    @property
+    def count(self):
+        return sum(self.bins.values())
+
+    def key(self, value):
+        """Returns the bin of a value."""
+        if (value <= 0):
+            return ZERO_BIN
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def value(self, key):
+        """Returns the value a bin is answered with."""
+        if (key == ZERO_BIN):
+            return 0.0
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value, count=1):
+        self.bins[self.key(value)] += count
+
+    def merge(self, other):
+        self.bins.update(other.bins)
+
+    def quantile(self, q):
+        """Returns the value of quantile q between 0 and 1, None when the sketch is empty."""
+        count = self.count
+        if (count == 0):
+            return None
+        rank = q * (count - 1)
+        cumulative = 0
+        for key in sorted(self.bins):
+            cumulative += self.bins[key]
+            if (cumulative > rank):
+                return self.value(key)
+        return self.value(max(self.bins))
+
+
+def record_samples(samples):
+    """Adds (bucket, altitude) samples to the stored sketches of their buckets, must run in the transaction of the insert."""
+    sketch = DDSketch()
+    bins = Counter((bucket, sketch.key(altitude)) for bucket, altitude in samples)
+    SketchBinModel.objects.bulk_add((bucket, key, count) for (bucket, key), count in bins.items())
+
+
+def replace(start, end, samples):
+    """Replaces the stored sketches of the buckets from start up to end with (bucket, altitude) samples."""
+    SketchBinModel.objects.filter(bucket__gte=start, bucket__lt=end).delete()
+    record_samples(samples)
+
+
+def window_sketches(boundaries):
+    """Merges the stored sketches of the buckets from each of boundaries on, in one query.
+
+        Returns:
+            sketches: list of the DDSketch since each boundary
+    """
+    rows = SketchBinModel.objects.filter(bucket__gte=min(boundaries)).values('bin').annotate(**{
+        f'count_{index}': Sum('count', filter=Q(bucket__gte=boundary)) for index, boundary in enumerate(boundaries)})
+    sketches = [DDSketch() for boundary in boundaries]
+    for row in rows:
+        for index, sketch in enumerate(sketches):
+            if (row[f'count_{index}']):
+                sketch.bins[row['bin']] = row[f'count_{index}']
+    return sketches
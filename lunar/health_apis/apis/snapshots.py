@@ -0,0 +1,125 @@
+# snapshots.py
+
+from asgiref.sync import sync_to_async
+from dataclasses import dataclass, replace
+from datetime import datetime
+from django.core.cache import cache
+from django.db import transaction
+from .models import PRIMARY_SATELLITE, HealthModel
+from . import pubsub
+
+import hashlib
+
+# cache keys for the health snapshot of a satellite and its version counter
+HEALTH_KEY = 'health-snapshot:{}'
+HEALTH_VERSION_KEY = 'health-snapshot-version:{}'
+
+
+def bump_version(key):
+    """Increments the version counter stored at key, so snapshots of older versions are no longer used."""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # the counter does not exist yet, it must never expire
+        cache.add(key, 0, None)
+        return cache.incr(key)
+
+
+def etag(*values):
+    """Returns a strong ETag derived from values, which stays the same for the same content."""
+    return '"%s"' % hashlib.md5(repr(values).encode()).hexdigest()
+
+
+@dataclass(frozen=True)
+class HealthSnapshot:
+    """The health message as served by /health/, message is None until the health is first evaluated."""
+    message: str = None
+    updated: datetime = None
+    version: int = 0
+
+    @property
+    def etag(self):
+        if (self.message is None):
+            return None
+        return etag(self.message, self.updated)
+
+    def as_event(self):
+        """Returns the snapshot as the message published to pubsub.HEALTH_CHANNEL."""
+        return {
+            'message': self.message,
+            'updated': self.updated.isoformat() if self.updated else None,
+            'etag': self.etag
+        }
+
+
+def _keys(satellite_id):
+    return HEALTH_KEY.format(satellite_id), HEALTH_VERSION_KEY.format(satellite_id)
+
+
+def _current(values, satellite_id):
+    health_key, version_key = _keys(satellite_id)
+    snapshot = values.get(health_key)
+    if (snapshot is not None and snapshot.version == values.get(version_key, 0)):
+        return snapshot
+    return None
+
+
+def get_health(satellite_id=PRIMARY_SATELLITE):
+    """Returns the health snapshot of a satellite, reading HealthModel and publishing it when there is no current snapshot.
+
+        A snapshot read from the database is tagged with the version from before the read,
+        so it is ignored if a write commits in between and publishes a newer one.
+    """
+    health_key, version_key = _keys(satellite_id)
+    values = cache.get_many([health_key, version_key])
+    snapshot = _current(values, satellite_id)
+    if (snapshot is not None):
+        return snapshot
+
+    version = values.get(version_key, 0)
+    health = HealthModel.objects.filter(satellite_id=satellite_id).first()
+    if (health is None):
+        snapshot = HealthSnapshot(version=version)
+    else:
+        snapshot = HealthSnapshot(health.message, health.updated, version)
+    transaction.on_commit(lambda: cache.set(health_key, snapshot, None))
+    return snapshot
+
+
+async def aget_health(satellite_id=PRIMARY_SATELLITE):
+    """Async version of get_health, a current snapshot is read without the sync ORM's thread."""
+    values = await sync_to_async(cache.get_many, thread_sensitive=False)(list(_keys(satellite_id)))
+    snapshot = _current(values, satellite_id)
+    if (snapshot is not None):
+        return snapshot
+    return await sync_to_async(get_health)(satellite_id)
+
+
+def _notify(snapshot):
+    pubsub.get_pubsub().publish(pubsub.HEALTH_CHANNEL, snapshot.as_event())
+
+
+def publish_health(health, changed):
+    """Publishes the health message of a saved HealthModel once the surrounding transaction commits.
+
+        When the message of the primary satellite changed, the subscribers of pubsub.HEALTH_CHANNEL are notified as well.
+        The snapshot is published first, so a subscriber that reads it after the event gets the new message.
+    """
+    snapshot = HealthSnapshot(health.message, health.updated)
+    health_key, version_key = _keys(health.satellite_id)
+
+    def publish():
+        version = bump_version(version_key)
+        cache.set(health_key, replace(snapshot, version=version), None)
+
+    transaction.on_commit(publish)
+    if (changed and health.satellite_id == PRIMARY_SATELLITE):
+        # a broker that is down must not fail the save, robust callbacks only log their errors
+        transaction.on_commit(lambda: _notify(snapshot), robust=True)
+
+
+def invalidate_health(satellite_id=PRIMARY_SATELLITE):
+    """Forces the next reader to read HealthModel again, used after HealthModel rows are deleted."""
+    transaction.on_commit(lambda: bump_version(_keys(satellite_id)[1]))
+    if (satellite_id == PRIMARY_SATELLITE):
+        transaction.on_commit(lambda: _notify(HealthSnapshot()), robust=True)
@@ -0,0 +1,346 @@
+# store.py
+
+from asgiref.sync import sync_to_async
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import Avg, OuterRef, Subquery
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from pathlib import Path
+from .models import PRIMARY_SATELLITE, AltitudeModel, Satellite
+from .rollups import Summary
+from . import rollups
+
+import fcntl
+import os
+import shutil
+import threading
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# lock file of a satellite directory of the ColumnarStore
+LOCK_FILE = '.lock'
+
+
+class AltitudeStore:
+    """Where the window stats of _get_stats, /stats/<id>/ and check_altitude are read from, configured with settings.ALTITUDE_STORE.
+
+        AltitudeModel stays the record of every sample, a store can keep its own copy of the committed
+        samples in a layout that is faster to read. The write methods are called for every change of
+        AltitudeModel, in the transaction of the change.
+    """
+
+    def __init__(self, params):
+        self.params = params
+
+    def window_stats(self, satellite_id, start):
+        """Returns the Summary of the altitudes of a satellite since start."""
+        raise NotImplementedError
+
+    async def awindow_stats(self, satellite_id, start):
+        return await sync_to_async(self.window_stats)(satellite_id, start)
+
+    def windows_stats(self, satellite_id, starts):
+        """Returns a list of the Summary of the altitudes of a satellite since each of starts."""
+        return [self.window_stats(satellite_id, start) for start in starts]
+
+    def window_averages(self, start):
+        """Returns a dict of the average altitude since start of every satellite with altitudes since start."""
+        raise NotImplementedError
+
+    def record_sample(self, satellite_id, date, altitude):
+        """Adds a newly inserted sample once it is committed."""
+
+    def record_samples(self, satellite_id, samples):
+        """Adds newly inserted (date, altitude) samples once they are committed."""
+
+    def rebuild(self, satellite_id, start, end):
+        """Reads the altitudes of a satellite from start to end (inclusive) again after they were changed."""
+
+    def delete_before(self, cutoff, satellite_id=PRIMARY_SATELLITE):
+        """Drops the copies of the altitudes of a satellite older than cutoff, after they were deleted from AltitudeModel."""
+
+    def delete_satellite(self, satellite_id):
+        """Drops the copies of the altitudes of a deleted satellite."""
+
+
+class DatabaseStore(AltitudeStore):
+    """Reads AltitudeModel and the per minute rollups, the default."""
+
+    def window_stats(self, satellite_id, start):
+        if (satellite_id == PRIMARY_SATELLITE):
+            return rollups.window_stats(start)
+        return rollups.satellite_window_stats(satellite_id, start)
+
+    async def awindow_stats(self, satellite_id, start):
+        if (satellite_id == PRIMARY_SATELLITE):
+            return await rollups.awindow_stats(start)
+        return await super().awindow_stats(satellite_id, start)
+
+    def windows_stats(self, satellite_id, starts):
+        if (satellite_id == PRIMARY_SATELLITE):
+            return rollups.windows_stats(starts)
+        return rollups.satellite_windows_stats(satellite_id, starts)
+
+    def window_averages(self, start):
+        # one query for the whole fleet, the window of every satellite is a seek through the (satellite, date)
+        # index, a grouped query over the dates would scan the table
+        average = AltitudeModel.objects.filter(satellite=OuterRef('pk'), date__gte=start).order_by().values(
+            'satellite').annotate(average=Avg('altitude')).values('average')
+        return dict(Satellite.objects.annotate(average=Subquery(average)).filter(
+            average__isnull=False).values_list('id', 'average'))
+
+
+def _microseconds(date):
+    return (date - EPOCH) // timedelta(microseconds=1)
+
+
+@contextmanager
+def _locked(directory, operation):
+    """Holds a flock on the lock file of a satellite directory, shared for readers and exclusive for writers."""
+    with open(directory / LOCK_FILE, 'ab') as lock:
+        fcntl.flock(lock, operation)
+        yield
+
+
+class Segment:
+    """The altitudes of one satellite and day, in two files of the same length.
+
+        <day>.ts holds the sample dates as int64 microseconds since the epoch in ascending order,
+        <day>.alt the float64 altitudes. Samples are appended, and a day is only rewritten when a
+        sample arrives out of order. The altitude is written before its date, so a reader that
+        counts the complete dates in the .ts file always finds their altitudes, and a writer
+        drops what an interrupted write left behind before it appends.
+
+        Callers hold the exclusive lock of the directory.
+    """
+
+    def __init__(self, directory, day):
+        self.directory = directory
+        self.ts_path = directory / f'{day.isoformat()}.ts'
+        self.alt_path = directory / f'{day.isoformat()}.alt'
+
+    def append(self, samples):
+        """Adds sorted (microseconds, altitude) samples, dates that are stored already are skipped."""
+        import numpy as np
+
+        dates = np.array([date for date, altitude in samples], dtype=np.int64)
+        altitudes = np.array([altitude for date, altitude in samples], dtype=np.float64)
+        with open(self.ts_path, 'ab') as ts_file, open(self.alt_path, 'ab') as alt_file:
+            count = os.fstat(ts_file.fileno()).st_size // 8
+            ts_file.truncate(count * 8)
+            alt_file.truncate(count * 8)
+
+            last = np.fromfile(self.ts_path, dtype=np.int64, count=1, offset=(count - 1) * 8)[0] if count else None
+            if (last is None or dates[0] > last):
+                alt_file.write(altitudes.tobytes())
+                alt_file.flush()
+                ts_file.write(dates.tobytes())
+                ts_file.flush()
+                return
+
+        # a sample older than the newest one, the day is rewritten in order
+        stored_dates = np.fromfile(self.ts_path, dtype=np.int64, count=count)
+        stored_altitudes = np.fromfile(self.alt_path, dtype=np.float64, count=count)
+        new = ~np.isin(dates, stored_dates)
+        dates = np.concatenate([stored_dates, dates[new]])
+        altitudes = np.concatenate([stored_altitudes, altitudes[new]])
+        order = np.argsort(dates, kind='stable')
+        self.write(dates[order], altitudes[order])
+
+    def write(self, dates, altitudes):
+        """Replaces the samples of the day, without samples the segment is removed."""
+        if (len(dates) == 0):
+            self.ts_path.unlink(missing_ok=True)
+            self.alt_path.unlink(missing_ok=True)
+            return
+        # readers that mapped the old files keep reading them
+        for path, values in ((self.alt_path, altitudes), (self.ts_path, dates)):
+            temporary = path.with_name(path.name + '.tmp')
+            values.tofile(temporary)
+            os.replace(temporary, path)
+
+
+class ColumnarStore(AltitudeStore):
+    """Keeps the samples in memory mapped columnar files and reads windows with numpy, requires numpy.
+
+        LOCATION is the directory of the files, with a Segment per satellite and day in <satellite id>/.
+        A window is read with a binary search over the dates of each of its days, and the altitudes
+        from there on are reduced in place, without copying them out of the mapped files.
+
+        Samples are copied once their transaction commits, so a rolled back insert never shows up.
+    """
+
+    # mapped segments kept open per process
+    MAPPED_SEGMENTS = 1024
+
+    def __init__(self, params):
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            raise ImproperlyConfigured('The ColumnarStore requires numpy')
+        super().__init__(params)
+        self.location = Path(params['LOCATION'])
+        self._lock = threading.Lock()
+        self._mapped = OrderedDict()
+
+    def _directory(self, satellite_id):
+        return self.location / str(satellite_id)
+
+    def _days(self, satellite_id, start):
+        """Returns the days with a segment of the satellite, from the day of start on."""
+        try:
+            names = os.listdir(self._directory(satellite_id))
+        except FileNotFoundError:
+            return []
+        first = start.astimezone(timezone.utc).date().isoformat()
+        return sorted(datetime.strptime(name[:-3], '%Y-%m-%d').date()
+                      for name in names if (name.endswith('.ts') and name[:-3] >= first))
+
+    def _map(self, segment):
+        """Returns the dates and altitudes of a segment as read-only arrays mapped from its files.
+
+            Must be called with the shared lock of the directory, so both files are of the same write.
+        """
+        import numpy as np
+
+        try:
+            ts_stat = os.stat(segment.ts_path)
+            alt_stat = os.stat(segment.alt_path)
+        except FileNotFoundError:
+            return np.empty(0, np.int64), np.empty(0, np.float64)
+        count = ts_stat.st_size // 8
+        key = (ts_stat.st_ino, alt_stat.st_ino, count)
+
+        with self._lock:
+            mapped = self._mapped.get(segment.ts_path)
+            if (mapped is not None and mapped[0] == key):
+                self._mapped.move_to_end(segment.ts_path)
+                return mapped[1], mapped[2]
+
+        if (count == 0):
+            return np.empty(0, np.int64), np.empty(0, np.float64)
+        # a file that was appended to or replaced since it was mapped is mapped again
+        dates = np.memmap(segment.ts_path, dtype=np.int64, mode='r', shape=(count,))
+        altitudes = np.memmap(segment.alt_path, dtype=np.float64, mode='r', shape=(count,))
+        with self._lock:
+            self._mapped[segment.ts_path] = (key, dates, altitudes)
+            self._mapped.move_to_end(segment.ts_path)
+            while (len(self._mapped) > self.MAPPED_SEGMENTS):
+                self._mapped.popitem(last=False)
+        return dates, altitudes
+
+    def window_stats(self, satellite_id, start):
+        return self.windows_stats(satellite_id, [start])[0]
+
+    def windows_stats(self, satellite_id, starts):
+        summaries = [Summary() for start in starts]
+        days = self._days(satellite_id, min(starts))
+        if (not days):
+            return summaries
+
+        # the segments of the longest window are mapped once for every window
+        directory = self._directory(satellite_id)
+        with _locked(directory, fcntl.LOCK_SH):
+            segments = [self._map(Segment(directory, day)) for day in days]
+        for index, start in enumerate(starts):
+            first = _microseconds(start)
+            for dates, altitudes in segments:
+                window = altitudes[dates.searchsorted(first):]
+                if (len(window)):
+                    summaries[index] = summaries[index].merge(Summary(
+                        len(window), float(window.sum()), float(window.min()), float(window.max()),
+                        float(window.dot(window))))
+        return summaries
+
+    def window_averages(self, start):
+        averages = {}
+        if (not self.location.is_dir()):
+            return averages
+        for name in os.listdir(self.location):
+            if (name.isdigit()):
+                average = self.window_stats(int(name), start).average
+                if (average is not None):
+                    averages[int(name)] = average
+        return averages
+
+    def _append(self, satellite_id, samples):
+        days = {}
+        for date, altitude in sorted(samples):
+            days.setdefault(date.astimezone(timezone.utc).date(), {}).setdefault(_microseconds(date), altitude)
+
+        directory = self._directory(satellite_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        with _locked(directory, fcntl.LOCK_EX):
+            for day, values in days.items():
+                Segment(directory, day).append(list(values.items()))
+
+    def record_sample(self, satellite_id, date, altitude):
+        transaction.on_commit(lambda: self._append(satellite_id, [(date, altitude)]))
+
+    def record_samples(self, satellite_id, samples):
+        samples = list(samples)
+        if (samples):
+            transaction.on_commit(lambda: self._append(satellite_id, samples))
+
+    def _write_day(self, satellite_id, day):
+        import numpy as np
+
+        start = datetime.combine(day, datetime.min.time(), timezone.utc)
+        rows = list(AltitudeModel.objects.filter(
+            satellite_id=satellite_id, date__gte=start, date__lt=start + timedelta(days=1)).order_by(
+            'date').values_list('date', 'altitude'))
+        directory = self._directory(satellite_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        with _locked(directory, fcntl.LOCK_EX):
+            Segment(directory, day).write(
+                np.array([_microseconds(date) for date, altitude in rows], dtype=np.int64),
+                np.array([altitude for date, altitude in rows], dtype=np.float64))
+
+    def rebuild(self, satellite_id, start, end):
+        def write():
+            day = start.astimezone(timezone.utc).date()
+            while (day <= end.astimezone(timezone.utc).date()):
+                self._write_day(satellite_id, day)
+                day += timedelta(days=1)
+
+        transaction.on_commit(write)
+
+    def delete_before(self, cutoff, satellite_id=PRIMARY_SATELLITE):
+        # only whole days are dropped, a window never reaches back to the day of the cutoff
+        directory = self._directory(satellite_id)
+        if (not directory.is_dir()):
+            return
+        last = cutoff.astimezone(timezone.utc).date().isoformat()
+        with _locked(directory, fcntl.LOCK_EX):
+            for file in os.listdir(directory):
+                if (file.endswith(('.ts', '.alt')) and file.split('.')[0] < last):
+                    (directory / file).unlink(missing_ok=True)
+
+    def delete_satellite(self, satellite_id):
+        transaction.on_commit(lambda: shutil.rmtree(self._directory(satellite_id), ignore_errors=True))
+
+
+_store = None
+
+
+def get_store():
+    """Returns the AltitudeStore of settings.ALTITUDE_STORE, shared by the whole process.
+
+        Raises ImproperlyConfigured when the backend is missing a dependency, instead of failing at its first read.
+    """
+    global _store
+    if (_store is None):
+        _store = import_string(settings.ALTITUDE_STORE['BACKEND'])(settings.ALTITUDE_STORE)
+    return _store
+
+
+@receiver(setting_changed)
+def _reset_store(setting, **kwargs):
+    global _store
+    if (setting == 'ALTITUDE_STORE'):
+        _store = None
@@ -0,0 +1,137 @@
+# stub.py
+
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import json
+import math
+import threading
+import time
+
+# path of the satellite api, the same as the real one
+DATA_PATH = '/api/satellite/data'
+# POST starts a low altitude event, ?altitude= sets how low
+DROP_PATH = '/api/satellite/drop'
+
+
+class OrbitProfile:
+    """Synthetic altitudes of a satellite whose orbit decays, published every interval seconds like the satellite api.
+
+        The altitude starts at altitude and sinks by decay km per hour, oscillating by amplitude over
+        period seconds. drop starts a low altitude event, from the next update on the altitudes
+        oscillate around the given altitude instead.
+
+        clock is time.time unless a test replaces it.
+    """
+
+    def __init__(self, interval=1.0, altitude=175.0, decay=0.0, amplitude=5.0, period=5400.0, clock=time.time):
+        self.interval = interval
+        self.altitude = altitude
+        self.decay = decay
+        self.amplitude = amplitude
+        self.period = period
+        self.clock = clock
+        self.started = clock()
+        self.event = None
+        self._lock = threading.Lock()
+
+    def updated_at(self):
+        """Returns the timestamp of the latest update."""
+        return self.started + math.floor((self.clock() - self.started) / self.interval) * self.interval
+
+    def sample(self, updated_at):
+        """Returns the altitude published at the updated_at timestamp."""
+        elapsed = updated_at - self.started
+        oscillation = self.amplitude * math.sin(2 * math.pi * elapsed / self.period)
+        with self._lock:
+            event = self.event
+        if (event is not None and updated_at >= event[0]):
+            return event[1] + oscillation
+        return self.altitude - self.decay * elapsed / 3600 + oscillation
+
+    def current(self):
+        """Returns the latest update in the format of the satellite api."""
+        updated_at = self.updated_at()
+        return {
+            'altitude': self.sample(updated_at),
+            'last_updated': datetime.fromtimestamp(updated_at, timezone.utc).isoformat(),
+        }
+
+    def drop(self, altitude):
+        """Starts a low altitude event at the next update.
+
+            Returns:
+                published_at: timestamp of the first update with the low altitude
+        """
+        published_at = self.updated_at() + self.interval
+        with self._lock:
+            self.event = (published_at, altitude)
+        return published_at
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves the OrbitProfile of the server like the satellite api, with an ETag per update."""
+    # keep-alive, like the api the client pools its connection to
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if (urlsplit(self.path).path != DATA_PATH):
+            self.send_error(404)
+            return
+        data = self.server.profile.current()
+        etag = f'"{data["last_updated"]}"'
+        if (self.headers.get('If-None-Match') == etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self._send_json(data, {'ETag': etag})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if (url.path != DROP_PATH):
+            self.send_error(404)
+            return
+        try:
+            altitude = float(parse_qs(url.query).get('altitude', ['140'])[0])
+        except ValueError:
+            self.send_error(400, 'altitude has to be a number')
+            return
+        published_at = self.server.profile.drop(altitude)
+        self._send_json({'altitude': altitude,
+                         'published_at': datetime.fromtimestamp(published_at, timezone.utc).isoformat()})
+
+    def _send_json(self, data, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # one line per fetch would drown the output of the load test
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    """A stand-in for the satellite api, serving profile at DATA_PATH."""
+    daemon_threads = True
+
+    def __init__(self, profile, host='127.0.0.1', port=0):
+        super().__init__((host, port), StubHandler)
+        self.profile = profile
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}{DATA_PATH}'
+
+    def start(self):
+        """Serves from a daemon thread, stop with shutdown."""
+        threading.Thread(target=self.serve_forever, name='satellite-stub', daemon=True).start()
+        return self
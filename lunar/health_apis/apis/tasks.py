@@ -1,99 +1,147 @@
 # tasks.py
 
 from celery import shared_task
-import requests
-from datetime import datetime, timezone, timedelta
-from .models import AltitudeModel, HealthModel, HealthMessage
+from concurrent.futures import ThreadPoolExecutor
+from .models import PRIMARY_SATELLITE, HealthModel, Satellite
+from django.conf import settings
 from django.db import transaction
-from django.db.models import Avg
+from . import buffer, client, clock, health, ingest, retention
+from .samples import parse_sample
+from .store import get_store
+
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 @shared_task
 def get_altitude():
-    """Celery task for getting satellite altitude.
+    """Celery task for getting the altitude of the primary satellite.
 
-        Set up to run every 10 seconds to get the updated data. 
-        If the date of the request is the same as the last, we will ignore this update.
+        get_altitudes fetches every satellite, including this one, on the beat schedule.
+        If an altitude with the same date was already stored, we will ignore this update.
+        In the buffered write mode the sample is pushed to the ingest buffer, which stores it with the next flush.
 
         Returns:
-            altitude_created: boolean 
+            altitude_created: boolean, whether the sample was buffered in the buffered write mode
     """
-    url = 'http://nestio.space/api/satellite/data'
-    response = requests.get(url)
-
-    # if we don't get a valid response, return
-    # we may eventually want to throw an error if we are unable to
-    # communicate with the api for a significant period of time
-    if (not response.ok):
-        return False
-
-    data = response.json()
+    # the client retries failed requests and stops calling the api while it keeps failing,
+    # it returns None when there is no new data
+    data = client.get_client().fetch()
     if (not data):
         return False
 
-    altitude = data['altitude']
-    date = datetime.fromisoformat(data['last_updated'])
-    utc_datetime = date.astimezone(timezone.utc)
+    altitude, utc_datetime = parse_sample(data)
+    if (buffer.buffered()):
+        buffer.get_buffer().push([(PRIMARY_SATELLITE, utc_datetime, altitude)])
+        return True
     with transaction.atomic():
-        # if the last entry has the same date stamp, do not add the data twice
-        if (AltitudeModel.objects.all().count() > 0):
-            last_entry = AltitudeModel.objects.latest('date')
-            if (last_entry.date == utc_datetime):
-                return False
+        # the date is unique, so a sample we already stored is skipped by the insert itself
+        # old data is compacted and cleared out by the compact_altitudes task
+        return ingest.store_sample(utc_datetime, altitude)
 
-        # create an object to save the current altitude in the database
-        # right now we do not clear the old data
-        # but we could use another task to clear out the data
-        alt = AltitudeModel.objects.create(
-            altitude=altitude, date=utc_datetime)
-        alt.save()
 
-    return True
+def _fetch(satellite_client):
+    try:
+        return satellite_client.fetch()
+    except ValueError:
+        # one api answering garbage must not fail the fleet
+        logger.warning('Invalid JSON from %s', satellite_client.url)
+        return None
+
+
+@shared_task
+def get_altitudes():
+    """Celery task for getting the altitude of every satellite.
+
+        Set up to run every 10 seconds. The satellite apis are fetched concurrently by a pool of
+        settings.FLEET_INGEST_WORKERS threads and the new samples are stored in one transaction,
+        so the whole fleet is a single task per tick.
+        In poller mode the primary satellite is left to the poll_altitude command.
+        In the buffered write mode the samples are pushed to the ingest buffer instead of stored.
+
+        Returns:
+            created: number of altitudes stored, or buffered in the buffered write mode
+    """
+    satellites = Satellite.objects.order_by('id').values_list('id', 'url')
+    if (settings.ALTITUDE_INGEST_MODE == 'poller'):
+        satellites = satellites.exclude(id=PRIMARY_SATELLITE)
+    # the clients are looked up before the threads start, each thread only uses its own
+    clients = [(satellite_id, client.get_client(url)) for satellite_id, url in satellites]
+    if (not clients):
+        return 0
+
+    with ThreadPoolExecutor(max_workers=min(settings.FLEET_INGEST_WORKERS, len(clients))) as pool:
+        responses = pool.map(_fetch, [satellite_client for satellite_id, satellite_client in clients])
+        samples = []
+        for (satellite_id, satellite_client), data in zip(clients, responses):
+            if (not data):
+                continue
+            try:
+                altitude, utc_datetime = parse_sample(data)
+            except (KeyError, TypeError, ValueError):
+                logger.warning('Invalid sample from %s: %r', satellite_client.url, data)
+                continue
+            samples.append((satellite_id, utc_datetime, altitude))
+
+    if (buffer.buffered()):
+        buffer.get_buffer().push(samples)
+        return len(samples)
+    created = 0
+    with transaction.atomic():
+        for satellite_id, utc_datetime, altitude in samples:
+            created += ingest.store_sample(utc_datetime, altitude, satellite_id)
+    return created
 
 
 @shared_task
 def check_altitude():
-    """Celery task for checking average satellite altitude.
+    """Celery task for reconciling the health of every satellite with its average altitude.
 
-      Set up to run every minute. 
-      It calculates the past minutes average altitude and updates the HealthModel based on the altitude.
+      Set up to run every minute.
+      The health is evaluated with every sample get_altitude and get_altitudes store, this pass calculates
+      the past minutes average altitude of every satellite from settings.ALTITUDE_STORE and corrects the HealthModel
+      of the satellites it missed a change for, such as samples that were imported or arrived out of order.
+      In the buffered write mode the ingest buffer is flushed first, so the samples it holds are evaluated too.
 
     """
+    if (buffer.buffered()):
+        buffer.get_buffer().flush()
+    now = clock.now()
     # get the current time minus a minute
-    d = datetime.now(timezone.utc) - timedelta(hours=0, minutes=1)
+    d = now - health.WINDOW
     with transaction.atomic():
-        if (AltitudeModel.objects.all().count() == 0): return
-
-        # get every altitude that was saved in the past minute and average the altitude values
-        average_altitude = AltitudeModel.objects.filter(
-            date__gte=d).aggregate(Avg('altitude'))['altitude__avg']
-
-        # under 160 km we consider the altitude to be low
-        low_altitude = average_altitude < 160
-
-        # we only need one HealthModel object so get it or create it if task is running the first time
-        last_warning, created = HealthModel.objects.get_or_create()
-
-        # altitude is low
-        if (low_altitude):
-            # if it was low last minute, no need to update
-            if (last_warning.low_altitude):
-                return
-            # if it wasn't low before, update the HealthModel
-            last_warning.message = HealthMessage.WARNING.value
-            last_warning.low_altitude = True
+        # average every altitude that was saved in the past minute, per satellite
+        averages = get_store().window_averages(d)
+        if (not averages): return
+
+        # we only need one HealthModel object per satellite, it is created the first time the satellite is checked
+        warnings = HealthModel.objects.in_bulk(list(averages), field_name='satellite_id')
+        for satellite_id, average_altitude in averages.items():
+            last_warning = warnings.get(satellite_id) or HealthModel(satellite_id=satellite_id)
+            # runs once a minute, so a message of its own was shown for a whole window, and one a sample set
+            # is kept until a window after the date of that sample
+            resumed = last_warning.since is None or now - last_warning.since >= health.WINDOW
+            low_altitude, message = health.transition(last_warning.low_altitude, last_warning.message,
+                                                      average_altitude, resumed)
+            if (last_warning.pk is not None and low_altitude == last_warning.low_altitude
+                    and message == last_warning.message):
+                continue
+            # saved one by one, the signals publish the new message of every changed satellite
+            last_warning.low_altitude = low_altitude
+            last_warning.message = message
+            last_warning.since = None
             last_warning.save()
-            return
 
-        # current average altitude is not low
-        # previous minute had low altitude, we have a special message that is sent
-        if (last_warning.low_altitude):
-            last_warning.low_altitude = False
-            last_warning.message = HealthMessage.SUSTAINED.value
-            last_warning.save()
-            return
 
-        # if the sustained message was there last minute, we can return to the okay message
-        if (last_warning.message == HealthMessage.SUSTAINED.value):
-            last_warning.message = HealthMessage.OKAY.value
-            last_warning.save()
+@shared_task
+def compact_altitudes():
+    """Celery task for compacting and deleting old altitude data.
+
+      Set up to run every hour.
+      Raw altitudes past their retention period are rolled up into the hourly and daily tiers and deleted.
+
+      Returns:
+          deleted: dict with the number of deleted rows per tier
+    """
+    return retention.compact(clock.now())
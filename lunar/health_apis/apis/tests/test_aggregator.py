@@ -0,0 +1,103 @@
+from django.core.cache import cache
+from django.test import TestCase
+from ..aggregator import RollingWindow, get_aggregator, rebuild, SNAPSHOT_KEY
+from ..models import AltitudeModel
+from datetime import datetime, timedelta, timezone
+
+import random
+
+now = datetime(2024, 4, 6, 1, 20, tzinfo=timezone.utc)
+five_minutes = timedelta(minutes=5)
+
+
+class RollingWindowTestCase(TestCase):
+    def test_matches_brute_force(self):
+        """
+        Check that the rolling min/max/avg match the samples inside the window after every push
+        """
+        rolling = RollingWindow(timedelta(seconds=60))
+        random.seed(7)
+        samples = []
+        for i in range(500):
+            date = now + timedelta(seconds=10 * i)
+            altitude = random.choice([150.0, 155.5, 160.0, 170.25, 180.0])
+            samples.append((date, altitude))
+            rolling.push(date, altitude)
+            rolling.evict(date)
+
+            window = [a for d, a in samples if d >= date - timedelta(seconds=60)]
+            stats = rolling.stats()
+            self.assertEqual(stats['minimum'], min(window))
+            self.assertEqual(stats['maximum'], max(window))
+            self.assertAlmostEqual(stats['average'], sum(window) / len(window))
+
+    def test_empty_window(self):
+        """
+        Check that stats are None once every sample has left the window
+        """
+        rolling = RollingWindow(timedelta(seconds=60))
+        rolling.push(now, 150)
+        rolling.evict(now + timedelta(minutes=2))
+        self.assertDictEqual(rolling.stats(), {
+                             "minimum": None, "maximum": None, "average": None})
+
+
+class SharedAggregatorTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        AltitudeModel.objects.create(altitude=150, date=now - timedelta(minutes=2))
+        AltitudeModel.objects.create(altitude=100, date=now - timedelta(minutes=1))
+        # out of the five minute window
+        AltitudeModel.objects.create(altitude=90, date=now - timedelta(minutes=30))
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_rebuild_from_database(self):
+        """
+        Check that a cold start rebuilds the aggregator from AltitudeModel
+        """
+        self.assertIsNone(cache.get(SNAPSHOT_KEY))
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = get_aggregator(now).stats(five_minutes, now)
+        self.assertDictEqual(stats, {"minimum": 100, "maximum": 150, "average": 125})
+        self.assertIsNotNone(cache.get(SNAPSHOT_KEY))
+
+    def test_insert_updates_snapshot(self):
+        """
+        Check that a committed insert is pushed into the published snapshot
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            get_aggregator(now)
+        with self.captureOnCommitCallbacks(execute=True):
+            AltitudeModel.objects.create(altitude=200, date=now)
+
+        with self.assertNumQueries(0):
+            stats = get_aggregator(now).stats(five_minutes, now)
+        self.assertDictEqual(stats, {"minimum": 100, "maximum": 200, "average": 150})
+
+    def test_out_of_order_insert_rebuilds(self):
+        """
+        Check that an insert older than the newest sample makes the next reader rebuild
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            get_aggregator(now)
+        with self.captureOnCommitCallbacks(execute=True):
+            AltitudeModel.objects.create(altitude=50, date=now - timedelta(minutes=3))
+
+        stats = get_aggregator(now).stats(five_minutes, now)
+        self.assertDictEqual(stats, {"minimum": 50, "maximum": 150, "average": 100})
+
+    def test_uncommitted_rebuild_not_published(self):
+        """
+        Check that a rebuilt aggregator is not published before the transaction commits
+        """
+        get_aggregator(now)
+        self.assertIsNone(cache.get(SNAPSHOT_KEY))
+
+    def test_rebuild_matches_database(self):
+        """
+        Check that rebuild gives the same stats as aggregating the rows
+        """
+        stats = rebuild(now).stats(timedelta(minutes=1), now)
+        self.assertDictEqual(stats, {"minimum": 100, "maximum": 100, "average": 100})
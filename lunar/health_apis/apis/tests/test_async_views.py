@@ -0,0 +1,88 @@
+from unittest.mock import patch
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from ..models import AltitudeModel, HealthMessage, HealthModel
+from .. import aggregator
+from ..conftest import FROZEN_CLOCK, NewDate
+from datetime import timedelta, timezone
+
+import json
+
+# headers compared separately, DRF varies on Cookie once it authenticates
+# and lists the allowed methods in any order
+VOLATILE_HEADERS = {'Allow', 'Vary'}
+
+
+@patch('apis.clock._clock', FROZEN_CLOCK)
+@override_settings(ROOT_URLCONF='health_apis.asgi_urls')
+class AsyncViewsTestCase(TestCase):
+    def setUp(self):
+        AltitudeModel.objects.create(altitude=150, date=NewDate(2024, 4, 6, 1, 17, tzinfo=timezone.utc))
+        AltitudeModel.objects.create(altitude=100, date=NewDate(2024, 4, 6, 1, 18, tzinfo=timezone.utc))
+        AltitudeModel.objects.create(altitude=90, date=NewDate(2024, 4, 6, 1, 10, tzinfo=timezone.utc))
+
+    async def _compare(self, method, url):
+        """Requests url from the async view and from the DRF view, and checks that the responses are the same."""
+        response = await getattr(self.async_client, method)(url)
+        with override_settings(ROOT_URLCONF='health_apis.urls'):
+            expected = await getattr(self.async_client, method)(url)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(
+            {name: value for name, value in response.headers.items() if name not in VOLATILE_HEADERS},
+            {name: value for name, value in expected.headers.items() if name not in VOLATILE_HEADERS})
+        self.assertEqual(set(response['Allow'].split(', ')), set(expected['Allow'].split(', ')))
+        self.assertIn('Accept', response['Vary'])
+        return response
+
+    async def test_stats(self):
+        """
+        Check that the async stats view responds like the DRF view
+        """
+        response = await self._compare('get', '/stats/')
+        self.assertDictEqual(json.loads(response.content), {'minimum': 100, 'maximum': 150, 'average': 125})
+
+    async def test_stats_rollups(self):
+        """
+        Check that a window outside settings.ROLLING_WINDOWS is read from the rollups with the async ORM
+        """
+        with self.settings(ROLLING_WINDOWS=[timedelta(minutes=1)]):
+            response = await self._compare('get', '/stats/')
+        self.assertDictEqual(json.loads(response.content), {'minimum': 100, 'maximum': 150, 'average': 125})
+
+    def test_stats_snapshot(self):
+        """
+        Check that a published aggregator snapshot is used without querying the database
+        """
+        cache.clear()
+        snapshot = aggregator.Aggregator([timedelta(minutes=5)])
+        snapshot.push(NewDate(2024, 4, 6, 1, 19, tzinfo=timezone.utc), 175, NewDate.now(timezone.utc))
+        cache.set(aggregator.SNAPSHOT_KEY, snapshot)
+        with self.assertNumQueries(0):
+            response = self.client.get('/stats/')
+        cache.clear()
+        self.assertDictEqual(json.loads(response.content), {'minimum': 175, 'maximum': 175, 'average': 175})
+
+    async def test_empty_health(self):
+        """
+        Check that the async health view responds 204 without content like the DRF view
+        """
+        response = await self._compare('get', '/health/')
+        self.assertEqual(response.status_code, 204)
+        self.assertNotIn('Content-Type', response.headers)
+
+    async def test_health(self):
+        """
+        Check that the async health view returns the health message like the DRF view
+        """
+        await HealthModel.objects.acreate(low_altitude=True, message=HealthMessage.WARNING.value)
+        response = await self._compare('get', '/health/')
+        self.assertEqual(response.content.decode(), HealthMessage.WARNING.value)
+
+    async def test_other_methods(self):
+        """
+        Check that methods other than GET get the responses of the DRF views
+        """
+        response = await self._compare('post', '/health/')
+        self.assertEqual(response.status_code, 405)
+        await self._compare('options', '/stats/')
@@ -0,0 +1,60 @@
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from ..models import AltitudeModel, MinuteRollupModel
+from .. import aggregator, benchmarks, health, snapshots
+from io import StringIO
+
+import json
+import os
+import tempfile
+
+
+class BenchSuiteTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def tearDown(self):
+        cache.clear()
+
+    def run_suite(self, name):
+        path = os.path.join(self.directory.name, name)
+        call_command('bench_suite', '--rows', '300', '--repeat', '5', '--output', path, stdout=StringIO())
+        with open(path) as file:
+            return path, json.load(file)
+
+    def test_report(self):
+        """
+        Check that the suite reports the percentiles of every benchmark per size, and rolls the seeded rows back
+        """
+        path, report = self.run_suite('results.json')
+        self.assertEqual([result['rows'] for result in report['results']], [300])
+        results = report['results'][0]['benchmarks']
+        self.assertEqual(set(results), {'ingest', 'ingest_duplicate', 'check_altitude', *benchmarks.STATS_QUERIES})
+        for result in results.values():
+            self.assertEqual(result['operations'], 5)
+            self.assertLessEqual(result['p50'], result['p95'])
+            self.assertLessEqual(result['p95'], result['p99'])
+        self.assertFalse(AltitudeModel.objects.exists())
+        self.assertFalse(MinuteRollupModel.objects.exists())
+        # the snapshots of the rolled back rows were published to the cache of the suite
+        keys = [aggregator.SNAPSHOT_KEY, aggregator.VERSION_KEY, health.EVALUATOR_KEY.format(1),
+                health.VERSION_KEY.format(1), snapshots.HEALTH_KEY.format(1), snapshots.HEALTH_VERSION_KEY.format(1)]
+        self.assertEqual(cache.get_many(keys), {})
+
+    def test_compare(self):
+        """
+        Check that --compare passes on equal results and fails on a latency over the tolerance
+        """
+        base, report = self.run_suite('base.json')
+        call_command('bench_suite', '--compare', base, base, stdout=StringIO())
+
+        report['results'][0]['benchmarks']['stats']['p99'] *= 1.5
+        new = os.path.join(self.directory.name, 'new.json')
+        with open(new, 'w') as file:
+            json.dump(report, file)
+        call_command('bench_suite', '--compare', base, new, '--tolerance', '0.6', stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, '1 latencies regressed'):
+            call_command('bench_suite', '--compare', base, new, stdout=StringIO())
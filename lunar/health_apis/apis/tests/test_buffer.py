@@ -0,0 +1,137 @@
+from django.core.cache import cache
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from unittest.mock import Mock, patch
+from ..models import PRIMARY_SATELLITE, AltitudeModel, HealthMessage, HealthModel, MinuteRollupModel, Satellite
+from ..tasks import check_altitude, get_altitude, get_altitudes
+from ..conftest import FROZEN_CLOCK, NewDate
+from .. import buffer, client
+from datetime import datetime, timedelta, timezone
+
+import json
+
+now = datetime(2024, 4, 6, 1, 20, tzinfo=timezone.utc)
+
+MEMORY_BUFFER = {
+    'BACKEND': 'apis.buffer.MemoryBuffer',
+    'MAX_SIZE': 5,
+    'FLUSH_SIZE': 3,
+    'FLUSH_INTERVAL': None,
+}
+
+
+def samples(*altitudes, satellite_id=PRIMARY_SATELLITE, start=now - timedelta(seconds=50)):
+    return [(satellite_id, start + timedelta(seconds=10 * i), altitude) for i, altitude in enumerate(altitudes)]
+
+
+def response(altitude, date):
+    data = {'altitude': altitude, 'last_updated': date.isoformat()}
+    return Mock(ok=True, status_code=200, headers={}, json=Mock(return_value=data))
+
+
+@override_settings(ALTITUDE_WRITE_MODE='buffered', INGEST_BUFFER=MEMORY_BUFFER)
+class IngestBufferTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        client.reset_client()
+        # every test starts with an empty buffer
+        buffer._reset_buffer(setting='INGEST_BUFFER')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_flush_size(self):
+        """
+        Check that samples wait in the buffer until FLUSH_SIZE of them are pushed, and are then stored in one batch
+        """
+        ingest_buffer = buffer.get_buffer()
+        ingest_buffer.push(samples(150, 152))
+        self.assertEqual(ingest_buffer.depth(), 2)
+        self.assertFalse(AltitudeModel.objects.exists())
+
+        ingest_buffer.push(samples(154, start=now))
+        self.assertEqual(ingest_buffer.depth(), 0)
+        self.assertEqual(AltitudeModel.objects.count(), 3)
+        self.assertEqual(sum(MinuteRollupModel.objects.values_list('count', flat=True)), 3)
+        self.assertEqual(HealthModel.objects.get().message, HealthMessage.WARNING.value)
+
+    def test_full_buffer(self):
+        """
+        Check that a full buffer is flushed by the pusher before it takes more samples, and duplicates are skipped
+        """
+        ingest_buffer = buffer.get_buffer()
+        with patch.object(ingest_buffer, 'flush_size', 100):
+            ingest_buffer.push(samples(170, 171, 172, 173, 174))
+            self.assertFalse(AltitudeModel.objects.exists())
+            ingest_buffer.push(samples(170))
+        self.assertEqual(AltitudeModel.objects.count(), 5)
+        self.assertEqual(ingest_buffer.depth(), 1)
+        self.assertEqual(ingest_buffer.flush(), 0)
+
+    def test_failed_flush(self):
+        """
+        Check that a batch that fails while the database is unavailable goes back into the buffer, and the samples of deleted satellites are dropped
+        """
+        ingest_buffer = buffer.get_buffer()
+        ingest_buffer.append(samples(150, 152) + samples(160, satellite_id=999))
+        with patch('apis.ingest.store_samples', side_effect=OperationalError):
+            with self.assertRaises(OperationalError):
+                ingest_buffer.flush()
+        self.assertEqual(ingest_buffer.depth(), 3)
+        self.assertFalse(AltitudeModel.objects.exists())
+
+        self.assertEqual(ingest_buffer.flush(), 2)
+        self.assertEqual(ingest_buffer.depth(), 0)
+
+    def test_invalid_sample(self):
+        """
+        Check that a sample that fails to store is dropped and logged, and the rest of its batch is stored
+        """
+        ingest_buffer = buffer.get_buffer()
+        ingest_buffer.append(samples(150, float('nan'), 152))
+        with self.assertLogs('apis.buffer', 'ERROR') as logs:
+            self.assertEqual(ingest_buffer.flush(), 2)
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(ingest_buffer.depth(), 0)
+        self.assertEqual(sorted(AltitudeModel.objects.values_list('altitude', flat=True)), [150, 152])
+
+        # the samples the satellite api sends are rejected before they reach the buffer
+        with patch('requests.Session.get', Mock(return_value=response(float('nan'), now))):
+            with self.assertRaises(ValueError):
+                get_altitude()
+        self.assertEqual(ingest_buffer.depth(), 0)
+
+    @patch('apis.clock._clock', FROZEN_CLOCK)
+    def test_tasks(self):
+        """
+        Check that the ingest tasks buffer their samples and check_altitude flushes them before it reads
+        """
+        other = Satellite.objects.create(name='other', url='http://fleet.test/0')
+        ingest_buffer = buffer.get_buffer()
+        with patch.object(ingest_buffer, 'flush_size', 100):
+            with patch('requests.Session.get', Mock(return_value=response(150, now - timedelta(seconds=20)))):
+                self.assertTrue(get_altitude())
+            with patch('requests.Session.get', Mock(return_value=response(140, now - timedelta(seconds=10)))):
+                # the primary satellite and the other one
+                self.assertEqual(get_altitudes(), 2)
+            self.assertEqual(ingest_buffer.depth(), 3)
+            self.assertFalse(AltitudeModel.objects.exists())
+
+            check_altitude()
+        self.assertEqual(ingest_buffer.depth(), 0)
+        self.assertEqual(AltitudeModel.objects.filter(satellite_id=PRIMARY_SATELLITE).count(), 2)
+        self.assertEqual(HealthModel.objects.get(satellite=other).message, HealthMessage.WARNING.value)
+
+    def test_metrics(self):
+        """
+        Check that /altitudes/buffer/ reports the depth of the buffer and the flushes of every process
+        """
+        ingest_buffer = buffer.get_buffer()
+        ingest_buffer.push(samples(150, 152, 154))
+        ingest_buffer.push(samples(156))
+        metrics = json.loads(self.client.get('/altitudes/buffer/').content)
+        self.assertEqual(metrics['mode'], 'buffered')
+        self.assertEqual(metrics['depth'], 1)
+        self.assertEqual(metrics['max_size'], 5)
+        self.assertEqual((metrics['flushes'], metrics['samples'], metrics['created']), (1, 3, 3))
+        self.assertGreater(metrics['average_flush_seconds'], 0)
@@ -0,0 +1,200 @@
+from django.test import SimpleTestCase, TestCase
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from ..client import CircuitBreaker, SatelliteClient
+from ..models import AltitudeModel
+from ..tasks import get_altitude
+from .. import client
+
+import json
+import threading
+import time
+
+sample = {'altitude': 165.5, 'last_updated': '2024-04-10T02:33:00+00:00'}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers with the next response of the server's queue, the last one is repeated."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        server.connections.add(self.client_address)
+        status, headers, body, delay = server.responses[0] if len(server.responses) == 1 else server.responses.pop(0)
+        time.sleep(delay)
+        try:
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up waiting for a delayed response
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.requests = []
+    server.connections = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stub_responses(*responses):
+    """Returns (status, data[, headers[, delay]]) tuples as the responses queued on a stub server."""
+    queued = []
+    for response in responses:
+        status, data, headers, delay = response + ({}, 0)[len(response) - 2:]
+        queued.append((status, headers, json.dumps(data).encode() if data is not None else b'', delay))
+    return queued
+
+
+class StubServerTestCase(SimpleTestCase):
+    def setUp(self):
+        self.server = start_stub_server()
+        self.respond((200, sample))
+        self.url = f'http://127.0.0.1:{self.server.server_port}/api/satellite/data'
+        self.now = 0
+        self.client = self.create_client()
+
+    def tearDown(self):
+        self.client.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def create_client(self, **options):
+        options = dict(dict(connect_timeout=1, read_timeout=0.2, retries=2, backoff=0, backoff_jitter=0,
+                            failure_threshold=2, reset_timeout=60), **options)
+        return SatelliteClient(self.url, clock=lambda: self.now, **options)
+
+    def respond(self, *responses):
+        self.server.responses = stub_responses(*responses)
+
+    def test_session_reused(self):
+        """
+        Check that consecutive polls share one pooled connection
+        """
+        for i in range(3):
+            self.assertEqual(self.client.fetch(), sample)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_retries(self):
+        """
+        Check that unavailable responses are retried until the api answers
+        """
+        self.respond((503, None), (502, None), (200, sample))
+        self.assertEqual(self.client.fetch(), sample)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.client.breaker.failures, 0)
+
+    def test_retries_bounded(self):
+        """
+        Check that a failing api is given up on after the configured retries
+        """
+        self.respond((503, None))
+        self.assertIsNone(self.client.fetch())
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.client.breaker.failures, 1)
+
+    def test_gives_up_before_next_poll(self):
+        """
+        Check that a poll of the default client gives up, with its retries, well before get_altitudes runs again
+        """
+        from health_apis.celery import app
+
+        interval = app.conf.beat_schedule['get-altitudes']['schedule']
+        self.addCleanup(client.reset_client)
+        self.assertEqual(client.get_client().max_seconds, 6.75)
+        self.assertLess(client.get_client().max_seconds, interval * 0.75)
+
+    def test_read_timeout(self):
+        """
+        Check that a hung api does not block the poll past the read timeout of every try
+        """
+        self.respond((200, sample, {}, 1))
+        started = time.monotonic()
+        self.assertIsNone(self.client.fetch())
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(self.client.breaker.failures, 1)
+
+    def test_circuit_breaker(self):
+        """
+        Check that the circuit opens after repeated failures and lets a single trial through after the reset timeout
+        """
+        self.client = self.create_client(retries=0)
+        self.respond((500, None))
+        self.client.fetch()
+        self.client.fetch()
+        self.assertTrue(self.client.breaker.open)
+
+        # no requests are sent while the circuit is open
+        self.assertIsNone(self.client.fetch())
+        self.assertEqual(len(self.server.requests), 2)
+
+        self.now = 60
+        self.respond((200, sample))
+        self.assertEqual(self.client.fetch(), sample)
+        self.assertFalse(self.client.breaker.open)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_conditional_request(self):
+        """
+        Check that the validators of a response are sent back, and that a 304 is treated as unchanged data
+        """
+        headers = {'ETag': '"v1"', 'Last-Modified': 'Wed, 10 Apr 2024 02:33:00 GMT'}
+        self.respond((200, sample, headers), (304, None, headers))
+        self.assertEqual(self.client.fetch(), sample)
+        self.assertIsNone(self.client.fetch())
+        self.assertEqual(self.server.requests[1]['If-None-Match'], '"v1"')
+        self.assertEqual(self.server.requests[1]['If-Modified-Since'], 'Wed, 10 Apr 2024 02:33:00 GMT')
+        self.assertEqual(self.client.breaker.failures, 0)
+
+
+class CircuitBreakerTestCase(SimpleTestCase):
+    def test_failed_trial(self):
+        """
+        Check that a failed trial opens the circuit again for another reset timeout
+        """
+        now = [0]
+        breaker = CircuitBreaker(1, 10, clock=lambda: now[0])
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        now[0] = 10
+        self.assertTrue(breaker.allow())
+        # only one trial at a time
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        now[0] = 15
+        self.assertFalse(breaker.allow())
+        now[0] = 20
+        self.assertTrue(breaker.allow())
+
+
+class GetAltitudeStubTestCase(TestCase):
+    def setUp(self):
+        self.server = start_stub_server()
+        self.server.responses = stub_responses((200, sample, {'ETag': '"v1"'}))
+        client.reset_client()
+
+    def tearDown(self):
+        client.reset_client()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_altitude(self):
+        """
+        Check that get_altitude stores the altitude served by the api, and skips the unchanged data of a 304
+        """
+        with self.settings(SATELLITE_URL=f'http://127.0.0.1:{self.server.server_port}/'):
+            self.assertTrue(get_altitude())
+            self.server.responses = stub_responses((304, None, {'ETag': '"v1"'}))
+            self.assertFalse(get_altitude())
+        self.assertEqual(AltitudeModel.objects.get().altitude, 165.5)
+        self.assertEqual(self.server.requests[1]['If-None-Match'], '"v1"')
@@ -0,0 +1,93 @@
+from rest_framework import status
+from rest_framework.test import APITestCase
+from ..models import AltitudeModel
+from .. import export
+from datetime import datetime, timedelta, timezone
+
+import csv
+import gzip
+import io
+import json
+
+start = datetime(2024, 4, 6, tzinfo=timezone.utc)
+
+
+class ExportTestCase(APITestCase):
+    def setUp(self):
+        for i in range(25):
+            AltitudeModel.objects.create(altitude=150 + i / 4, date=start + timedelta(seconds=10 * i))
+
+    def _content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        """
+        Check that every altitude is streamed as CSV in date order
+        """
+        response = self.client.get('/altitudes/export/', HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        rows = list(csv.DictReader(io.StringIO(self._content(response).decode())))
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(rows[0], {'altitude': '150.0', 'last_updated': start.isoformat()})
+        self.assertEqual(rows[-1]['last_updated'], (start + timedelta(seconds=240)).isoformat())
+
+    def test_ndjson(self):
+        """
+        Check that every altitude is streamed as one JSON object per line
+        """
+        response = self.client.get('/altitudes/export/', HTTP_ACCEPT='application/x-ndjson')
+        self.assertTrue(response['Content-Type'].startswith('application/x-ndjson'))
+        lines = self._content(response).decode().splitlines()
+        self.assertEqual(len(lines), 25)
+        self.assertEqual(json.loads(lines[1]), {
+                         'altitude': 150.25, 'last_updated': (start + timedelta(seconds=10)).isoformat()})
+
+    def test_format_parameter(self):
+        """
+        Check that the format can be picked with the format query parameter
+        """
+        response = self.client.get('/altitudes/export/?format=ndjson')
+        self.assertTrue(response['Content-Type'].startswith('application/x-ndjson'))
+
+    def test_date_range(self):
+        """
+        Check that only altitudes from the from date up to the to date are exported
+        """
+        response = self.client.get('/altitudes/export/', {
+            'from': (start + timedelta(seconds=50)).isoformat(),
+            'to': (start + timedelta(seconds=100)).isoformat()}, HTTP_ACCEPT='application/x-ndjson')
+        lines = self._content(response).decode().splitlines()
+        self.assertEqual([json.loads(line)['altitude'] for line in lines], [151.25, 151.5, 151.75, 152, 152.25])
+
+    def test_gzip(self):
+        """
+        Check that the export is gzip compressed when the client accepts it
+        """
+        response = self.client.get('/altitudes/export/', HTTP_ACCEPT='text/csv', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        content = gzip.decompress(self._content(response)).decode()
+        self.assertEqual(len(content.splitlines()), 26)
+
+    def test_not_acceptable(self):
+        """
+        Check that a format other than CSV or NDJSON is refused
+        """
+        response = self.client.get('/altitudes/export/', HTTP_ACCEPT='application/xml')
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+
+    def test_invalid_date(self):
+        """
+        Check that an invalid date is rejected
+        """
+        response = self.client.get('/altitudes/export/?from=yesterday', HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_chunks(self):
+        """
+        Check that rows are serialized in chunks instead of one write per row
+        """
+        rows = [(start + timedelta(seconds=i), 150.0) for i in range(export.ROWS_PER_CHUNK + 1)]
+        chunks = list(export.serialize(iter(rows), 'ndjson'))
+        self.assertEqual(len(chunks), 2)
@@ -0,0 +1,172 @@
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from unittest.mock import Mock, patch
+from ..models import PRIMARY_SATELLITE, AltitudeModel, HealthMessage, HealthModel, Satellite
+from ..tasks import check_altitude, get_altitudes
+from ..conftest import FROZEN_CLOCK, NewDate
+from .. import client, ingest
+
+import datetime
+import json
+
+date = datetime.datetime(2024, 4, 6, 1, 19, 30, tzinfo=datetime.timezone.utc)
+
+
+class FleetResponse:
+    """A satellite api response, the altitude is taken from the url the fleet test gives every satellite."""
+
+    def __init__(self, url):
+        self.ok = True
+        self.status_code = 200
+        self.headers = {}
+        self.altitude = float(url.rsplit('/', 1)[1])
+
+    def json(self):
+        if (self.altitude < 0):
+            raise ValueError('not JSON')
+        return {'altitude': self.altitude, 'last_updated': date.isoformat()}
+
+
+def fake_get(session, url, **kwargs):
+    return FleetResponse(url)
+
+
+def create_satellites(*altitudes):
+    return [Satellite.objects.create(name=f'satellite-{i}', url=f'http://fleet.test/{altitude}')
+            for i, altitude in enumerate(altitudes)]
+
+
+@patch('requests.Session.get', fake_get)
+class GetAltitudesTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        client.reset_client()
+        Satellite.objects.filter(pk=PRIMARY_SATELLITE).update(url='http://fleet.test/170')
+
+    def tearDown(self):
+        cache.clear()
+        client.reset_client()
+
+    def test_fetches_every_satellite(self):
+        """
+        Check that one task stores the altitude of every satellite, even when they share a date
+        """
+        satellites = create_satellites(165, 150)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(get_altitudes(), 3)
+        self.assertEqual(dict(AltitudeModel.objects.filter(date=date).values_list('satellite_id', 'altitude')),
+                         {PRIMARY_SATELLITE: 170, satellites[0].pk: 165, satellites[1].pk: 150})
+
+        # the health of every satellite is evaluated with its own sample
+        low = HealthModel.objects.get(satellite=satellites[1])
+        self.assertEqual(low.message, HealthMessage.WARNING.value)
+        self.assertFalse(HealthModel.objects.filter(satellite=satellites[0]).exists())
+
+        # the next tick finds nothing new
+        self.assertEqual(get_altitudes(), 0)
+
+    def test_invalid_response(self):
+        """
+        Check that a satellite answering invalid JSON does not keep the others from being stored
+        """
+        create_satellites(-1, 165)
+        self.assertEqual(get_altitudes(), 2)
+
+    @override_settings(ALTITUDE_INGEST_MODE='poller')
+    def test_poller_mode(self):
+        """
+        Check that the primary satellite is left to the poller in poller mode
+        """
+        create_satellites(165)
+        self.assertEqual(get_altitudes(), 1)
+        self.assertFalse(AltitudeModel.objects.filter(satellite_id=PRIMARY_SATELLITE).exists())
+
+    def test_only_primary_rollups(self):
+        """
+        Check that the rollups and /stats/ only count the primary satellite
+        """
+        create_satellites(100)
+        with self.captureOnCommitCallbacks(execute=True):
+            get_altitudes()
+        with patch('apis.clock._clock', FROZEN_CLOCK):
+            response = self.client.get('/stats/')
+        self.assertEqual(json.loads(response.content), {'minimum': 170, 'maximum': 170, 'average': 170})
+
+
+@patch('apis.clock._clock', FROZEN_CLOCK)
+class CheckFleetTestCase(TestCase):
+    def test_grouped_average(self):
+        """
+        Check that the window average of every satellite is read with one grouped query
+        """
+        satellites = create_satellites(0, 0, 0)
+        for satellite, altitudes in zip(satellites, [[150, 155], [170, 180], [150, 175]]):
+            for seconds, altitude in enumerate(altitudes):
+                AltitudeModel.objects.create(satellite=satellite, altitude=altitude,
+                                             date=date + datetime.timedelta(seconds=seconds))
+        HealthModel.objects.create(satellite=satellites[2], low_altitude=True, message=HealthMessage.WARNING.value)
+
+        with CaptureQueriesContext(connection) as queries:
+            check_altitude()
+        self.assertEqual(len([query for query in queries if ('AVG' in query['sql'])]), 1)
+
+        messages = dict(HealthModel.objects.values_list('satellite_id', 'message'))
+        self.assertEqual(messages, {
+            satellites[0].pk: HealthMessage.WARNING.value,
+            satellites[1].pk: HealthMessage.OKAY.value,
+            satellites[2].pk: HealthMessage.SUSTAINED.value})
+
+
+@patch('apis.clock._clock', FROZEN_CLOCK)
+class SatelliteViewsTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.satellite = create_satellites(0)[0]
+        AltitudeModel.objects.create(satellite=self.satellite, altitude=150, date=date)
+        AltitudeModel.objects.create(altitude=170, date=date)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_stats(self):
+        """
+        Check that /stats/<id>/ only summarizes the altitudes of that satellite
+        """
+        response = self.client.get(f'/stats/{self.satellite.pk}/')
+        self.assertEqual(json.loads(response.content), {'minimum': 150, 'maximum': 150, 'average': 150})
+        response = self.client.get(f'/stats/{PRIMARY_SATELLITE}/')
+        self.assertEqual(json.loads(response.content), {'minimum': 170, 'maximum': 170, 'average': 170})
+
+    def test_health(self):
+        """
+        Check that /health/<id>/ returns the message of that satellite, and a 204 before it has one
+        """
+        self.assertEqual(self.client.get(f'/health/{self.satellite.pk}/').status_code, 204)
+        with self.captureOnCommitCallbacks(execute=True):
+            HealthModel.objects.create(satellite=self.satellite, low_altitude=True, message=HealthMessage.WARNING.value)
+        response = self.client.get(f'/health/{self.satellite.pk}/')
+        self.assertEqual(response.content.decode(), HealthMessage.WARNING.value)
+        self.assertEqual(self.client.get('/health/').status_code, 204)
+
+    def test_unknown_satellite(self):
+        """
+        Check that the routes of a satellite that does not exist answer with a 404
+        """
+        self.assertEqual(self.client.get('/stats/999/').status_code, 404)
+        self.assertEqual(self.client.get('/health/999/').status_code, 404)
+
+
+class StoreSampleFleetTestCase(TestCase):
+    def test_same_date(self):
+        """
+        Check that the date is only unique per satellite
+        """
+        satellite = create_satellites(0)[0]
+        with transaction.atomic():
+            self.assertTrue(ingest.store_sample(date, 150, satellite.pk))
+            self.assertTrue(ingest.store_sample(date, 170))
+            self.assertFalse(ingest.store_sample(date, 160, satellite.pk))
+        self.assertEqual(AltitudeModel.objects.count(), 2)
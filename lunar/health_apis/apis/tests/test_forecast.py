@@ -0,0 +1,116 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.test import SimpleTestCase
+from rest_framework.test import APITestCase
+from unittest.mock import patch
+from ..forecast import Trend, TrendFit
+from ..models import AltitudeModel, HealthMessage, HealthModel
+from ..conftest import FROZEN_CLOCK, NewDate
+from .. import ingest
+from datetime import datetime, timedelta, timezone
+
+import json
+import math
+
+now = datetime(2024, 4, 6, 1, 20, tzinfo=timezone.utc)
+
+
+class TrendFitTestCase(SimpleTestCase):
+    def test_exact_fits(self):
+        """
+        Check that samples on a line and on a parabola are fitted exactly
+        """
+        fit = TrendFit(timedelta(hours=1))
+        for minute in range(30):
+            fit.push(now + timedelta(minutes=minute), 200 - 0.5 * minute + 0.01 * minute ** 2)
+
+        quadratic = fit.fit(2)
+        date = now + timedelta(minutes=45)
+        self.assertAlmostEqual(quadratic.altitude(date), 200 - 0.5 * 45 + 0.01 * 45 ** 2)
+        self.assertAlmostEqual(quadratic.slope(date), (-0.5 + 0.02 * 45) / 60)
+
+        linear = TrendFit(timedelta(hours=1))
+        for minute in range(30):
+            linear.push(now + timedelta(minutes=minute), 200 - minute)
+        self.assertAlmostEqual(linear.fit(1).slope(now), -1 / 60)
+
+    def test_sliding_matches_refit(self):
+        """
+        Check that a fit updated over many lookbacks matches a fit of only the samples within its lookback
+        """
+        fit = TrendFit(timedelta(minutes=10))
+        samples = [(now + timedelta(seconds=seconds), 170 + 5 * math.sin(seconds / 300))
+                   for seconds in range(0, 6 * 3600, 10)]
+        for date, altitude in samples:
+            fit.push(date, altitude)
+            fit.evict(date)
+
+        refit = TrendFit(timedelta(minutes=10))
+        for date, altitude in samples:
+            if (date >= samples[-1][0] - timedelta(minutes=10)):
+                refit.push(date, altitude)
+        self.assertEqual(len(fit.samples), len(refit.samples))
+        for degree in (1, 2):
+            self.assertAlmostEqual(fit.fit(degree).altitude(now), refit.fit(degree).altitude(now), places=6)
+
+    def test_degenerate(self):
+        """
+        Check that there is no fit with fewer samples than coefficients or with every sample at the same date
+        """
+        fit = TrendFit(timedelta(hours=1))
+        fit.push(now, 170)
+        self.assertIsNone(fit.fit(1))
+        fit.push(now, 180)
+        self.assertIsNone(fit.fit(1))
+
+    def test_crossing(self):
+        """
+        Check the first date a trend is under the threshold
+        """
+        falling = Trend((200.0, -1.0), now)
+        self.assertEqual(falling.crossing(now, 160), now + timedelta(minutes=40))
+        self.assertEqual(falling.crossing(now + timedelta(hours=1), 160), now + timedelta(hours=1))
+        self.assertIsNone(Trend((200.0, 1.0), now).crossing(now, 160))
+        # a parabola that dips under the threshold between 10 and 30 minutes
+        self.assertEqual(Trend((190.0, -4.0, 0.1), now).crossing(now, 160), now + timedelta(minutes=10))
+        self.assertIsNone(Trend((190.0, -4.0, 0.2), now).crossing(now, 160))
+
+
+@patch('apis.clock._clock', FROZEN_CLOCK)
+class ForecastViewTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_early_warning(self):
+        """
+        Check that a falling altitude raises an early warning before it is low, from the samples stored through ingest
+        """
+        for minute in range(20):
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    ingest.store_sample(now - timedelta(minutes=20 - minute), 180 - 0.5 * minute)
+
+        forecast = json.loads(self.client.get('/health/forecast/').content)
+        self.assertEqual((forecast['samples'], forecast['level']), (20, 'early_warning'))
+        self.assertAlmostEqual(forecast['linear']['altitude'], 170)
+        self.assertAlmostEqual(forecast['linear']['time_to_threshold'], 20 * 60, places=3)
+
+        # the same forecast is rebuilt from the database when the evaluator is not cached
+        cache.clear()
+        rebuilt = json.loads(self.client.get('/health/forecast/').content)
+        self.assertAlmostEqual(rebuilt['linear']['time_to_threshold'], 20 * 60, places=3)
+
+    def test_levels(self):
+        """
+        Check that there is no fit without enough samples, and that a low altitude is reported as low
+        """
+        AltitudeModel.objects.bulk_insert([(now - timedelta(minutes=1), 150)])
+        forecast = json.loads(self.client.get('/health/forecast/').content)
+        self.assertEqual((forecast['linear'], forecast['quadratic'], forecast['level']), (None, None, 'okay'))
+
+        HealthModel.objects.create(low_altitude=True, message=HealthMessage.WARNING.value)
+        self.assertEqual(json.loads(self.client.get('/health/forecast/').content)['level'], 'low')
+        self.assertEqual(self.client.get('/health/999/forecast/').status_code, 404)
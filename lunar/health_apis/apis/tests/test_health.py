@@ -0,0 +1,129 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase
+from ..health import HealthEvaluator, transition
+from ..models import HealthMessage, HealthModel
+from .. import ingest
+from datetime import datetime, timedelta, timezone
+
+now = datetime(2024, 4, 6, 1, 20, tzinfo=timezone.utc)
+WARNING, SUSTAINED, OKAY = (HealthMessage.WARNING.value, HealthMessage.SUSTAINED.value, HealthMessage.OKAY.value)
+
+
+class TransitionTestCase(SimpleTestCase):
+    def test_transition(self):
+        """
+        Check every step of the WARNING/SUSTAINED/OKAY state machine
+        """
+        self.assertEqual(transition(False, OKAY, 150), (True, WARNING))
+        self.assertEqual(transition(True, WARNING, 150), (True, WARNING))
+        self.assertEqual(transition(True, WARNING, 170), (False, SUSTAINED))
+        self.assertEqual(transition(False, SUSTAINED, 170), (False, OKAY))
+        self.assertEqual(transition(False, SUSTAINED, 170, resumed=False), (False, SUSTAINED))
+        self.assertEqual(transition(False, SUSTAINED, 150), (True, WARNING))
+        self.assertEqual(transition(False, OKAY, 170), (False, OKAY))
+
+
+class HealthEvaluatorTestCase(SimpleTestCase):
+    def push(self, evaluator, seconds, altitude):
+        return evaluator.push(now + timedelta(seconds=seconds), altitude)
+
+    def test_warning_within_one_sample(self):
+        """
+        Check that the warning is raised by the first sample that brings the window average under the limit
+        """
+        evaluator = HealthEvaluator()
+        for seconds in range(0, 60, 10):
+            self.assertFalse(self.push(evaluator, seconds, 165))
+        # the window is 5 samples of 165 and one of 140, an average of 160.8
+        self.assertFalse(self.push(evaluator, 60, 140))
+        self.assertTrue(self.push(evaluator, 70, 140))
+        self.assertEqual((evaluator.low_altitude, evaluator.message), (True, WARNING))
+
+    def test_sustained_for_a_window(self):
+        """
+        Check that the sustained message is shown for a whole window before the okay message
+        """
+        evaluator = HealthEvaluator(True, WARNING)
+        self.assertTrue(self.push(evaluator, 0, 170))
+        self.assertEqual(evaluator.message, SUSTAINED)
+        for seconds in range(10, 60, 10):
+            self.assertFalse(self.push(evaluator, seconds, 170))
+        self.assertTrue(self.push(evaluator, 60, 170))
+        self.assertEqual(evaluator.message, OKAY)
+
+    def test_out_of_order(self):
+        """
+        Check that a sample older than the newest one is not evaluated
+        """
+        evaluator = HealthEvaluator()
+        self.push(evaluator, 10, 170)
+        self.assertFalse(self.push(evaluator, 0, 100))
+        self.assertEqual(len(evaluator.rolling.samples), 1)
+
+
+class StoreSampleHealthTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def store(self, seconds, altitude):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                return ingest.store_sample(now + timedelta(seconds=seconds), altitude)
+
+    def test_health_follows_samples(self):
+        """
+        Check that storing samples updates the HealthModel as soon as the window average changes
+        """
+        self.store(0, 170)
+        self.assertEqual(HealthModel.objects.count(), 0)
+        self.store(10, 140)
+        health = HealthModel.objects.get()
+        self.assertEqual((health.low_altitude, health.message), (True, WARNING))
+
+        # the evaluator is rebuilt from the database after its own save
+        self.store(20, 200)
+        self.store(30, 200)
+        health.refresh_from_db()
+        self.assertEqual((health.low_altitude, health.message), (False, SUSTAINED))
+
+    def test_health_changed_elsewhere(self):
+        """
+        Check that the evaluator starts from a HealthModel saved by check_altitude
+        """
+        self.store(0, 170)
+        with self.captureOnCommitCallbacks(execute=True):
+            HealthModel.objects.create(low_altitude=True, message=WARNING)
+        self.store(10, 170)
+        self.assertEqual(HealthModel.objects.get().message, SUSTAINED)
+
+    def test_sustained_since_saved(self):
+        """
+        Check that the date of the sample that set the message is saved, and times it once the evaluator is rebuilt
+        """
+        self.store(0, 140)
+        self.store(10, 200)
+        health = HealthModel.objects.get()
+        self.assertEqual((health.message, health.since), (SUSTAINED, now + timedelta(seconds=10)))
+
+        # the save invalidated the evaluator, the rebuilt one keeps the message for a window after that sample
+        self.store(60, 200)
+        self.assertEqual(HealthModel.objects.get().message, SUSTAINED)
+        self.store(70, 200)
+        self.assertEqual(HealthModel.objects.get().message, OKAY)
+
+    def test_batch(self):
+        """
+        Check that a batch moves through the messages by the dates of its samples, like the samples would one by one
+        """
+        samples = [(now, 140), (now + timedelta(seconds=10), 200), (now + timedelta(seconds=20), 200),
+                   (now + timedelta(seconds=80), 200)]
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                ingest.store_samples(samples)
+        health = HealthModel.objects.get()
+        self.assertEqual((health.low_altitude, health.message), (False, OKAY))
+        self.assertEqual(health.since, now + timedelta(seconds=80))
@@ -0,0 +1,102 @@
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+from unittest.mock import patch
+from ..clock import SimulatedClock
+from ..models import HealthMessage, HealthModel, HealthTransitionModel, Satellite
+from datetime import datetime, timedelta, timezone
+
+import json
+
+start = datetime(2024, 4, 6, 1, 0, tzinfo=timezone.utc)
+OKAY, WARNING, SUSTAINED = HealthMessage.OKAY.value, HealthMessage.WARNING.value, HealthMessage.SUSTAINED.value
+
+
+class HealthHistoryTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def log(self, *transitions, satellite_id=1):
+        """Adds (minutes after start, message) transitions to the log."""
+        HealthTransitionModel.objects.bulk_create([
+            HealthTransitionModel(satellite_id=satellite_id, date=start + timedelta(minutes=minutes),
+                                  low_altitude=message == WARNING, message=message)
+            for minutes, message in transitions])
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_logged_on_change(self):
+        """
+        Check that a transition is logged when the health message changes, dated by the clock, and not when it is saved unchanged
+        """
+        clock = SimulatedClock(start)
+        with patch('apis.clock._clock', clock):
+            health = HealthModel.objects.create()
+            clock.advance(timedelta(minutes=1))
+            health.save()
+            clock.advance(timedelta(minutes=1))
+            health.low_altitude, health.message = True, WARNING
+            health.save()
+
+        history = self.get('/health/history/')
+        self.assertEqual(history, {'transitions': [
+            {'date': start.isoformat(), 'low_altitude': False, 'message': OKAY},
+            {'date': (start + timedelta(minutes=2)).isoformat(), 'low_altitude': True, 'message': WARNING},
+        ], 'next': None})
+
+    def test_pages(self):
+        """
+        Check that the pages follow each other by cursor, in order, including transitions at the same date
+        """
+        self.log((0, OKAY), (5, WARNING), (5, SUSTAINED), (7, OKAY), (9, WARNING))
+        dates, url, pages = [], '/health/history/?limit=2', 0
+        while (url):
+            with self.assertNumQueries(1):
+                page = self.get(url)
+            dates += [(transition['date'], transition['message']) for transition in page['transitions']]
+            url, pages = page['next'], pages + 1
+        self.assertEqual(pages, 3)
+        self.assertEqual(dates, [((start + timedelta(minutes=minutes)).isoformat(), message) for minutes, message in [
+            (0, OKAY), (5, WARNING), (5, SUSTAINED), (7, OKAY), (9, WARNING)]])
+
+        page = self.get(f'/health/history/?from={(start + timedelta(minutes=5)).isoformat()}'
+                        f'&to={(start + timedelta(minutes=9)).isoformat()}'.replace('+', '%2B'))
+        self.assertEqual([transition['message'] for transition in page['transitions']], [WARNING, SUSTAINED, OKAY])
+
+        for query in ['limit=0', 'limit=1001', 'cursor=nope', 'from=yesterday']:
+            self.assertEqual(self.client.get(f'/health/history/?{query}').status_code, 400)
+
+    def test_satellites(self):
+        """
+        Check that every satellite has its own history, and unknown satellites are not found
+        """
+        satellite = Satellite.objects.create(name='lunar-2', url='http://example.com/api/satellite/data')
+        self.log((0, OKAY))
+        self.log((3, WARNING), satellite_id=satellite.pk)
+        history = self.get(f'/health/{satellite.pk}/history/')
+        self.assertEqual([transition['message'] for transition in history['transitions']], [WARNING])
+        self.assertEqual(self.client.get('/health/99/history/').status_code, 404)
+        self.assertEqual(self.client.get('/health/99/history/summary/').status_code, 404)
+
+    def test_summary(self):
+        """
+        Check that the time spent in each message is clamped to the range, from the transition in effect at its start
+        """
+        self.log((0, OKAY), (10, WARNING), (25, SUSTAINED), (26, OKAY), (40, WARNING))
+        query = (f'from={(start + timedelta(minutes=5)).isoformat()}'
+                 f'&to={(start + timedelta(minutes=30)).isoformat()}').replace('+', '%2B')
+        with self.assertNumQueries(3):
+            summary = self.get(f'/health/history/summary/?{query}')
+        self.assertEqual(summary['seconds'], {'warning': 15 * 60, 'sustained': 60, 'okay': 9 * 60})
+
+        # the range starts before the first transition, only the logged time counts
+        summary = self.get('/health/history/summary/?from=2024-04-06T00:00:00&to=2024-04-06T01:12:00')
+        self.assertEqual(summary['seconds'], {'warning': 2 * 60, 'sustained': 0, 'okay': 10 * 60})
+
+        self.assertEqual(self.client.get(f'/health/history/summary/?from={start.isoformat()}&to=2024-04-06T00:00:00'
+                                         .replace('+', '%2B')).status_code, 400)
@@ -0,0 +1,142 @@
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import TruncHour
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from ..downsample import lttb
+from ..models import AltitudeModel
+from .. import retention
+from datetime import datetime, timedelta, timezone
+
+import json
+import math
+import random
+
+start = datetime(2024, 4, 1, tzinfo=timezone.utc)
+
+
+class LttbTestCase(TestCase):
+    def test_keeps_endpoints_and_threshold(self):
+        """
+        Check that downsampling keeps the first and last points and returns threshold points
+        """
+        points = [(x, math.sin(x / 10)) for x in range(1000)]
+        sampled = lttb(points, 50)
+        self.assertEqual(len(sampled), 50)
+        self.assertEqual(sampled[0], points[0])
+        self.assertEqual(sampled[-1], points[-1])
+        self.assertEqual(sampled, sorted(sampled))
+
+    def test_keeps_spike(self):
+        """
+        Check that a single outlier survives downsampling
+        """
+        points = [(x, 200.0) for x in range(1000)]
+        points[437] = (437, 120.0)
+        self.assertIn((437, 120.0), lttb(points, 20))
+
+    def test_short_series(self):
+        """
+        Check that a series shorter than the threshold is returned as is
+        """
+        points = [(0, 1.0), (1, 2.0)]
+        self.assertEqual(lttb(points, 10), points)
+
+
+class HistoryTestCase(APITestCase):
+    def setUp(self):
+        # altitudes are multiples of 0.25 so sums are exact in any order
+        random.seed(13)
+        date = start + timedelta(seconds=7)
+        while (date < start + timedelta(days=3)):
+            AltitudeModel.objects.create(altitude=random.randint(560, 800) / 4, date=date)
+            date += timedelta(minutes=11, seconds=random.randint(0, 30))
+
+    def _get(self, **params):
+        return self.client.get('/altitudes/history/', params)
+
+    def _hourly(self, range_start, range_end):
+        rows = AltitudeModel.objects.filter(date__gte=range_start, date__lt=range_end).annotate(
+            hour=TruncHour('date')).values('hour').annotate(
+            Count('id'), Avg('altitude'), Max('altitude'), Min('altitude')).order_by('hour')
+        return [{'date': row['hour'].isoformat(), 'count': row['id__count'], 'minimum': row['altitude__min'],
+                 'maximum': row['altitude__max'], 'average': row['altitude__avg']} for row in rows]
+
+    def test_hourly_buckets(self):
+        """
+        Check that hourly buckets match grouping the raw altitudes by hour
+        """
+        end = start + timedelta(days=2)
+        response = self._get(**{'from': start.isoformat(), 'to': end.isoformat(), 'bucket': 'hour'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = json.loads(response.content)
+        self.assertEqual(content['bucket'], 'hour')
+        self.assertEqual(content['points'], self._hourly(start, end))
+
+    @override_settings(ALTITUDE_RETENTION={
+        'raw': timedelta(days=1), 'minute': timedelta(days=1), 'hour': None, 'day': None, 'fleet': timedelta(days=1)})
+    def test_buckets_across_tiers(self):
+        """
+        Check that hourly buckets are unchanged once older altitudes are compacted into the hourly tier
+        """
+        end = start + timedelta(days=3)
+        expected = self._hourly(start, end)
+        retention.compact(start + timedelta(days=2, hours=5, minutes=30))
+        response = self._get(**{'from': start.isoformat(), 'to': end.isoformat(), 'bucket': 'hour'})
+        self.assertEqual(json.loads(response.content)['points'], expected)
+
+    def test_default_bucket_fits(self):
+        """
+        Check that the finest bucket within the point limit is picked when no bucket is given
+        """
+        with self.settings(HISTORY_MAX_POINTS=50):
+            response = self._get(**{'from': start.isoformat(), 'to': (start + timedelta(days=3)).isoformat()})
+        content = json.loads(response.content)
+        self.assertEqual(content['bucket'], 'day')
+        self.assertEqual(len(content['points']), 3)
+        self.assertEqual(sum(point['count'] for point in content['points']), AltitudeModel.objects.count())
+
+    def test_too_many_buckets(self):
+        """
+        Check that a bucket giving more than the point limit is rejected
+        """
+        response = self._get(**{'from': start.isoformat(), 'to': (start + timedelta(days=3)).isoformat(),
+                                'bucket': 'minute'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_parameters(self):
+        """
+        Check that invalid dates, buckets and point counts are rejected
+        """
+        self.assertEqual(self._get(**{'from': 'yesterday'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._get(**{'from': start.isoformat(), 'to': start.isoformat()}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._get(**{'from': start.isoformat(), 'bucket': 'week'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._get(**{'from': start.isoformat(), 'points': '2'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_lttb_points(self):
+        """
+        Check that points mode returns at most the requested number of raw altitudes
+        """
+        end = start + timedelta(days=3)
+        response = self._get(**{'from': start.isoformat(), 'to': end.isoformat(), 'points': '40'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        points = json.loads(response.content)['points']
+        self.assertEqual(len(points), 40)
+        first = AltitudeModel.objects.order_by('date').first()
+        self.assertEqual(points[0], {'date': first.date.isoformat(), 'altitude': first.altitude})
+
+    def test_lttb_points_from_buckets(self):
+        """
+        Check that points mode downsamples bucket averages when there are too many raw altitudes
+        """
+        end = start + timedelta(days=3)
+        with self.settings(HISTORY_MAX_SAMPLES=100):
+            response = self._get(**{'from': start.isoformat(), 'to': end.isoformat(), 'points': '10'})
+        points = json.loads(response.content)['points']
+        self.assertEqual(len(points), 10)
+        # the first hourly average
+        first_hour = AltitudeModel.objects.filter(date__lt=start + timedelta(hours=1)).aggregate(Avg('altitude'))
+        self.assertEqual(points[0], {'date': start.isoformat(), 'altitude': first_hour['altitude__avg']})
@@ -0,0 +1,99 @@
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncMinute
+from django.test import TestCase
+from ..models import AltitudeModel, MinuteRollupModel
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+
+import gzip
+import json
+import os
+import tempfile
+
+start = datetime(2024, 4, 6, tzinfo=timezone.utc)
+
+
+class ImportAltitudesTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _file(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(path, 'wt') as file:
+            file.write(content)
+        return path
+
+    def _import(self, *args):
+        out = StringIO()
+        call_command('import_altitudes', *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_csv(self):
+        """
+        Check that CSV altitudes are imported with their dates normalized to UTC
+        """
+        path = self._file('altitudes.csv', 'altitude,last_updated\n'
+                          '150.5,2024-04-06T00:00:00+00:00\n'
+                          '151,2024-04-06T02:00:10+02:00\n')
+        output = self._import(path)
+        self.assertIn('Imported 2 altitudes', output)
+        self.assertIn('rows/s', output)
+        self.assertEqual(list(AltitudeModel.objects.order_by('date').values_list('altitude', 'date')), [
+                         (150.5, start), (151, start + timedelta(seconds=10))])
+
+    def test_import_ndjson_in_batches(self):
+        """
+        Check that NDJSON altitudes are imported over several batches, with matching rollups
+        """
+        lines = [json.dumps({'altitude': 150 + i / 4, 'last_updated': (start + timedelta(seconds=10 * i)).isoformat()})
+                 for i in range(100)]
+        path = self._file('altitudes.ndjson.gz', '\n'.join(lines) + '\n')
+        self._import(path, '--batch-size', '7')
+        self.assertEqual(AltitudeModel.objects.count(), 100)
+
+        raw = AltitudeModel.objects.annotate(bucket=TruncMinute('date')).values('bucket').annotate(
+            count=Count('id'), total=Sum('altitude'), minimum=Min('altitude'), maximum=Max('altitude')).order_by('bucket')
+        self.assertEqual(list(raw), list(MinuteRollupModel.objects.order_by('bucket').values(
+            'bucket', 'count', 'total', 'minimum', 'maximum')))
+
+    def test_skip_duplicates(self):
+        """
+        Check that dates already stored or repeated in the file are skipped
+        """
+        AltitudeModel.objects.create(altitude=125, date=start)
+        path = self._file('altitudes.csv', 'altitude,last_updated\n'
+                          f'150,{start.isoformat()}\n'
+                          f'160,{(start + timedelta(seconds=10)).isoformat()}\n'
+                          f'170,{(start + timedelta(seconds=10)).isoformat()}\n')
+        output = self._import(path)
+        self.assertIn('Imported 1 altitudes, skipped 2 duplicates', output)
+        self.assertEqual(list(AltitudeModel.objects.order_by('date').values_list('altitude', flat=True)), [125, 160])
+
+    def test_invalid_rows(self):
+        """
+        Check that invalid rows are skipped, or stop the import with --strict
+        """
+        path = self._file('altitudes.csv', 'altitude,last_updated\n'
+                          f'150,{start.isoformat()}\n'
+                          'high,2024-04-06T00:00:10+00:00\n'
+                          'nan,2024-04-06T00:00:20+00:00\n'
+                          '150,yesterday\n')
+        self.assertIn('3 invalid rows', self._import(path))
+        with self.assertRaises(CommandError):
+            self._import(path, '--strict')
+
+    def test_unknown_format(self):
+        """
+        Check that a file without a known extension needs --format
+        """
+        path = self._file('altitudes.txt', json.dumps({'altitude': 150, 'last_updated': start.isoformat()}))
+        with self.assertRaises(CommandError):
+            self._import(path)
+        self._import(path, '--format', 'ndjson')
+        self.assertEqual(AltitudeModel.objects.count(), 1)
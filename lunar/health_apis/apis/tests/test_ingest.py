@@ -0,0 +1,111 @@
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from unittest import skipUnless
+from unittest.mock import patch
+from ..models import PRIMARY_SATELLITE, AltitudeModel, HealthMessage, HealthModel, MinuteRollupModel, Satellite
+from ..conftest import FROZEN_CLOCK, NewDate
+from datetime import datetime, timedelta, timezone
+
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+now = datetime(2024, 4, 6, 1, 20, tzinfo=timezone.utc)
+
+
+def batch(*altitudes, start=now - timedelta(minutes=1)):
+    return [{'altitude': altitude, 'last_updated': (start + timedelta(seconds=10 * i)).isoformat()}
+            for i, altitude in enumerate(altitudes)]
+
+
+@patch('apis.clock._clock', FROZEN_CLOCK)
+class PostAltitudesTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def post(self, data, path='/altitudes/'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(path, data, format='json')
+
+    def test_batch(self):
+        """
+        Check that a batch is stored with the rollups, the rolling stats and the health of its samples
+        """
+        response = self.post(batch(150, 152, 154))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json(), {'received': 3, 'created': 3, 'duplicates': 0})
+
+        self.assertEqual(AltitudeModel.objects.count(), 3)
+        self.assertEqual(sum(MinuteRollupModel.objects.values_list('count', flat=True)), 3)
+        self.assertEqual(json.loads(self.client.get('/stats/').content), {'minimum': 150, 'maximum': 154, 'average': 152})
+        self.assertEqual(HealthModel.objects.get().message, HealthMessage.WARNING.value)
+
+    def test_duplicates(self):
+        """
+        Check that dates already stored, or repeated within the batch, are skipped
+        """
+        self.post(batch(150, 152))
+        samples = batch(170, 172, 174)
+        response = self.post(samples + samples[2:])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json(), {'received': 4, 'created': 1, 'duplicates': 3})
+        self.assertEqual(sorted(AltitudeModel.objects.values_list('altitude', flat=True)), [150, 152, 174])
+
+        response = self.post(batch(150))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_invalid(self):
+        """
+        Check that a batch with an invalid sample is rejected as a whole, with the errors of every sample
+        """
+        samples = batch(150, 152, 154)
+        samples[1]['last_updated'] = 'yesterday'
+        samples[2]['altitude'] = 'nan'
+        response = self.post(samples)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.json()
+        self.assertEqual(errors[0], {})
+        self.assertIn('last_updated', errors[1])
+        self.assertIn('non_field_errors', errors[2])
+        self.assertFalse(AltitudeModel.objects.exists())
+
+        for data in [{}, [], ['150']]:
+            self.assertEqual(self.post(data).status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(INGEST_MAX_BATCH_SIZE=2):
+            self.assertEqual(self.post(batch(150, 152, 154)).status_code, status.HTTP_400_BAD_REQUEST)
+
+    @skipUnless(msgpack, 'MessagePack bodies require msgpack')
+    def test_msgpack(self):
+        """
+        Check that MessagePack bodies are accepted, with ISO 8601 strings or timestamps as dates
+        """
+        samples = batch(150, 152)
+        samples[1]['last_updated'] = now
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/altitudes/', msgpack.packb(samples, datetime=True),
+                                        content_type='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(AltitudeModel.objects.filter(date=now, altitude=152).exists())
+
+        response = self.client.post('/altitudes/', b'\x93\x01', content_type='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_satellite(self):
+        """
+        Check that /altitudes/<id>/ stores the samples of that satellite, and answers 404 for unknown satellites
+        """
+        satellite = Satellite.objects.create(name='pushed', url='http://fleet.test/0')
+        response = self.post(batch(150, 152), f'/altitudes/{satellite.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(AltitudeModel.objects.filter(satellite=satellite).count(), 2)
+        self.assertFalse(AltitudeModel.objects.filter(satellite_id=PRIMARY_SATELLITE).exists())
+        self.assertFalse(MinuteRollupModel.objects.exists())
+        self.assertEqual(self.post(batch(150), '/altitudes/999/').status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,133 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from rest_framework.test import APITestCase
+from unittest.mock import Mock, patch
+from ..metrics import Histogram, MemoryMetrics, Recorder
+from ..tasks import get_altitude
+from .. import client, metrics
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+
+def parse(text):
+    """Returns the samples of a Prometheus text exposition by name and labels."""
+    samples = {}
+    for line in text.splitlines():
+        if (line.startswith('#')):
+            continue
+        sample, value = line.rsplit(' ', 1)
+        samples[sample] = float(value)
+    return samples
+
+
+class RegistryTestCase(SimpleTestCase):
+    def test_histogram(self):
+        """
+        Check that histogram buckets are cumulative, values observed at once count like values observed one by one,
+        and the samples of several processes add up in the store
+        """
+        histogram = Histogram('test_histogram', 'A histogram of the test.', ['kind'], buckets=(1, 5))
+        store = MemoryMetrics({})
+        # two processes recording into the same store
+        for values, at_once in [((0.5, 1), False), ((3, 7), True)]:
+            recorder = Recorder(store, None)
+            with patch('apis.metrics._record', recorder.record):
+                if (at_once):
+                    histogram.observe_many(list(values), kind='a')
+                else:
+                    for value in values:
+                        histogram.observe(value, kind='a')
+            recorder.push()
+
+        values = {(key, field): value for (name, key, field), value in store.read().items()}
+        samples = {name + str(sorted(labels.items())): value for name, labels, value in histogram.samples(values)}
+        del metrics.REGISTRY['test_histogram']
+        self.assertEqual(samples["test_histogram_bucket[('kind', 'a'), ('le', '1.0')]"], 2)
+        self.assertEqual(samples["test_histogram_bucket[('kind', 'a'), ('le', '5.0')]"], 3)
+        self.assertEqual(samples["test_histogram_bucket[('kind', 'a'), ('le', '+Inf')]"], 4)
+        self.assertEqual(samples["test_histogram_count[('kind', 'a')]"], 4)
+        self.assertEqual(samples["test_histogram_sum[('kind', 'a')]"], 11.5)
+
+    def test_failed_push(self):
+        """
+        Check that the samples of a push that fails are kept for the next one, with one warning per WARNING_INTERVAL
+        """
+        store = MemoryMetrics({})
+        recorder = Recorder(store, None)
+        recorder.record([(('test_counter', (), 'total'), 2)])
+        with patch.object(store, 'push', side_effect=ConnectionError), self.assertLogs('apis.metrics') as logs:
+            recorder.push()
+            recorder.push()
+        self.assertEqual([record.levelname for record in logs.records], ['WARNING'])
+        self.assertIsNone(logs.records[0].exc_info)
+        recorder.push()
+        self.assertEqual(store.read(), {('test_counter', (), 'total'): 2})
+
+    def test_started(self):
+        """
+        Check that only a started process pushes at exit, and the recorders it creates later are started too
+        """
+        with patch('apis.metrics._started', False), patch('atexit.register') as register:
+            metrics._reset_recorder()
+            recorder = metrics.get_recorder()
+            register.assert_not_called()
+            metrics.start()
+            register.assert_called_once_with(recorder.push)
+            metrics._reset_recorder()
+            recorder = metrics.get_recorder()
+            self.assertEqual(register.call_args.args, (recorder.push,))
+        metrics._reset_recorder()
+
+
+class MetricsViewTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        client.reset_client()
+        metrics._reset_recorder()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_requests(self):
+        """
+        Check that /metrics reports the latency and the queries of the requests by route, and their database time
+        """
+        self.client.get('/stats/')
+        self.client.get('/stats/')
+        self.client.get('/nowhere/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+        samples = parse(response.content.decode())
+        self.assertEqual(samples['http_request_duration_seconds_count{method="GET",route="/stats/",status="200"}'], 2)
+        self.assertEqual(samples['http_request_duration_seconds_count{method="GET",route="unmatched",status="404"}'], 1)
+        self.assertGreater(samples['http_request_queries_sum{route="/stats/"}'], 0)
+        self.assertEqual(samples['http_request_queries_sum{route="/stats/"}'],
+                         samples['db_query_duration_seconds_count{source="/stats/"}'])
+
+    def test_ingest(self):
+        """
+        Check that created and duplicate samples are counted, with the lag of the created ones
+        """
+        now = datetime.now(timezone.utc)
+        samples = [{'altitude': 165, 'last_updated': (now - timedelta(seconds=seconds)).isoformat()} for seconds in (3, 2)]
+        self.client.post('/altitudes/', samples + samples[:1], format='json')
+
+        samples = parse(self.client.get('/metrics').content.decode())
+        self.assertEqual(samples['ingest_samples_total{result="created"}'], 2)
+        self.assertEqual(samples['ingest_samples_total{result="duplicate"}'], 1)
+        self.assertEqual(samples['ingest_lag_seconds_bucket{le="0.5"}'], 0)
+        self.assertEqual(samples['ingest_lag_seconds_bucket{le="5.0"}'], 2)
+
+    @patch('requests.Session.get', Mock(side_effect=requests.ConnectionError))
+    def test_tasks(self):
+        """
+        Check that the celery tasks report their duration, and the upstream failures are counted by reason
+        """
+        self.assertFalse(get_altitude.apply().get())
+        samples = parse(self.client.get('/metrics').content.decode())
+        self.assertEqual(samples['celery_task_duration_seconds_count{task="apis.tasks.get_altitude",state="SUCCESS"}'], 1)
+        self.assertEqual(samples['upstream_failures_total{reason="unreachable"}'], 1)
+        self.assertEqual(samples['upstream_request_duration_seconds_count'], 1)
@@ -0,0 +1,146 @@
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError
+from django.test import TestCase
+from ..models import AltitudeModel
+from ..poller import CadenceEstimator, Poller
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+
+start = datetime(2024, 4, 6, tzinfo=timezone.utc)
+options = {'MIN_INTERVAL': 1, 'MAX_INTERVAL': 60, 'MARGIN': 0.5, 'HISTORY': 20, 'LEASE': 120}
+
+
+class Upstream:
+    """A satellite api that updates last_updated every interval seconds, delay seconds after the update."""
+
+    def __init__(self, clock, interval, delay):
+        self.clock = clock
+        self.interval = interval
+        self.delay = delay
+        self.stopped_at = None
+
+    def fetch(self):
+        now = self.clock.now if self.stopped_at is None else min(self.clock.now, self.stopped_at)
+        updates = int((now - start.timestamp() - self.delay) // self.interval)
+        return {'altitude': 150 + updates % 10, 'last_updated': (start + timedelta(seconds=updates * self.interval)).isoformat()}
+
+
+class Clock:
+    def __init__(self):
+        self.now = start.timestamp() + 1
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class CadenceEstimatorTestCase(TestCase):
+    def test_interval(self):
+        """
+        Check that the interval is the median delta, so a missed update does not change it
+        """
+        estimator = CadenceEstimator(10, 0.5)
+        self.assertIsNone(estimator.interval)
+        for seconds in [0, 7, 14, 28, 35]:
+            estimator.observe(start + timedelta(seconds=seconds), start.timestamp() + seconds + 1)
+        self.assertEqual(estimator.interval, 7)
+
+    def test_next_update(self):
+        """
+        Check that the next fetch is aimed between the latest early fetch and the earliest late fetch, until they are within the margin
+        """
+        estimator = CadenceEstimator(10, 0.5)
+        estimator.observe(start, start.timestamp() + 3)
+        self.assertIsNone(estimator.next_update())
+        estimator.observe(start + timedelta(seconds=7), start.timestamp() + 9)
+        # without early fetches the next one probes one margin earlier
+        self.assertEqual(estimator.publish_delay, 2)
+        self.assertEqual(estimator.next_update(), start.timestamp() + 15.5)
+
+        estimator.observe_miss(start.timestamp() + 14.5)
+        self.assertEqual(estimator.next_update(), start.timestamp() + 15.25)
+        estimator.observe_miss(start.timestamp() + 15.6)
+        self.assertEqual(estimator.next_update(), start.timestamp() + 16)
+
+
+class PollerTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clock = Clock()
+        self.upstream = Upstream(self.clock, interval=7, delay=0.3)
+        patcher = patch('apis.client.get_client', return_value=self.upstream)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        cache.clear()
+
+    def _poller(self):
+        return Poller(options, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_learns_cadence(self):
+        """
+        Check that once the cadence is learned every update is fetched with one request, just after it is published
+        """
+        poller = self._poller()
+        poller.run(20)
+        fetches, stored = poller.fetches, poller.stored
+
+        poller.run(50)
+        self.assertAlmostEqual(poller.estimator.interval, 7)
+        self.assertEqual(poller.fetches - fetches, poller.stored - stored)
+        # the latest updates were fetched within the margin of their publication
+        self.assertLessEqual(max(list(poller.estimator.late)[-10:]), 0.3 + options['MARGIN'])
+        self.assertEqual(AltitudeModel.objects.count(), poller.stored)
+
+    def test_back_off(self):
+        """
+        Check that the poller backs off to the maximum interval once the data stops changing
+        """
+        poller = self._poller()
+        poller.run(10)
+        self.upstream.stopped_at = self.clock.now
+        poller.run(10)
+        self.assertEqual(self.clock.sleeps[-1], options['MAX_INTERVAL'])
+        self.assertEqual(self.clock.sleeps[-8:], [2, 4, 8, 16, 32, 60, 60, 60])
+
+    def test_failed_polls(self):
+        """
+        Check that invalid JSON and a database error are logged and backed off from instead of stopping the poller
+        """
+        upstream = Mock(url='http://satellite.test/', fetch=Mock(side_effect=[
+            ValueError('Expecting value'), {'altitude': 150, 'last_updated': start.isoformat()}]))
+        poller = self._poller()
+        with patch('apis.client.get_client', return_value=upstream), \
+                patch('apis.ingest.store_sample', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('apis.poller', 'WARNING') as logs:
+            poller.run(2)
+        self.assertEqual((poller.fetches, poller.stored, poller.errors), (2, 0, 1))
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(self.clock.sleeps, [1, 2])
+
+    def test_leader(self):
+        """
+        Check that only the leader polls, and that another poller takes over once the leader stops
+        """
+        leader, follower = self._poller(), self._poller()
+        self.assertTrue(leader.leader.acquire())
+        follower.run(3)
+        self.assertEqual(follower.fetches, 0)
+        self.assertEqual(self.clock.sleeps, [60, 60, 60])
+
+        leader.leader.release()
+        follower.run(1)
+        self.assertEqual(follower.fetches, 1)
+
+    def test_lease_longer_than_interval(self):
+        """
+        Check that a lease the leader could lose while sleeping is refused
+        """
+        with self.assertRaises(ImproperlyConfigured):
+            Poller(dict(options, LEASE=60))
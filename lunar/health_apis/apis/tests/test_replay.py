@@ -0,0 +1,61 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from ..clock import SystemClock
+from ..models import AltitudeModel, HealthMessage, HealthModel, Satellite
+from .. import clock
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+
+import json
+import os
+import tempfile
+
+start = datetime(2024, 4, 6, tzinfo=timezone.utc)
+
+
+class ReplayTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_timeline(self):
+        """
+        Check that a replayed low altitude shows in the timeline in simulated time, and the database is rolled back
+        """
+        # a sample every 10 seconds for 20 minutes, 140 km from minute 5 to 8
+        path = os.path.join(self.directory.name, 'altitudes.ndjson')
+        with open(path, 'w') as file:
+            for second in range(0, 20 * 60, 10):
+                altitude = 140 if (300 <= second < 480) else 175
+                file.write(json.dumps({'altitude': altitude,
+                                       'last_updated': (start + timedelta(seconds=second)).isoformat()}) + '\n')
+            file.write('{"altitude": "high"}\n')
+
+        output = os.path.join(self.directory.name, 'replay.json')
+        call_command('replay', path, '--output', output, stdout=StringIO())
+        with open(output) as file:
+            result = json.load(file)
+
+        self.assertEqual((result['samples'], result['created'], result['invalid']), (120, 120, 1))
+        self.assertEqual(result['simulated_seconds'], 1190)
+        self.assertEqual([change['message'] for change in result['timeline']], [
+            HealthMessage.OKAY.value, HealthMessage.WARNING.value, HealthMessage.SUSTAINED.value,
+            HealthMessage.OKAY.value])
+        # the window average drops under 160 with the fourth low sample
+        warning = result['timeline'][1]
+        self.assertEqual(warning['date'], (start + timedelta(seconds=330)).isoformat())
+        self.assertTrue(warning['low_altitude'])
+        self.assertEqual(sum(change['seconds'] for change in result['timeline']), 1190 - 60)
+        # added up in the database, the same as the durations of the timeline
+        self.assertEqual(result['seconds'], {
+            'okay': result['timeline'][0]['seconds'] + result['timeline'][3]['seconds'],
+            'warning': result['timeline'][1]['seconds'],
+            'sustained': result['timeline'][2]['seconds'],
+        })
+
+        self.assertEqual(list(Satellite.objects.values_list('name', flat=True)), ['primary'])
+        self.assertFalse(AltitudeModel.objects.exists())
+        self.assertFalse(HealthModel.objects.exists())
+        self.assertIsInstance(clock.get_clock(), SystemClock)
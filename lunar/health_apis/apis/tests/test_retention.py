@@ -0,0 +1,102 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count, F, Max, Min, Sum
+from django.test import TestCase, override_settings
+from ..models import AltitudeModel, DailyRollupModel, HourlyRollupModel, MinuteRollupModel, Satellite
+from .. import retention, rollups
+from datetime import datetime, timedelta, timezone
+
+import random
+
+start = datetime(2024, 4, 1, tzinfo=timezone.utc)
+now = start + timedelta(days=10)
+
+RETENTION = {
+    'raw': timedelta(days=2),
+    'minute': timedelta(days=3),
+    'hour': timedelta(days=5),
+    'day': None,
+    'fleet': timedelta(days=4),
+}
+
+
+def _raw_summary(range_start, range_end):
+    aggregate = AltitudeModel.objects.filter(date__gte=range_start, date__lt=range_end).aggregate(
+        count=Count('id'), total=Sum('altitude'), minimum=Min('altitude'), maximum=Max('altitude'),
+        squares=Sum(F('altitude') * F('altitude')))
+    return rollups.Summary(aggregate['count'], aggregate['total'], aggregate['minimum'], aggregate['maximum'],
+                           aggregate['squares'])
+
+
+@override_settings(ALTITUDE_RETENTION=RETENTION, ALTITUDE_RETENTION_BATCH_SIZE=100)
+class CompactTestCase(TestCase):
+    def setUp(self):
+        # altitudes are multiples of 0.25 so sums and sums of squares are exact in any order
+        random.seed(11)
+        date = start + timedelta(seconds=13)
+        while (date < now):
+            AltitudeModel.objects.create(altitude=random.randint(560, 800) / 4, date=date)
+            date += timedelta(minutes=19, seconds=random.randint(0, 30))
+
+        self.ranges = [
+            (start, now),
+            (now - timedelta(days=4, hours=12), now - timedelta(minutes=30, seconds=-7)),
+            (now - timedelta(days=1, seconds=-17), now - timedelta(hours=2, seconds=3)),
+        ]
+        self.expected = [_raw_summary(*r) for r in self.ranges]
+
+    def test_deletes_past_retention(self):
+        """
+        Check that every tier only keeps rows within its retention period
+        """
+        deleted = retention.compact(now)
+        self.assertGreater(deleted['raw'], 0)
+        self.assertFalse(AltitudeModel.objects.filter(date__lt=now - RETENTION['raw']).exists())
+        self.assertFalse(MinuteRollupModel.objects.filter(bucket__lt=now - RETENTION['minute']).exists())
+        self.assertFalse(HourlyRollupModel.objects.filter(bucket__lt=now - RETENTION['hour']).exists())
+        self.assertEqual(DailyRollupModel.objects.filter(bucket__lt=now - RETENTION['raw']).count(), 8)
+
+    def test_other_satellites(self):
+        """
+        Check that the raw altitudes of satellites without rollups are kept past the raw retention period, until the fleet one
+        """
+        satellite = Satellite.objects.create(name='lunar-2', url='http://example.com/api/satellite/data')
+        AltitudeModel.objects.bulk_insert([(now - timedelta(days=5), 170), (now - timedelta(days=3), 170)], satellite.pk)
+        deleted = retention.compact(now)
+        self.assertEqual(deleted['fleet'], 1)
+        self.assertEqual(list(AltitudeModel.objects.filter(satellite=satellite).values_list('date', flat=True)),
+                         [now - timedelta(days=3)])
+        self.assertFalse(AltitudeModel.objects.filter(satellite_id=1, date__lt=now - RETENTION['raw']).exists())
+
+    def test_range_stats_across_tiers(self):
+        """
+        Check that ranges spanning the tiers give the same summary as the raw altitudes did
+        """
+        retention.compact(now)
+        for (range_start, range_end), expected in zip(self.ranges, self.expected):
+            self.assertEqual(rollups.range_stats(range_start, range_end), expected)
+
+    def test_compact_is_idempotent(self):
+        """
+        Check that compacting again does not change the compacted tiers
+        """
+        retention.compact(now)
+        hourly = list(HourlyRollupModel.objects.order_by('bucket').values('bucket', 'count', 'total'))
+        retention.compact(now)
+        self.assertEqual(
+            list(HourlyRollupModel.objects.order_by('bucket').values('bucket', 'count', 'total')), hourly)
+        self.assertEqual(rollups.range_stats(*self.ranges[0]), self.expected[0])
+
+    def test_range_stats_without_compaction(self):
+        """
+        Check that ranges are read from the minute rollups and raw altitudes before anything is compacted
+        """
+        for (range_start, range_end), expected in zip(self.ranges, self.expected):
+            self.assertEqual(rollups.range_stats(range_start, range_end), expected)
+
+    @override_settings(ALTITUDE_RETENTION=dict(RETENTION, minute=timedelta(days=1)))
+    def test_rejects_shorter_coarse_retention(self):
+        """
+        Check that a tier kept for less time than the finer tier it is compacted from is rejected
+        """
+        with self.assertRaises(ImproperlyConfigured):
+            retention.compact(now)
@@ -0,0 +1,115 @@
+from django.core.management import call_command
+from django.db.models import Avg, Count, Max, Min
+from django.test import TestCase
+from ..models import AltitudeModel, MinuteRollupModel
+from .. import rollups
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+
+import random
+import statistics
+
+start = datetime(2024, 4, 6, 1, 0, tzinfo=timezone.utc)
+
+
+def _raw_stats(d):
+    aggregate = AltitudeModel.objects.filter(date__gte=d).aggregate(
+        Count('id'), Avg('altitude'), Max('altitude'), Min('altitude'))
+    return {
+        'count': aggregate['id__count'],
+        'minimum': aggregate['altitude__min'],
+        'maximum': aggregate['altitude__max'],
+        'average': aggregate['altitude__avg']
+    }
+
+
+def _rollup_stats(d):
+    summary = rollups.window_stats(d)
+    return dict(summary.as_stats(), count=summary.count)
+
+
+class RollupTestCase(TestCase):
+    def setUp(self):
+        # altitudes are multiples of 0.25 so sums are exact in any order
+        random.seed(3)
+        for seconds in random.sample(range(20 * 60), 120):
+            AltitudeModel.objects.create(
+                altitude=random.randint(560, 800) / 4, date=start + timedelta(seconds=seconds))
+
+    def test_rollups_created_on_insert(self):
+        """
+        Check that every minute with altitudes has a rollup matching its rows
+        """
+        for rollup in MinuteRollupModel.objects.all():
+            aggregate = AltitudeModel.objects.filter(
+                date__gte=rollup.bucket, date__lt=rollup.bucket + timedelta(minutes=1)).aggregate(
+                Count('id'), Max('altitude'), Min('altitude'))
+            self.assertEqual(rollup.count, aggregate['id__count'])
+            self.assertEqual(rollup.minimum, aggregate['altitude__min'])
+            self.assertEqual(rollup.maximum, aggregate['altitude__max'])
+        self.assertEqual(sum(MinuteRollupModel.objects.values_list('count', flat=True)), 120)
+
+    def test_window_matches_raw_aggregate(self):
+        """
+        Check that window stats from rollups match aggregating the raw rows, for aligned and partial minutes
+        """
+        for seconds in [0, 1, 59, 60, 61, 305, 599, 600, 1199, 1200, 1201]:
+            d = start + timedelta(seconds=seconds)
+            self.assertDictEqual(_rollup_stats(d), _raw_stats(d))
+
+    def test_window_reads_rollups(self):
+        """
+        Check that an aligned window is answered with a single rollup query
+        """
+        with self.assertNumQueries(1):
+            rollups.window_stats(start + timedelta(minutes=15))
+
+    def test_windows_in_one_pass(self):
+        """
+        Check that the stats of several windows are read with one rollup query and one for the partial minutes
+        """
+        starts = [start + timedelta(seconds=seconds) for seconds in [1, 61, 305, 599, 1100]]
+        with self.assertNumQueries(2):
+            summaries = rollups.windows_stats(starts)
+        self.assertEqual(summaries, [rollups.window_stats(d) for d in starts])
+
+        for d, summary in zip(starts, summaries):
+            altitudes = list(AltitudeModel.objects.filter(date__gte=d).values_list('altitude', flat=True))
+            self.assertAlmostEqual(summary.stddev, statistics.pstdev(altitudes))
+
+    def test_empty_window(self):
+        """
+        Check that a window without altitudes has no stats
+        """
+        summary = rollups.window_stats(start + timedelta(hours=1))
+        self.assertEqual(summary.count, 0)
+        self.assertDictEqual(summary.as_stats(), {"minimum": None, "maximum": None, "average": None})
+
+
+class BackfillRollupsTestCase(TestCase):
+    def setUp(self):
+        random.seed(5)
+        for seconds in random.sample(range(3 * 24 * 60 * 60), 200):
+            AltitudeModel.objects.create(
+                altitude=random.randint(560, 800) / 4, date=start + timedelta(seconds=seconds))
+        self.expected = list(MinuteRollupModel.objects.order_by('bucket').values(
+            'bucket', 'count', 'total', 'minimum', 'maximum', 'squares'))
+
+    def test_backfill_matches_incremental(self):
+        """
+        Check that the backfill command rebuilds the same rollups as the inserts created
+        """
+        MinuteRollupModel.objects.all().delete()
+        call_command('backfill_rollups', '--chunk-hours', '5', stdout=StringIO())
+        rebuilt = list(MinuteRollupModel.objects.order_by('bucket').values(
+            'bucket', 'count', 'total', 'minimum', 'maximum', 'squares'))
+        self.assertEqual(rebuilt, self.expected)
+
+    def test_backfill_is_idempotent(self):
+        """
+        Check that running the backfill over existing rollups does not change them
+        """
+        call_command('backfill_rollups', stdout=StringIO())
+        rebuilt = list(MinuteRollupModel.objects.order_by('bucket').values(
+            'bucket', 'count', 'total', 'minimum', 'maximum', 'squares'))
+        self.assertEqual(rebuilt, self.expected)
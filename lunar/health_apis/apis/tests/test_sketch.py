@@ -0,0 +1,134 @@
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APITestCase
+from unittest.mock import patch
+from ..models import AltitudeModel, Satellite, SketchBinModel
+from ..sketch import DDSketch
+from ..conftest import FROZEN_CLOCK, NewDate
+from .. import rollups
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+
+import json
+import numpy
+import random
+
+start = datetime(2024, 4, 6, 1, 0, tzinfo=timezone.utc)
+ACCURACY = 0.001
+PERCENTILES = [0, 1, 5, 25, 50, 75, 95, 99, 99.9, 100]
+
+
+def estimates(sketch):
+    return {percentile: sketch.quantile(percentile / 100) for percentile in PERCENTILES}
+
+
+class SketchAssertions:
+    def assertWithinBound(self, estimates, altitudes):
+        """Checks estimated percentiles against the exact percentiles of the altitudes.
+
+            A sketch answers with a value within the relative accuracy of an altitude of the rank,
+            which lies between the exact percentiles rounded down and up to an altitude.
+        """
+        for percentile, estimate in estimates.items():
+            lower = numpy.percentile(altitudes, percentile, method='lower')
+            higher = numpy.percentile(altitudes, percentile, method='higher')
+            self.assertGreaterEqual(estimate, lower * (1 - ACCURACY), percentile)
+            self.assertLessEqual(estimate, higher * (1 + ACCURACY), percentile)
+
+
+class DDSketchTestCase(SketchAssertions, SimpleTestCase):
+    def test_error_bound(self):
+        """
+        Check that the percentiles are within the relative accuracy for narrow, wide and skewed distributions
+        """
+        rng = numpy.random.default_rng(7)
+        for altitudes in [rng.normal(165, 3, 10000), rng.uniform(100, 300, 10000), rng.lognormal(5, 1, 10000)]:
+            sketch = DDSketch(ACCURACY)
+            for altitude in altitudes:
+                sketch.add(float(altitude))
+            self.assertWithinBound(estimates(sketch), altitudes)
+            # the bins only grow with the logarithm of the range
+            self.assertLess(len(sketch.bins), 10000)
+
+    def test_merge(self):
+        """
+        Check that merged sketches are the sketch of all their altitudes
+        """
+        rng = random.Random(1)
+        altitudes = [rng.uniform(140, 180) for _ in range(1000)]
+        merged, first, second = DDSketch(ACCURACY), DDSketch(ACCURACY), DDSketch(ACCURACY)
+        for altitude in altitudes:
+            merged.add(altitude)
+        for altitude in altitudes[:300]:
+            first.add(altitude)
+        for altitude in altitudes[300:]:
+            second.add(altitude)
+        first.merge(second)
+        self.assertEqual(first.bins, merged.bins)
+        self.assertIsNone(DDSketch(ACCURACY).quantile(0.5))
+
+
+class StoredSketchTestCase(SketchAssertions, TestCase):
+    def setUp(self):
+        rng = random.Random(4)
+        for seconds in rng.sample(range(3 * 60 * 60), 600):
+            AltitudeModel.objects.create(altitude=rng.gauss(165, 5), date=start + timedelta(seconds=seconds))
+
+    def test_windows(self):
+        """
+        Check that the sketches merged from whole hours and partial hours are within the bound, in constant queries
+        """
+        starts = [start + timedelta(minutes=minutes) for minutes in [0, 1, 59, 61, 150]]
+        with self.assertNumQueries(2):
+            sketches = rollups.windows_sketches(starts)
+        for window_start, sketch in zip(starts, sketches):
+            altitudes = list(AltitudeModel.objects.filter(date__gte=window_start).values_list('altitude', flat=True))
+            self.assertEqual(sketch.count, len(altitudes))
+            self.assertWithinBound(estimates(sketch), altitudes)
+
+    def test_backfill_matches_incremental(self):
+        """
+        Check that backfill_rollups rebuilds the same sketches as the inserts created
+        """
+        expected = list(SketchBinModel.objects.order_by('bucket', 'bin').values_list('bucket', 'bin', 'count'))
+        self.assertEqual(len({bucket for bucket, bin, count in expected}), 3)
+        SketchBinModel.objects.all().delete()
+        call_command('backfill_rollups', '--chunk-hours', '1', stdout=StringIO())
+        self.assertEqual(list(SketchBinModel.objects.order_by('bucket', 'bin').values_list('bucket', 'bin', 'count')),
+                         expected)
+
+
+@patch('apis.clock._clock', FROZEN_CLOCK)
+class PercentilesViewTestCase(SketchAssertions, APITestCase):
+    def setUp(self):
+        # NewDate.now() is 01:20, the 5 minute window starts at 01:15
+        rng = random.Random(9)
+        self.altitudes = []
+        for seconds in range(-600, 300, 5):
+            altitude = rng.gauss(165, 5)
+            AltitudeModel.objects.create(altitude=altitude, date=start + timedelta(minutes=20, seconds=seconds))
+            if (seconds >= -300):
+                self.altitudes.append(altitude)
+
+    def test_percentiles(self):
+        """
+        Check that /stats/?percentiles= adds the percentiles of the window, and keeps the other stats
+        """
+        stats = json.loads(self.client.get('/stats/?percentiles=50,95,99').content)
+        self.assertEqual(list(stats['percentiles']), ['50', '95', '99'])
+        self.assertEqual(stats['minimum'], min(self.altitudes))
+        self.assertWithinBound({float(percentile): estimate for percentile, estimate in stats['percentiles'].items()},
+                               self.altitudes)
+
+        windows = json.loads(self.client.get('/stats/?windows=5m,1h&percentiles=50').content)
+        self.assertEqual(windows['5m']['percentiles'], {'50': stats['percentiles']['50']})
+
+    def test_invalid_percentiles(self):
+        """
+        Check that malformed percentiles and percentiles of other satellites are rejected with a 400
+        """
+        for percentiles in ['abc', '101', '-1', 'nan', '50,']:
+            response = self.client.get(f'/stats/?percentiles={percentiles}')
+            self.assertEqual(response.status_code, 400, percentiles)
+        satellite = Satellite.objects.create(name='other', url='http://fleet.test/0')
+        self.assertEqual(self.client.get(f'/stats/{satellite.pk}/?percentiles=50').status_code, 400)
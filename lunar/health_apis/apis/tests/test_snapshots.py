@@ -0,0 +1,124 @@
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.test import APITestCase
+from ..models import AltitudeModel, HealthMessage, HealthModel
+from .. import aggregator, snapshots
+from ..conftest import FROZEN_CLOCK, NewDate
+from datetime import timezone
+from unittest.mock import patch
+
+
+class HealthSnapshotTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.health = HealthModel.objects.create(low_altitude=True, message=HealthMessage.WARNING.value)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_published_on_write(self):
+        """
+        Check that a saved health message is served from the snapshot without querying the database
+        """
+        with self.assertNumQueries(0):
+            response = self.client.get('/health/')
+        self.assertEqual(response.content.decode(), HealthMessage.WARNING.value)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_if_none_match(self):
+        """
+        Check that a client with the current ETag gets a 304 without any database access
+        """
+        etag = self.client.get('/health/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/health/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_if_modified_since(self):
+        """
+        Check that a client with the current Last-Modified date gets a 304
+        """
+        last_modified = self.client.get('/health/')['Last-Modified']
+        response = self.client.get('/health/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_invalidated_on_write(self):
+        """
+        Check that a client with the ETag of a replaced message gets the new message
+        """
+        etag = self.client.get('/health/')['ETag']
+        self.health.message = HealthMessage.SUSTAINED.value
+        self.health.low_altitude = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.health.save()
+
+        response = self.client.get('/health/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content.decode(), HealthMessage.SUSTAINED.value)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_stale_read_not_used(self):
+        """
+        Check that a snapshot read before a write committed is not served after it
+        """
+        cache.clear()
+        # a reader misses the cache and reads the warning, then a write commits before the reader publishes
+        with self.captureOnCommitCallbacks() as callbacks:
+            snapshots.get_health()
+        self.health.message = HealthMessage.SUSTAINED.value
+        with self.captureOnCommitCallbacks(execute=True):
+            self.health.save()
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(self.client.get('/health/').content.decode(), HealthMessage.SUSTAINED.value)
+
+    def test_deleted(self):
+        """
+        Check that /health/ goes back to 204 once the health message is deleted
+        """
+        self.client.get('/health/')
+        with self.captureOnCommitCallbacks(execute=True):
+            HealthModel.objects.all().delete()
+        response = self.client.get('/health/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(response.has_header('ETag'))
+
+
+@patch('apis.clock._clock', FROZEN_CLOCK)
+class StatsSnapshotTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        AltitudeModel.objects.create(altitude=150, date=NewDate(2024, 4, 6, 1, 17, tzinfo=timezone.utc))
+        with self.captureOnCommitCallbacks(execute=True):
+            aggregator.get_aggregator(NewDate.now(timezone.utc))
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_if_none_match(self):
+        """
+        Check that a client with the ETag of the current stats gets a 304 without any database access
+        """
+        response = self.client.get('/stats/')
+        self.assertFalse(response.has_header('Last-Modified'))
+        with self.assertNumQueries(0):
+            response = self.client.get('/stats/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_invalidated_on_insert(self):
+        """
+        Check that a client with the ETag of older stats gets the stats of a newly inserted altitude
+        """
+        etag = self.client.get('/stats/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            AltitudeModel.objects.create(altitude=100, date=NewDate(2024, 4, 6, 1, 18, tzinfo=timezone.utc))
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/stats/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {'minimum': 100, 'maximum': 150, 'average': 125})
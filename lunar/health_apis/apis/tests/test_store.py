@@ -0,0 +1,209 @@
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest.mock import patch
+from ..models import AltitudeModel, HealthMessage, HealthModel, Satellite
+from ..rollups import Summary
+from ..store import ColumnarStore, Segment, get_store
+from ..tasks import check_altitude
+from ..conftest import FROZEN_CLOCK, NewDate
+from .. import ingest
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from pathlib import Path
+
+import json
+import numpy
+import os
+import random
+import sys
+import tempfile
+
+now = datetime(2024, 4, 6, 1, 20, tzinfo=timezone.utc)
+
+
+def brute_force(samples, start):
+    window = [altitude for date, altitude in samples if (date >= start)]
+    if (not window):
+        return Summary()
+    return Summary(len(window), sum(window), min(window), max(window), sum(altitude ** 2 for altitude in window))
+
+
+class DatabaseStoreTestCase(TestCase):
+    def test_window_averages(self):
+        """
+        Check that the window averages of the fleet are one query that seeks the window of every satellite
+        """
+        satellite = Satellite.objects.create(name='lunar-2', url='http://fleet.test/2')
+        Satellite.objects.create(name='lunar-3', url='http://fleet.test/3')
+        AltitudeModel.objects.bulk_insert([(now - timedelta(minutes=5), 100), (now, 150)])
+        AltitudeModel.objects.bulk_insert([(now - timedelta(seconds=30), 170), (now, 180)], satellite.pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            averages = get_store().window_averages(now - timedelta(minutes=1))
+        self.assertEqual(averages, {1: 150, satellite.pk: 175})
+        self.assertEqual(len(queries), 1)
+
+        if (connection.vendor == 'sqlite'):
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {queries[0]["sql"]}')
+                plan = [row[-1] for row in cursor.fetchall()]
+            self.assertFalse([step for step in plan if (step.startswith('SCAN apis_altitudemodel'))], plan)
+
+
+class ColumnarStoreTestCase(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = ColumnarStore({'LOCATION': directory.name})
+
+    def assertStats(self, samples, start):
+        stats = self.store.window_stats(1, start)
+        expected = brute_force(samples, start)
+        self.assertEqual((stats.count, stats.minimum, stats.maximum), (expected.count, expected.minimum, expected.maximum))
+        self.assertAlmostEqual(stats.total, expected.total)
+        self.assertAlmostEqual(stats.squares, expected.squares, places=4)
+
+    def test_windows_across_days(self):
+        """
+        Check that the stats of windows that span a day boundary match the samples they cover
+        """
+        rng = random.Random(0)
+        midnight = datetime(2024, 4, 6, tzinfo=timezone.utc)
+        samples = [(midnight + timedelta(seconds=seconds), rng.uniform(100, 200)) for seconds in range(-600, 600, 10)]
+        for offset in range(0, len(samples), 7):
+            self.store._append(1, samples[offset:offset + 7])
+
+        self.assertEqual(sorted(os.listdir(self.store.location / '1')), [
+            '.lock', '2024-04-05.alt', '2024-04-05.ts', '2024-04-06.alt', '2024-04-06.ts'])
+        for seconds in (-700, -600, -55, 0, 1, 590, 600):
+            self.assertStats(samples, midnight + timedelta(seconds=seconds))
+
+    def test_out_of_order_and_duplicates(self):
+        """
+        Check that late samples are put in order and samples already stored are not counted again
+        """
+        samples = [(now + timedelta(seconds=seconds), float(seconds)) for seconds in range(0, 100, 10)]
+        self.store._append(1, samples[5:])
+        self.store._append(1, samples[:6])
+        self.store._append(1, samples[-2:] + [(samples[-1][0], 500.0)])
+
+        dates, altitudes = self.store._map(Segment(self.store.location / '1', now.date()))
+        self.assertEqual(list(altitudes), [altitude for date, altitude in samples])
+        self.assertTrue((numpy.diff(dates) > 0).all())
+        self.assertStats(samples, now + timedelta(seconds=35))
+
+    def test_remapped_after_append(self):
+        """
+        Check that a read after an append sees the new samples, not the mapping of the old file
+        """
+        self.store._append(1, [(now, 150.0)])
+        self.assertEqual(self.store.window_stats(1, now).count, 1)
+        self.store._append(1, [(now + timedelta(seconds=10), 170.0)])
+        self.assertEqual(self.store.window_stats(1, now).as_stats(), {'minimum': 150, 'maximum': 170, 'average': 160})
+
+    def test_partial_write(self):
+        """
+        Check that the part of a sample an interrupted write left behind is never read and is dropped by the next append
+        """
+        self.store._append(1, [(now, 150.0)])
+        segment = Segment(self.store.location / '1', now.date())
+        # the altitude of the next sample was written, and half of its date
+        with open(segment.alt_path, 'ab') as alt_file, open(segment.ts_path, 'ab') as ts_file:
+            alt_file.write(numpy.float64(999).tobytes())
+            ts_file.write(b'\0' * 4)
+        self.assertEqual(self.store.window_stats(1, now).as_stats(), {'minimum': 150, 'maximum': 150, 'average': 150})
+
+        self.store._append(1, [(now + timedelta(seconds=10), 170.0)])
+        self.assertEqual(segment.ts_path.stat().st_size, segment.alt_path.stat().st_size)
+        self.assertEqual(self.store.window_stats(1, now).as_stats(), {'minimum': 150, 'maximum': 170, 'average': 160})
+
+    def test_delete_before(self):
+        """
+        Check that only the days of the satellite before the day of the cutoff are deleted
+        """
+        self.store._append(1, [(now - timedelta(days=2), 100.0), (now - timedelta(days=1), 150.0), (now, 170.0)])
+        self.store._append(2, [(now - timedelta(days=2), 100.0)])
+        self.store.delete_before(now - timedelta(days=1))
+
+        self.assertEqual(self.store.window_stats(1, now - timedelta(days=3)).count, 2)
+        self.assertEqual(self.store.window_averages(now - timedelta(days=3)), {1: 160, 2: 100})
+        self.store.delete_before(now - timedelta(days=1), 2)
+        self.assertEqual(self.store.window_stats(2, now - timedelta(days=3)).count, 0)
+
+
+class ColumnarStoreIntegrationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = Path(directory.name)
+        settings = override_settings(ALTITUDE_STORE={'BACKEND': 'apis.store.ColumnarStore', 'LOCATION': self.location})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.satellite = Satellite.objects.create(name='columnar', url='http://fleet.test/0')
+
+    def tearDown(self):
+        cache.clear()
+
+    def store(self, seconds, altitude):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                return ingest.store_sample(now + timedelta(seconds=seconds), altitude, self.satellite.pk)
+
+    def test_requires_numpy(self):
+        """
+        Check that the store is refused when numpy is missing, instead of failing at its first read
+        """
+        with patch.dict(sys.modules, {'numpy': None}), self.assertRaises(ImproperlyConfigured):
+            get_store()
+
+    def test_stored_samples(self):
+        """
+        Check that committed samples are read by /stats/<id>/ and check_altitude from the store
+        """
+        self.store(-20, 150)
+        self.store(-10, 154)
+        # a rolled back sample is never copied
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                ingest.store_sample(now, 100, self.satellite.pk)
+                transaction.set_rollback(True)
+
+        # the store is read, not the database
+        AltitudeModel.objects.filter(satellite=self.satellite).delete()
+        with patch('apis.clock._clock', FROZEN_CLOCK):
+            response = self.client.get(f'/stats/{self.satellite.pk}/')
+        self.assertEqual(json.loads(response.content), {'minimum': 150, 'maximum': 154, 'average': 152})
+
+        with patch('apis.clock._clock', FROZEN_CLOCK):
+            check_altitude()
+        self.assertEqual(HealthModel.objects.get(satellite=self.satellite).message, HealthMessage.WARNING.value)
+
+    def test_updated_and_deleted(self):
+        """
+        Check that an updated altitude is copied again and a deleted satellite is removed from the store
+        """
+        self.store(-10, 150)
+        with self.captureOnCommitCallbacks(execute=True):
+            altitude = AltitudeModel.objects.get(satellite=self.satellite)
+            altitude.altitude = 170
+            altitude.save()
+        self.assertEqual(get_store().window_stats(self.satellite.pk, now - timedelta(minutes=1)).maximum, 170)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.satellite.delete()
+        self.assertFalse((self.location / str(self.satellite.pk)).exists())
+
+    def test_backfill(self):
+        """
+        Check that backfill_store copies the altitudes that were stored before the store was enabled
+        """
+        AltitudeModel.objects.bulk_insert([(now - timedelta(days=1), 150), (now, 170)], self.satellite.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('backfill_store', satellite=[self.satellite.pk], stdout=StringIO())
+        stats = get_store().window_stats(self.satellite.pk, now - timedelta(days=2))
+        self.assertEqual(stats.as_stats(), {'minimum': 150, 'maximum': 170, 'average': 160})
@@ -0,0 +1,122 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from ..models import HealthMessage, HealthModel
+from .. import pubsub
+
+import asyncio
+import json
+
+
+def _parse(chunk):
+    """Returns the fields of a server-sent event as a dict."""
+    fields = dict(line.split(': ', 1) for line in chunk.decode().strip().split('\n'))
+    if ('data' in fields):
+        fields['data'] = json.loads(fields['data'])
+    return fields
+
+
+class MemoryPubSubTestCase(TestCase):
+    async def test_publish(self):
+        """
+        Check that every subscriber of a channel gets the published messages, and only while subscribed
+        """
+        broker = pubsub.MemoryPubSub({})
+        async with broker.subscribe('health') as first, broker.subscribe('health') as second:
+            broker.publish('health', {'message': 'a'})
+            broker.publish('other', {'message': 'b'})
+            self.assertEqual(await asyncio.wait_for(first.get(), 1), {'message': 'a'})
+            self.assertEqual(await asyncio.wait_for(second.get(), 1), {'message': 'a'})
+            self.assertTrue(first.empty())
+        self.assertEqual(broker._subscribers, {})
+        self.assertEqual(broker._listeners, {})
+
+
+@override_settings(ROOT_URLCONF='health_apis.asgi_urls', HEALTH_STREAM_HEARTBEAT=0.05, HEALTH_POLL_TIMEOUT=0.2)
+class HealthStreamTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.health = HealthModel.objects.create(low_altitude=True, message=HealthMessage.WARNING.value)
+
+    def tearDown(self):
+        cache.clear()
+
+    def _save(self, message, low_altitude):
+        self.health.message = message
+        self.health.low_altitude = low_altitude
+        with self.captureOnCommitCallbacks(execute=True):
+            self.health.save()
+
+    async def _subscribed(self, request):
+        while (not pubsub.get_pubsub()._subscribers and not request.done()):
+            await asyncio.sleep(0.01)
+
+    async def test_stream(self):
+        """
+        Check that the stream sends the current message and then one event per changed message
+        """
+        response = await self.async_client.get('/health/stream/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+
+        first = _parse(await anext(events))
+        self.assertEqual(first['event'], 'health')
+        self.assertEqual(first['data']['message'], HealthMessage.WARNING.value)
+
+        # saving the same message is not a change, only heartbeats are sent
+        await sync_to_async(self._save)(HealthMessage.WARNING.value, True)
+        self.assertEqual(await anext(events), b': keep-alive\n\n')
+
+        await sync_to_async(self._save)(HealthMessage.SUSTAINED.value, False)
+        event = await anext(events)
+        while (event.startswith(b':')):
+            event = await anext(events)
+        second = _parse(event)
+        self.assertEqual(second['data']['message'], HealthMessage.SUSTAINED.value)
+        self.assertNotEqual(second['id'], first['id'])
+        await events.aclose()
+
+    async def test_last_event_id(self):
+        """
+        Check that a reconnecting client that has the current message is not sent it again
+        """
+        response = await self.async_client.get('/health/stream/')
+        events = aiter(response.streaming_content)
+        event_id = _parse(await anext(events))['id']
+        await events.aclose()
+
+        response = await self.async_client.get('/health/stream/', headers={'Last-Event-ID': event_id})
+        events = aiter(response.streaming_content)
+        self.assertEqual(await anext(events), b': keep-alive\n\n')
+        await events.aclose()
+
+    async def test_poll_outdated(self):
+        """
+        Check that a long-poll without the current message is answered right away
+        """
+        response = await self.async_client.get('/health/poll/', headers={'If-None-Match': '"outdated"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.decode(), HealthMessage.WARNING.value)
+
+    async def test_poll_change(self):
+        """
+        Check that a long-poll with the current message is held until the message changes
+        """
+        etag = (await self.async_client.get('/health/'))['ETag']
+        request = asyncio.ensure_future(self.async_client.get('/health/poll/', headers={'If-None-Match': etag}))
+        await self._subscribed(request)
+        self.assertFalse(request.done())
+
+        await sync_to_async(self._save)(HealthMessage.SUSTAINED.value, False)
+        response = await request
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.decode(), HealthMessage.SUSTAINED.value)
+
+    async def test_poll_timeout(self):
+        """
+        Check that a long-poll is answered with a 304 when the message does not change in time
+        """
+        etag = (await self.async_client.get('/health/'))['ETag']
+        response = await self.async_client.get('/health/poll/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
@@ -0,0 +1,78 @@
+from django.test import SimpleTestCase
+from ..client import SatelliteClient
+from ..management.commands.loadtest import _drive
+from ..stub import DATA_PATH, DROP_PATH, OrbitProfile, StubServer
+
+import requests
+
+
+class OrbitProfileTestCase(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.profile = OrbitProfile(interval=10, altitude=175, decay=36, amplitude=0, clock=lambda: self.now)
+
+    def test_updates(self):
+        """
+        Check that the altitude only changes every interval and decays by the hour
+        """
+        first = self.profile.current()
+        self.now += 9
+        self.assertEqual(self.profile.current(), first)
+        self.assertEqual(first['altitude'], 175)
+
+        self.now += 1
+        update = self.profile.current()
+        self.assertEqual(update['last_updated'], '1970-01-01T00:16:50+00:00')
+        self.assertAlmostEqual(update['altitude'], 174.9)
+
+    def test_drop(self):
+        """
+        Check that a low altitude event starts with the next update
+        """
+        self.now += 4
+        published_at = self.profile.drop(140)
+        self.assertEqual(published_at, 1010)
+        self.assertEqual(self.profile.current()['altitude'], 175)
+        self.now = published_at
+        self.assertEqual(self.profile.current()['altitude'], 140)
+
+
+class StubServerTestCase(SimpleTestCase):
+    def setUp(self):
+        self.profile = OrbitProfile(interval=60)
+        self.server = StubServer(self.profile).start()
+        self.base = self.server.url[:-len(DATA_PATH)]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_satellite_client(self):
+        """
+        Check that the satellite client reads the stub like the api, with a 304 while the altitude is unchanged
+        """
+        client = SatelliteClient(self.server.url, 1, 1, 0, 0, 0, 5, 60)
+        self.assertEqual(client.fetch(), self.profile.current())
+        self.assertIsNone(client.fetch())
+        self.assertEqual(client.breaker.failures, 0)
+
+    def test_drop_endpoint(self):
+        """
+        Check that a POST starts a low altitude event and unknown paths are not found
+        """
+        response = requests.post(self.base + DROP_PATH + '?altitude=120', timeout=5)
+        self.assertEqual(response.json()['altitude'], 120)
+        self.assertEqual(self.profile.event[1], 120)
+        self.assertEqual(requests.post(self.base + DROP_PATH + '?altitude=low', timeout=5).status_code, 400)
+        self.assertEqual(requests.get(self.base + '/stats/', timeout=5).status_code, 404)
+
+    def test_load_driver(self):
+        """
+        Check that the load test driver reports the latencies and errors of every path
+        """
+        results = _drive(self.base, [DATA_PATH, '/missing'], 2, 0.2)
+        self.assertEqual(set(results), {DATA_PATH, '/missing'})
+        self.assertEqual(results[DATA_PATH]['errors'], 0)
+        for result in results.values():
+            self.assertGreater(result['operations'], 0)
+            self.assertLessEqual(result['p50'], result['p99'])
@@ -1,15 +1,20 @@
 from unittest.mock import patch, Mock
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from ..tasks import get_altitude, check_altitude
+from .. import client
 from ..models import AltitudeModel, HealthMessage, HealthModel
-from datetime import datetime, timezone
-from ..conftest import NewDate
+from datetime import datetime, timedelta, timezone
+from ..conftest import FROZEN_CLOCK, NewDate
 
 import pytest
 
 class MockResponseClass:
     def __init__(self, ok):
         self.ok = ok
+        self.status_code = 200 if ok else 404
+        self.headers = {}
         
 not_okay_response = MockResponseClass(False)
 not_okay_response.json = Mock(return_value=None)
@@ -24,7 +29,11 @@ standard_response.json = Mock(return_value={ 'altitude': 165, 'last_updated': da
 
 @pytest.mark.celery(result_backend='redis://')
 class test_get_altitude(TestCase): 
-    @patch('requests.get', Mock(return_value=not_okay_response))  
+    def setUp(self):
+        # every test starts with a new client, without the validators of an earlier response
+        client.reset_client()
+
+    @patch('requests.Session.get', Mock(return_value=not_okay_response))  
     def test_response_not_ok(self):
         """
         Check that an object is not created when there is a non okay response
@@ -34,7 +43,7 @@ class test_get_altitude(TestCase):
         not_okay_response.json.assert_not_called()
         self.assertEqual(AltitudeModel.objects.all().count(), 0)
 
-    @patch('requests.get', Mock(return_value=empty_json_response))  
+    @patch('requests.Session.get', Mock(return_value=empty_json_response))  
     def test_empty_json_response(self):
         """
         Check that an object is not created when json is empty
@@ -44,7 +53,7 @@ class test_get_altitude(TestCase):
         empty_json_response.json.assert_called()
         self.assertEqual(AltitudeModel.objects.all().count(), 0)
 
-    @patch('requests.get', Mock(return_value=standard_response))  
+    @patch('requests.Session.get', Mock(return_value=standard_response))  
     def test_creating_altitude_object(self):
         """
         Check that an object is created 
@@ -57,7 +66,7 @@ class test_get_altitude(TestCase):
         self.assertEqual(altitudeObj.altitude, 165)
         self.assertEqual(altitudeObj.date, date)
 
-    @patch('requests.get', Mock(return_value=standard_response))  
+    @patch('requests.Session.get', Mock(return_value=standard_response))  
     def test_shared_date(self):
         """
         Check that an object is not created when there is an object that has the same date
@@ -67,20 +76,36 @@ class test_get_altitude(TestCase):
         self.assertEqual(created, False)
         standard_response.json.assert_called()
         self.assertEqual(AltitudeModel.objects.all().count(), 1)
+
+    @patch('requests.Session.get', Mock(return_value=standard_response))
+    def test_shared_date_single_query(self):
+        """
+        Check that a date we already stored is skipped by the insert alone, without counting or reading altitudes
+        """
+        AltitudeModel.objects.create(altitude=125, date=date)
+        with CaptureQueriesContext(connection) as queries:
+            created = get_altitude()
+        self.assertEqual(created, False)
+        # the savepoint statements only come from the transaction of the test case
+        statements = [query['sql'] for query in queries if ('SAVEPOINT' not in query['sql'])]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('INSERT'))
+        self.assertEqual(AltitudeModel.objects.get().altitude, 125)
     
-@patch('apis.tasks.datetime', NewDate)
+@patch('apis.clock._clock', FROZEN_CLOCK)
 @pytest.mark.celery(result_backend='redis://')
 class test_check_low_altitude(TestCase): 
     def setUp(self):
         # average over past minute should be 143.75 -- low altitude
+        # dates are unique, so repeated minutes are 30 seconds apart
         AltitudeModel.objects.create(altitude=150, date=NewDate(
             2024, 4, 6, 1, 19, tzinfo=timezone.utc))
         AltitudeModel.objects.create(altitude=200, date=NewDate(
             2024, 4, 6, 1, 20, tzinfo=timezone.utc))
         AltitudeModel.objects.create(altitude=100, date=NewDate(
-            2024, 4, 6, 1, 19, tzinfo=timezone.utc))
+            2024, 4, 6, 1, 19, 30, tzinfo=timezone.utc))
         AltitudeModel.objects.create(altitude=125, date=NewDate(
-            2024, 4, 6, 1, 20, tzinfo=timezone.utc))
+            2024, 4, 6, 1, 20, 30, tzinfo=timezone.utc))
         AltitudeModel.objects.create(altitude=90, date=NewDate(
             2024, 4, 6, 0, 34, tzinfo=timezone.utc))
         AltitudeModel.objects.create(altitude=260, date=NewDate(
@@ -108,19 +133,20 @@ class test_check_low_altitude(TestCase):
         self.assertEqual(healthObj.low_altitude, True)
         self.assertEqual(healthObj.message, HealthMessage.WARNING.value)
 
-@patch('apis.tasks.datetime', NewDate)
+@patch('apis.clock._clock', FROZEN_CLOCK)
 @pytest.mark.celery(result_backend='redis://')
 class test_check_high_altitude(TestCase): 
     def setUp(self):
         # average over past minute should be 182.5 -- high altitude
+        # dates are unique, so repeated minutes are 30 seconds apart
         AltitudeModel.objects.create(altitude=170, date=NewDate(
             2024, 4, 6, 1, 19, tzinfo=timezone.utc))
         AltitudeModel.objects.create(altitude=200, date=NewDate(
             2024, 4, 6, 1, 20, tzinfo=timezone.utc))
         AltitudeModel.objects.create(altitude=210, date=NewDate(
-            2024, 4, 6, 1, 19, tzinfo=timezone.utc))
+            2024, 4, 6, 1, 19, 30, tzinfo=timezone.utc))
         AltitudeModel.objects.create(altitude=150, date=NewDate(
-            2024, 4, 6, 1, 20, tzinfo=timezone.utc))
+            2024, 4, 6, 1, 20, 30, tzinfo=timezone.utc))
         # these two objects are out of range
         AltitudeModel.objects.create(altitude=90, date=NewDate(
             2024, 4, 6, 0, 34, tzinfo=timezone.utc))
@@ -149,7 +175,7 @@ class test_check_high_altitude(TestCase):
         self.assertEqual(healthObj.low_altitude, False)
         self.assertEqual(healthObj.message, HealthMessage.SUSTAINED.value)
 
-    def test_updates_health_model(self):
+    def test_sustained_for_a_window(self):
         """
         Check that HealthModel is updated when previous minute had the sustained message
         """
@@ -159,3 +185,16 @@ class test_check_high_altitude(TestCase):
         healthObj = HealthModel.objects.get()
         self.assertEqual(healthObj.low_altitude, False)
         self.assertEqual(healthObj.message, HealthMessage.OKAY.value)
+
+    def test_sustained_just_set(self):
+        """
+        Check that the sustained message set by a sample seconds before the check is kept for a whole window
+        """
+        HealthModel.objects.create(low_altitude=False, message=HealthMessage.SUSTAINED.value,
+                                   since=FROZEN_CLOCK.now() - timedelta(seconds=2))
+        check_altitude()
+        self.assertEqual(HealthModel.objects.get().message, HealthMessage.SUSTAINED.value)
+
+        HealthModel.objects.update(since=FROZEN_CLOCK.now() - timedelta(minutes=1))
+        check_altitude()
+        self.assertEqual(HealthModel.objects.get().message, HealthMessage.OKAY.value)
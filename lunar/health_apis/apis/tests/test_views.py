@@ -1,11 +1,13 @@
+from django.conf import settings
 from rest_framework import status
 from rest_framework.test import APITestCase
 from ..models import AltitudeModel, HealthMessage, HealthModel
-from ..conftest import NewDate
+from ..conftest import FROZEN_CLOCK, NewDate
+from unittest.mock import patch
 
 import json
-import apis.views
 import datetime
+import statistics
 
 class EmptyStatsTestCase(APITestCase):
     def test_empty_stats(self):
@@ -17,8 +19,7 @@ class EmptyStatsTestCase(APITestCase):
         self.assertDictEqual(json.loads(response.content), {
                              "minimum": None, "maximum": None, "average": None})
 
-apis.views.datetime = NewDate
-
+@patch('apis.clock._clock', FROZEN_CLOCK)
 class SingleStatsTestCase(APITestCase):
     def setUp(self):
         AltitudeModel.objects.create(altitude=150, date=NewDate(
@@ -34,6 +35,7 @@ class SingleStatsTestCase(APITestCase):
                              "minimum": 150, "maximum": 150, "average": 150})
 
 
+@patch('apis.clock._clock', FROZEN_CLOCK)
 class MixedStatsTestCase(APITestCase):
     def setUp(self):
         AltitudeModel.objects.create(altitude=150, date=NewDate(
@@ -43,7 +45,7 @@ class MixedStatsTestCase(APITestCase):
         AltitudeModel.objects.create(altitude=100, date=NewDate(
             2024, 4, 6, 1, 21, tzinfo=datetime.timezone.utc))
         AltitudeModel.objects.create(altitude=125, date=NewDate(
-            2024, 4, 6, 1, 22, tzinfo=datetime.timezone.utc))
+            2024, 4, 6, 1, 22, 30, tzinfo=datetime.timezone.utc))
         AltitudeModel.objects.create(altitude=90, date=NewDate(
             2024, 4, 6, 0, 34, tzinfo=datetime.timezone.utc))
         AltitudeModel.objects.create(altitude=260, date=NewDate(
@@ -59,6 +61,37 @@ class MixedStatsTestCase(APITestCase):
                              "minimum": 100, "maximum": 200, "average": 143.75})
 
 
+@patch('apis.clock._clock', FROZEN_CLOCK)
+class MultiWindowStatsTestCase(MixedStatsTestCase):
+    def test_windows(self):
+        """
+        Check that every requested window is returned with its count and standard deviation, from one query
+        """
+        with self.assertNumQueries(1):
+            response = self.client.get('/stats/?windows=1m,5m,1h')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stats = json.loads(response.content)
+        self.assertEqual(list(stats), ['1m', '5m', '1h'])
+        self.assertEqual(stats['5m'], stats['1m'])
+        self.assertEqual({key: stats['1h'][key] for key in ('minimum', 'maximum', 'count')},
+                         {'minimum': 90, 'maximum': 260, 'count': 6})
+        self.assertAlmostEqual(stats['1h']['average'], 925 / 6)
+        self.assertAlmostEqual(stats['5m']['stddev'], statistics.pstdev([100, 125, 150, 200]))
+
+    def test_invalid_windows(self):
+        """
+        Check that malformed, empty and too long windows are rejected with a 400
+        """
+        for windows in ['5', '1w', '0m', '1m,,5m', '365d', '99999999999d', ','.join(['1m'] * 11)]:
+            response = self.client.get(f'/stats/?windows={windows}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, windows)
+
+        # the rollups kept forever, a window still has to start at a date
+        with self.settings(ALTITUDE_RETENTION=dict(settings.ALTITUDE_RETENTION, minute=None)):
+            response = self.client.get('/stats/?windows=999999999d')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 class EmptyHealthTestCase(APITestCase):
     def test_empty_health(self):
         """
@@ -14,4 +14,18 @@ urlpatterns = [
     path('', include(router.urls)),
     path('stats/', get_stats),
     path('health/', get_health),
+    path('stats/<int:satellite_id>/', get_satellite_stats),
+    path('health/forecast/', get_forecast),
+    path('health/history/', get_health_history),
+    path('health/history/summary/', get_health_summary),
+    path('health/<int:satellite_id>/', get_satellite_health),
+    path('health/<int:satellite_id>/forecast/', get_satellite_forecast),
+    path('health/<int:satellite_id>/history/', get_satellite_health_history),
+    path('health/<int:satellite_id>/history/summary/', get_satellite_health_summary),
+    path('altitudes/', post_altitudes),
+    path('altitudes/<int:satellite_id>/', post_satellite_altitudes),
+    path('altitudes/buffer/', get_ingest_buffer),
+    path('altitudes/history/', get_history),
+    path('metrics', get_metrics),
+    path('altitudes/export/', get_export),
 ]
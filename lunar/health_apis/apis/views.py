@@ -1,48 +1,526 @@
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, parser_classes, renderer_classes
 from rest_framework import status
 from rest_framework.response import Response
-from django.http import HttpResponse, JsonResponse
-from .models import AltitudeModel, HealthModel
-from django.db.models import Avg, Max, Min
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from .models import PRIMARY_SATELLITE, AltitudeModel, HealthTransitionModel, Satellite
+from .serializers import AltitudeSampleSerializer
+from .store import get_store
 from datetime import datetime, timedelta, timezone
 from django.db import transaction
+from django.conf import settings
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from . import aggregator, buffer, clock, health, ingest, metrics, rollups, snapshots
+from .downsample import lttb
+from .parsers import INGEST_PARSERS
+from . import export
+
+import base64
+import re
+
+STATS_WINDOW = timedelta(hours=0, minutes=5)
+# units of the ?windows= parameter of /stats/
+WINDOW_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days'}
 
 
 def _get_stats():
     """Helper function to get the average, max and min altitudes over the past five minutes.
 
+    The stats are read from the shared rolling aggregator, or from settings.ALTITUDE_STORE
+    when the window is not one of settings.ROLLING_WINDOWS.
+
     Returns:
         stats: A dict containing minimum, maximum, and average altitudes over past 5 minutes as floats. Values will be None if no data exists.
     """
-    d = datetime.now(timezone.utc) - timedelta(hours=0, minutes=5)
+    now = clock.now()
+    if (STATS_WINDOW not in settings.ROLLING_WINDOWS):
+        with transaction.atomic():
+            return get_store().window_stats(PRIMARY_SATELLITE, now - STATS_WINDOW).as_stats()
+
+    return aggregator.get_aggregator(now).stats(STATS_WINDOW, now)
+
+
+def _stats_response(request, stats):
+    """Helper function that returns the stats as a JsonResponse, or a 304 if the client has the same stats.
+
+    The stats change when samples leave the window as well as when they arrive,
+    so only the ETag of their content is sent and no Last-Modified.
+    """
+    response = JsonResponse(stats)
+    response['ETag'] = snapshots.etag(response.content)
+    return get_conditional_response(request, etag=response['ETag'], response=response)
+
+
+def _parse_windows(value):
+    """Helper function that parses a comma separated list of windows like 1m,5m,1h,24h.
+
+    Returns:
+        windows: list of (label, timedelta) tuples in the order they were given
+    """
+    windows = []
+    for label in value.split(','):
+        match = re.fullmatch(r'(\d+)([smhd])', label.strip())
+        if (match is None):
+            raise ValueError(f'{label!r} is not a window, use a number followed by one of {", ".join(WINDOW_UNITS)}')
+        try:
+            window = timedelta(**{WINDOW_UNITS[match[2]]: int(match[1])})
+            # without a retention limit the start of the window still has to be a date
+            clock.now() - window
+        except OverflowError:
+            raise ValueError(f'{label!r} is too long') from None
+        if (not window):
+            raise ValueError(f'{label!r} is empty')
+        limit = settings.ALTITUDE_RETENTION['minute']
+        if (limit is not None and window > limit):
+            raise ValueError(f'{label!r} is longer than the {limit.days} days the per minute rollups are kept')
+        windows.append((label.strip(), window))
+    if (len(windows) > settings.STATS_MAX_WINDOWS):
+        raise ValueError(f'at most {settings.STATS_MAX_WINDOWS} windows can be requested')
+    return windows
+
+
+def _parse_percentiles(value):
+    """Helper function that parses a comma separated list of percentiles like 50,95,99.9.
+
+    Returns:
+        percentiles: list of (label, quantile) tuples, the quantile between 0 and 1
+    """
+    percentiles = []
+    for label in value.split(','):
+        try:
+            percentile = float(label)
+        except ValueError:
+            raise ValueError(f'{label!r} is not a percentile') from None
+        if (not 0 <= percentile <= 100):
+            raise ValueError(f'{label!r} is not between 0 and 100')
+        percentiles.append((label.strip(), percentile / 100))
+    return percentiles
 
-    stats_aggregate = AltitudeModel.objects.filter(date__gte=d).aggregate(
-        Avg('altitude'), Max('altitude'), Min('altitude'))
 
-    stats = {
-        'minimum': stats_aggregate['altitude__min'],
-        'maximum': stats_aggregate['altitude__max'],
-        'average': stats_aggregate['altitude__avg']
-    }
+def _parse_stats_query(request):
+    """Helper function that parses the optional windows and percentiles parameters of the stats endpoints, None when not given."""
+    windows = _parse_windows(request.GET['windows']) if ('windows' in request.GET) else None
+    percentiles = _parse_percentiles(request.GET['percentiles']) if ('percentiles' in request.GET) else None
+    return windows, percentiles
+
+
+def _percentiles(sketch, percentiles):
+    return {label: sketch.quantile(quantile) for label, quantile in percentiles}
+
+
+def _windows_stats(satellite_id, windows, percentiles=None):
+    """Helper function that returns the stats of every window of the ?windows= parameter for a satellite.
+
+    Every window also has the count and the standard deviation of its altitudes,
+    and the requested percentiles when there are any.
+
+    Returns:
+        stats: dict of the stats keyed by window
+    """
+    now = clock.now()
+    starts = [now - window for label, window in windows]
+    summaries = get_store().windows_stats(satellite_id, starts)
+    stats = {label: dict(summary.as_stats(), count=summary.count, stddev=summary.stddev)
+             for (label, window), summary in zip(windows, summaries)}
+    if (percentiles):
+        for (label, window), sketch in zip(windows, rollups.windows_sketches(starts)):
+            stats[label]['percentiles'] = _percentiles(sketch, percentiles)
     return stats
 
 
-@transaction.atomic
+def _bad_request(error):
+    return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _health_response(request, snapshot):
+    """Helper function that returns the health message of a snapshot, or a 304 if the client has the same message."""
+    response = HttpResponse(snapshot.message)
+    response['ETag'] = snapshot.etag
+    last_modified = int(snapshot.updated.timestamp())
+    response['Last-Modified'] = http_date(last_modified)
+    return get_conditional_response(request, etag=snapshot.etag, last_modified=last_modified, response=response)
+
+
+# /stats/ and /health/ are not wrapped in a transaction, a current snapshot
+# is answered from the cache without touching the database
+
 @api_view(['GET'])
 def get_stats(request):
     """GET endpoint for /stats/ that returns statistics about recent altitude information as a JsonResponse
+
+    Query parameters:
+        windows: optional comma separated windows like 1m,5m,1h,24h, the stats of each are returned keyed by window
+        percentiles: optional comma separated percentiles like 50,95,99, estimated within
+            settings.ALTITUDE_SKETCH_ACCURACY of the altitude of that rank
     """
+    try:
+        windows, percentiles = _parse_stats_query(request)
+    except ValueError as error:
+        return _bad_request(error)
+
+    if (windows is not None):
+        return _stats_response(request, _windows_stats(PRIMARY_SATELLITE, windows, percentiles))
     stats = _get_stats()
-    return JsonResponse(stats)
+    if (percentiles):
+        sketch = rollups.windows_sketches([clock.now() - STATS_WINDOW])[0]
+        stats = dict(stats, percentiles=_percentiles(sketch, percentiles))
+    return _stats_response(request, stats)
 
 
-@transaction.atomic
 @api_view(['GET'])
 def get_health(request):
     """GET endpoint for /health/ that returns a message regarding recent altitude levels.
     """
+    snapshot = snapshots.get_health()
+    if (snapshot.message is None):
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return _health_response(request, snapshot)
+
+
+def _satellite_not_found():
+    return Response({'detail': 'Satellite not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+
+@api_view(['GET'])
+def get_satellite_stats(request, satellite_id):
+    """GET endpoint for /stats/<id>/ that returns the statistics of one satellite like /stats/ as a JsonResponse
+
+    Percentiles are only sketched for the primary satellite.
+    """
     try:
-        health = HealthModel.objects.get()
-        return HttpResponse(health.message)
-    except HealthModel.DoesNotExist:
+        windows, percentiles = _parse_stats_query(request)
+    except ValueError as error:
+        return _bad_request(error)
+    if (percentiles and satellite_id != PRIMARY_SATELLITE):
+        return _bad_request('percentiles are only kept for the primary satellite')
+
+    if (windows is not None):
+        stats = _windows_stats(satellite_id, windows, percentiles)
+        count = sum(window['count'] for window in stats.values())
+    else:
+        start = clock.now() - STATS_WINDOW
+        summary = get_store().window_stats(satellite_id, start)
+        stats, count = summary.as_stats(), summary.count
+        if (percentiles):
+            stats['percentiles'] = _percentiles(rollups.windows_sketches([start])[0], percentiles)
+    # an empty window is the common case only for satellites that do not exist
+    if (count == 0 and not Satellite.objects.filter(pk=satellite_id).exists()):
+        return _satellite_not_found()
+    return _stats_response(request, stats)
+
+
+@api_view(['GET'])
+def get_satellite_health(request, satellite_id):
+    """GET endpoint for /health/<id>/ that returns the health message of one satellite like /health/.
+    """
+    snapshot = snapshots.get_health(satellite_id)
+    if (snapshot.message is None):
+        if (not Satellite.objects.filter(pk=satellite_id).exists()):
+            return _satellite_not_found()
         return Response(status=status.HTTP_204_NO_CONTENT)
+    return _health_response(request, snapshot)
+
+
+@api_view(['GET'])
+def get_forecast(request):
+    """GET endpoint for /health/forecast/ that returns the altitude trend and when it is predicted to get low as a JsonResponse.
+    """
+    return JsonResponse(health.forecast(clock.now()))
+
+
+@api_view(['GET'])
+def get_satellite_forecast(request, satellite_id):
+    """GET endpoint for /health/<id>/forecast/ that returns the forecast of one satellite like /health/forecast/.
+    """
+    forecast = health.forecast(clock.now(), satellite_id)
+    if (forecast['samples'] == 0 and not Satellite.objects.filter(pk=satellite_id).exists()):
+        return _satellite_not_found()
+    return JsonResponse(forecast)
+
+
+def _encode_cursor(transition):
+    return base64.urlsafe_b64encode(f'{transition["date"].isoformat()}|{transition["id"]}'.encode()).decode()
+
+
+def _decode_cursor(value):
+    """Helper function that parses the cursor of a /health/history/ page into the (date, id) of its last transition."""
+    try:
+        date, pk = base64.urlsafe_b64decode(value.encode()).decode().split('|')
+        return datetime.fromisoformat(date), int(pk)
+    except (ValueError, UnicodeError):
+        raise ValueError('invalid cursor')
+
+
+def _health_history(request, satellite_id):
+    """Helper function that returns a page of the health transitions of a satellite as a JsonResponse, oldest first.
+
+    Pages are read after the (date, id) of the last transition of the previous page, not with an offset,
+    so deep pages are as cheap as the first. next is the url of the next page, None on the last one.
+
+    Query parameters:
+        from, to: optional ISO 8601 dates of the transitions to return, from inclusive and to exclusive
+        limit: transitions per page, settings.HEALTH_HISTORY_PAGE_SIZE by default
+        cursor: the cursor in the next url of the previous page
+    """
+    try:
+        limit = int(request.GET.get('limit', settings.HEALTH_HISTORY_PAGE_SIZE))
+        cursor = _decode_cursor(request.GET['cursor']) if 'cursor' in request.GET else None
+        transitions = HealthTransitionModel.objects.after(satellite_id, cursor)
+        if ('from' in request.GET):
+            transitions = transitions.filter(date__gte=_parse_date(request.GET['from']))
+        if ('to' in request.GET):
+            transitions = transitions.filter(date__lt=_parse_date(request.GET['to']))
+    except ValueError as error:
+        return _bad_request(error)
+    max_limit = settings.HEALTH_HISTORY_MAX_PAGE_SIZE
+    if (limit < 1 or limit > max_limit):
+        return _bad_request(f'limit must be between 1 and {max_limit}')
+
+    # one more than the page tells whether there is a next page
+    page = list(transitions.values('id', 'date', 'low_altitude', 'message')[:limit + 1])
+    if (not page and cursor is None and not Satellite.objects.filter(pk=satellite_id).exists()):
+        return _satellite_not_found()
+    next_url = None
+    if (len(page) > limit):
+        page = page[:limit]
+        query = request.GET.copy()
+        query['cursor'] = _encode_cursor(page[-1])
+        next_url = request.build_absolute_uri(f'?{query.urlencode()}')
+    return JsonResponse({
+        'transitions': [{'date': transition['date'].isoformat(), 'low_altitude': transition['low_altitude'],
+                         'message': transition['message']} for transition in page],
+        'next': next_url,
+    })
+
+
+def _health_summary(request, satellite_id):
+    """Helper function that returns the seconds a satellite spent in each health message over a range as a JsonResponse.
+
+    Query parameters:
+        from, to: ISO 8601 dates, to defaults to now and from to one day before to
+    """
+    try:
+        end = _parse_date(request.GET['to']) if 'to' in request.GET else clock.now()
+        start = _parse_date(request.GET['from']) if 'from' in request.GET else end - timedelta(days=1)
+    except ValueError as error:
+        return _bad_request(error)
+    if (start >= end):
+        return _bad_request('from must be before to')
+    if (not Satellite.objects.filter(pk=satellite_id).exists()):
+        return _satellite_not_found()
+
+    return JsonResponse({
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'seconds': HealthTransitionModel.objects.durations(satellite_id, start, end),
+    })
+
+
+@api_view(['GET'])
+def get_health_history(request):
+    """GET endpoint for /health/history/ that returns the changes of the health message, a page at a time.
+    """
+    return _health_history(request, PRIMARY_SATELLITE)
+
+
+@api_view(['GET'])
+def get_satellite_health_history(request, satellite_id):
+    """GET endpoint for /health/<id>/history/ that returns the health changes of one satellite like /health/history/.
+    """
+    return _health_history(request, satellite_id)
+
+
+@api_view(['GET'])
+def get_health_summary(request):
+    """GET endpoint for /health/history/summary/ that returns how long the health had each message over a range.
+    """
+    return _health_summary(request, PRIMARY_SATELLITE)
+
+
+@api_view(['GET'])
+def get_satellite_health_summary(request, satellite_id):
+    """GET endpoint for /health/<id>/history/summary/ that returns the summary of one satellite like /health/history/summary/.
+    """
+    return _health_summary(request, satellite_id)
+
+
+def _ingest(request, satellite_id):
+    """Helper function that validates a batch of pushed samples and stores them in one transaction.
+
+    Returns:
+        response: Response with the number of received, created and duplicate samples,
+            201 when any sample was created, or 400 with the errors of every invalid sample
+    """
+    serializer = AltitudeSampleSerializer(data=request.data, many=True)
+    serializer.is_valid(raise_exception=True)
+    samples = serializer.validated_data
+    with transaction.atomic():
+        created = ingest.store_samples(samples, satellite_id)
+    return Response({'received': len(samples), 'created': len(created), 'duplicates': len(samples) - len(created)},
+                    status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@parser_classes(INGEST_PARSERS)
+def post_altitudes(request):
+    """POST endpoint for /altitudes/ that stores a batch of altitudes of the primary satellite.
+
+    The body is a list of samples in the format of the satellite api, {"altitude": ..., "last_updated": ...},
+    as JSON or, when msgpack is installed, as MessagePack. Samples with a date that is already stored are skipped.
+    """
+    return _ingest(request, PRIMARY_SATELLITE)
+
+
+@api_view(['POST'])
+@parser_classes(INGEST_PARSERS)
+def post_satellite_altitudes(request, satellite_id):
+    """POST endpoint for /altitudes/<id>/ that stores a batch of altitudes of one satellite like /altitudes/.
+    """
+    if (not Satellite.objects.filter(pk=satellite_id).exists()):
+        return _satellite_not_found()
+    return _ingest(request, satellite_id)
+
+
+@api_view(['GET'])
+def get_ingest_buffer(request):
+    """GET endpoint for /altitudes/buffer/ that returns the depth and flush metrics of the ingest buffer as a JsonResponse
+
+    The depth is the one of settings.INGEST_BUFFER, the flush counters add up the flushes of every process.
+    """
+    return JsonResponse(dict(buffer.metrics(), mode=settings.ALTITUDE_WRITE_MODE))
+
+
+@api_view(['GET'])
+def get_metrics(request):
+    """GET endpoint for /metrics that returns the metrics of every web and worker process in the Prometheus text format.
+    """
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _parse_date(value):
+    """Helper function that parses an ISO 8601 query parameter, dates without a timezone are taken as UTC."""
+    date = datetime.fromisoformat(value)
+    if (date.tzinfo is None):
+        return date.replace(tzinfo=timezone.utc)
+    return date.astimezone(timezone.utc)
+
+
+def _fitting_bucket(start, end, max_points):
+    """Helper function that returns the finest rollup tier with at most max_points buckets between start and end, or None."""
+    for tier in rollups.TIERS:
+        if ((tier.ceil(end) - tier.floor(start)) / tier.period <= max_points):
+            return tier
+    return None
+
+
+def _history_series(start, end):
+    """Helper function that returns the (date, altitude) series to downsample between start and end.
+
+    Raw altitudes are used when there are at most settings.HISTORY_MAX_SAMPLES of them and none were
+    compacted away, otherwise the averages of the finest rollup buckets that stay within that limit.
+    """
+    limit = settings.HISTORY_MAX_SAMPLES
+    samples = AltitudeModel.objects.filter(satellite_id=PRIMARY_SATELLITE, date__gte=start, date__lt=end)
+    count = samples[:limit + 1].count()
+    # the rollups still count altitudes that were deleted by the retention task
+    if (count <= limit and count == rollups.range_stats(start, end).count):
+        return list(samples.order_by('date').values_list('date', 'altitude'))
+
+    bucket = _fitting_bucket(start, end, limit)
+    if (bucket is None):
+        return None
+    return [(date, summary.average) for date, summary in rollups.series(start, end, bucket)]
+
+
+@transaction.atomic
+@api_view(['GET'])
+def get_history(request):
+    """GET endpoint for /altitudes/history/ that returns altitude statistics over a range as a JsonResponse.
+
+    Query parameters:
+        from, to: ISO 8601 dates, to defaults to now and from to one day before to
+        bucket: minute, hour or day, defaults to the finest bucket within settings.HISTORY_MAX_POINTS buckets
+        points: when given, the series is downsampled to at most this many points with LTTB instead of bucketed
+    """
+    try:
+        end = _parse_date(request.GET['to']) if 'to' in request.GET else clock.now()
+        start = _parse_date(request.GET['from']) if 'from' in request.GET else end - timedelta(days=1)
+        points = int(request.GET['points']) if 'points' in request.GET else None
+    except ValueError as error:
+        return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+    if (start >= end):
+        return Response({'detail': 'from must be before to'}, status=status.HTTP_400_BAD_REQUEST)
+
+    max_points = settings.HISTORY_MAX_POINTS
+    if (points is not None):
+        if (points < 3 or points > max_points):
+            return Response({'detail': f'points must be between 3 and {max_points}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        series = _history_series(start, end)
+        if (series is None):
+            return Response({'detail': 'range is too long'}, status=status.HTTP_400_BAD_REQUEST)
+        sampled = lttb([(date.timestamp(), altitude) for date, altitude in series], points)
+        return JsonResponse({
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'points': [{'date': datetime.fromtimestamp(x, timezone.utc).isoformat(), 'altitude': y} for x, y in sampled]
+        })
+
+    if ('bucket' in request.GET):
+        tiers = {tier.name: tier for tier in rollups.TIERS}
+        bucket = tiers.get(request.GET['bucket'])
+        if (bucket is None):
+            return Response({'detail': f'bucket must be one of {", ".join(tiers)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if ((bucket.ceil(end) - bucket.floor(start)) / bucket.period > max_points):
+            return Response({'detail': f'more than {max_points} buckets, use a coarser bucket'},
+                            status=status.HTTP_400_BAD_REQUEST)
+    else:
+        bucket = _fitting_bucket(start, end, max_points)
+        if (bucket is None):
+            return Response({'detail': 'range is too long'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return JsonResponse({
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'bucket': bucket.name,
+        'points': [dict(summary.as_stats(), date=date.isoformat(), count=summary.count)
+                   for date, summary in rollups.series(start, end, bucket)]
+    })
+
+
+@api_view(['GET'])
+@renderer_classes([export.CSVRenderer, export.NDJSONRenderer])
+def get_export(request):
+    """GET endpoint for /altitudes/export/ that streams every altitude as CSV or newline delimited JSON.
+
+    The format is negotiated from the Accept header, or ?format=csv / ?format=ndjson, and the
+    response is gzip compressed on the fly when the client accepts it. Rows are read in chunks
+    so memory use does not grow with the number of altitudes.
+
+    Query parameters:
+        from, to: optional ISO 8601 dates to export altitudes from (inclusive) and to (exclusive)
+    """
+    altitudes = AltitudeModel.objects.filter(satellite_id=PRIMARY_SATELLITE).order_by('date')
+    try:
+        if ('from' in request.GET):
+            altitudes = altitudes.filter(date__gte=_parse_date(request.GET['from']))
+        if ('to' in request.GET):
+            altitudes = altitudes.filter(date__lt=_parse_date(request.GET['to']))
+    except ValueError as error:
+        return JsonResponse({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+    renderer = request.accepted_renderer
+    rows = altitudes.values_list('date', 'altitude').iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    content = export.serialize(rows, renderer.format)
+
+    gzipped = 'gzip' in request.headers.get('Accept-Encoding', '')
+    if (gzipped):
+        content = export.gzip(content)
+
+    response = StreamingHttpResponse(content, content_type=f'{renderer.media_type}; charset={renderer.charset}')
+    response['Content-Disposition'] = f'attachment; filename="altitudes.{renderer.format}"'
+    response['Vary'] = 'Accept, Accept-Encoding'
+    if (gzipped):
+        response['Content-Encoding'] = 'gzip'
+    return response
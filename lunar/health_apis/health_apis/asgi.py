@@ -3,6 +3,8 @@ ASGI config for health_apis project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+It uses the ASGI settings profile, which serves /stats/ and /health/ with async views.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
@@ -11,6 +13,11 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'health_apis.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'health_apis.settings_asgi')
 
 application = get_asgi_application()
+
+# the server pushes its metrics to settings.METRICS, see apis/metrics.py
+from apis import metrics  # noqa: E402
+
+metrics.start()
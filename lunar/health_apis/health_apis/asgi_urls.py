@@ -0,0 +1,18 @@
+"""
+URL configuration of the ASGI deployment profile, see settings_asgi.py.
+
+/stats/ and /health/ are served by the async views in apis.async_views, as are
+/health/stream/ and /health/poll/, which hold their connections open and are only
+served under ASGI. Every other URL is the same as in urls.py.
+"""
+from django.urls import path
+from django.conf.urls import include
+from apis import async_views
+
+urlpatterns = [
+    path('stats/', async_views.get_stats),
+    path('health/', async_views.get_health),
+    path('health/stream/', async_views.health_stream),
+    path('health/poll/', async_views.health_poll),
+    path('', include('health_apis.urls')),
+]
@@ -3,6 +3,7 @@
 from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
+from celery.signals import worker_init
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'health_apis.settings')
@@ -18,14 +19,26 @@ app.autodiscover_tasks()
 
 app.conf.timezone = 'UTC'
 
-# Celery beat schedule for the two tasks
+
+@worker_init.connect
+def start_metrics(**kwargs):
+    # the worker pushes its metrics to settings.METRICS, and so do the pool processes it forks
+    from apis import metrics
+    metrics.start()
+
+
+# Celery beat schedule for the tasks
 app.conf.beat_schedule = {
-    'get-altitude': {
-        'task': 'apis.tasks.get_altitude',
+    'get-altitudes': {
+        'task': 'apis.tasks.get_altitudes',
         'schedule': 10.0,
     },
     'check-altitude': {
         'task': 'apis.tasks.check_altitude',
         'schedule': 60.0,
     },
+    'compact-altitudes': {
+        'task': 'apis.tasks.compact_altitudes',
+        'schedule': 3600.0,
+    },
 }
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 from datetime import timedelta
+import os
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apis.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,14 +76,48 @@ WSGI_APPLICATION = 'health_apis.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# DATABASE_PATH moves the database file, the load test migrates a temporary one
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('DATABASE_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+# The redis database of the cache, pub/sub, metrics and ingest buffer. The load test
+# (`manage.py loadtest`) points it and the celery broker at databases of its own.
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/1')
+
+# The celery tasks publish snapshots into the cache for the views to read,
+# so the cache has to be shared between the web and worker processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+}
+
+# Publish/subscribe between the celery worker and the web processes (apis/pubsub.py),
+# /health/stream/ and /health/poll/ are told about health changes through it.
+PUBSUB = {
+    'BACKEND': 'apis.pubsub.RedisPubSub',
+    'LOCATION': REDIS_URL,
+}
+
+# Where the metrics of /metrics are added up (apis/metrics.py). Every web and worker process records its
+# metrics in memory and pushes them to the store every PUSH_INTERVAL seconds, the redis store adds up
+# the metrics of all of them.
+METRICS = {
+    'BACKEND': 'apis.metrics.RedisMetrics',
+    'LOCATION': REDIS_URL,
+    'PUSH_INTERVAL': 1,
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -124,13 +160,127 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'\
 
 # Celery Configuration
-CELERY_BROKER_URL = 'redis://localhost:6379'
-CELERY_RESULT_BACKEND = 'redis://localhost:6379'
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379')
+CELERY_RESULT_BACKEND = CELERY_BROKER_URL
 
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+
+# The satellite api of the primary satellite (apis/client.py), the url of the other satellites is
+# stored on their Satellite row. Point it at `manage.py stub_satellite` to run without the real api.
+SATELLITE_URL = os.environ.get('SATELLITE_URL', 'http://nestio.space/api/satellite/data')
+# get_altitudes runs every 10 seconds, so a poll with its retries has to give up well before the next one:
+# 3 tries of at most 1 + 1 seconds and backoffs of 0 and at most 0.75 seconds give up after 6.75 seconds.
+# Timeouts are in seconds, and the circuit opens after FAILURE_THRESHOLD failed polls in a row
+# and lets a single poll through again after RESET_TIMEOUT seconds.
+SATELLITE_CLIENT = {
+    'CONNECT_TIMEOUT': 1,
+    'READ_TIMEOUT': 1,
+    'RETRIES': 2,
+    'BACKOFF': 0.25,
+    'BACKOFF_JITTER': 0.25,
+    'FAILURE_THRESHOLD': 5,
+    'RESET_TIMEOUT': 60,
+}
+
+# Threads get_altitudes fetches the fleet with, the fetches mostly wait on the network
+FLEET_INGEST_WORKERS = 32
+
+# How altitudes are fetched: 'beat' fetches every satellite with get_altitudes every 10 seconds from celery beat,
+# 'poller' leaves the primary satellite to the poll_altitude command, which fetches just after its api
+# is expected to update (apis/poller.py).
+ALTITUDE_INGEST_MODE = os.environ.get('ALTITUDE_INGEST_MODE', 'beat')
+# Intervals are in seconds. Updates are fetched at most MARGIN after they are published, HISTORY updates are used to learn
+# the cadence, and LEASE is how long the leader keeps the lead without renewing it.
+ALTITUDE_POLLER = {
+    'MIN_INTERVAL': 1,
+    'MAX_INTERVAL': 60,
+    'MARGIN': 0.5,
+    'HISTORY': 20,
+    'LEASE': 120,
+}
+
+# How fetched altitudes are written: 'direct' stores every sample get_altitude and get_altitudes fetch in its own
+# transaction, 'buffered' pushes them to the INGEST_BUFFER (apis/buffer.py), which stores them in batches of
+# FLUSH_SIZE every FLUSH_INTERVAL seconds, or as soon as FLUSH_SIZE samples wait. check_altitude flushes it first.
+# A buffer holding MAX_SIZE samples is flushed by the ingest task before it takes more. The RedisBuffer is shared
+# by every worker process, the MemoryBuffer only works with a single one.
+ALTITUDE_WRITE_MODE = os.environ.get('ALTITUDE_WRITE_MODE', 'direct')
+INGEST_BUFFER = {
+    'BACKEND': 'apis.buffer.RedisBuffer',
+    'LOCATION': REDIS_URL,
+    'MAX_SIZE': 10000,
+    'FLUSH_SIZE': 1000,
+    'FLUSH_INTERVAL': 0.5,
+}
+
+# Windows kept by the rolling altitude aggregator (apis/aggregator.py),
+# stats for these windows are read without querying AltitudeModel
+ROLLING_WINDOWS = [timedelta(minutes=1), timedelta(minutes=5)]
+
+# Where the window stats of /stats/, /stats/<id>/ and check_altitude are read from (apis/store.py).
+# AltitudeModel stays the record of every sample either way, the ColumnarStore keeps a copy of the
+# samples in memory mapped files that is much faster to read over long windows, it requires numpy
+# and has to be filled with `manage.py backfill_store` when it is enabled on an existing database.
+ALTITUDE_STORE = {
+    'BACKEND': 'apis.store.DatabaseStore',
+}
+# ALTITUDE_STORE = {
+#     'BACKEND': 'apis.store.ColumnarStore',
+#     'LOCATION': BASE_DIR / 'altitudes',
+# }
+
+# How long each tier of altitude data is kept (apis/retention.py), None keeps a rollup tier forever.
+# Raw altitudes of the primary satellite older than 'raw' are compacted into the hourly and daily rollups and
+# deleted. The other satellites have no rollups, their raw altitudes are deleted once older than 'fleet', which
+# is as far back as their windows reach. Coarser tiers have to be kept at least as long as the finer ones.
+ALTITUDE_RETENTION = {
+    'raw': timedelta(days=7),
+    'minute': timedelta(days=30),
+    'hour': timedelta(days=365),
+    'day': None,
+    'fleet': timedelta(days=30),
+}
+# rows deleted per transaction when clearing old data
+ALTITUDE_RETENTION_BATCH_SIZE = 1000
+
+# most windows /stats/?windows= returns at once
+STATS_MAX_WINDOWS = 10
+# relative error of the percentiles of /stats/?percentiles= (apis/sketch.py), the altitudes of the primary
+# satellite are sketched per hour with this accuracy, so changing it requires running backfill_rollups
+ALTITUDE_SKETCH_ACCURACY = 0.001
+
+# most points /altitudes/history/ returns, and most samples it reads to downsample with LTTB
+HISTORY_MAX_POINTS = 1000
+HISTORY_MAX_SAMPLES = 100000
+
+# most samples POST /altitudes/ accepts in one request
+INGEST_MAX_BATCH_SIZE = 10000
+
+# altitudes fetched from the database at a time by /altitudes/export/
+EXPORT_CHUNK_SIZE = 2000
+
+# transitions per page of /health/history/, by default and at most with ?limit=
+HEALTH_HISTORY_PAGE_SIZE = 100
+HEALTH_HISTORY_MAX_PAGE_SIZE = 1000
+
+# seconds between the keep-alive comments of /health/stream/,
+# and seconds /health/poll/ waits for a change before answering 304
+HEALTH_STREAM_HEARTBEAT = 15
+HEALTH_POLL_TIMEOUT = 30
+
+# /health/forecast/ (apis/health.py) fits the altitudes within LOOKBACK with a line and a parabola,
+# once there are MIN_SAMPLES of them, and raises an early warning when the fit of MODEL ('linear' or
+# 'quadratic') drops under the low altitude limit within HORIZON
+HEALTH_FORECAST = {
+    'LOOKBACK': timedelta(minutes=30),
+    'HORIZON': timedelta(hours=1),
+    'MIN_SAMPLES': 10,
+    'MODEL': 'linear',
+}
+
 # CELERYBEAT_SCHEDULE = {
 #     'every-second': {
 #         'task': 'apis.add',
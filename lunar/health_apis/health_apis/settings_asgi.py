@@ -0,0 +1,12 @@
+"""
+Django settings for serving health_apis with an ASGI server such as uvicorn.
+
+    uvicorn health_apis.asgi:application --workers 4
+
+The async views of /stats/ and /health/ run on the event loop instead of a worker thread.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+ROOT_URLCONF = 'health_apis.asgi_urls'
+
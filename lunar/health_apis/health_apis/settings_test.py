@@ -0,0 +1,23 @@
+"""
+Django settings for running the tests.
+
+    python manage.py test
+    pytest
+
+The tests run without a redis server, the cache, pub/sub and metrics are kept in memory.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+PUBSUB = {
+    'BACKEND': 'apis.pubsub.MemoryPubSub',
+}
+METRICS = {
+    'BACKEND': 'apis.metrics.MemoryMetrics',
+    'PUSH_INTERVAL': None,
+}
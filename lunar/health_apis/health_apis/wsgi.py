@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'health_apis.settings')
 
 application = get_wsgi_application()
+
+# the server pushes its metrics to settings.METRICS, see apis/metrics.py
+from apis import metrics  # noqa: E402
+
+metrics.start()
@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'health_apis.settings')
+    # the tests run without a redis server, see health_apis/settings_test.py
+    settings_module = 'health_apis.settings_test' if (sys.argv[1:2] == ['test']) else 'health_apis.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc: